@@ -0,0 +1,209 @@
+# cache.py
+import json
+import time
+import hashlib
+import threading
+from cachetools import TTLCache
+from opensearchpy.exceptions import NotFoundError
+
+# Key under the index mapping's "_meta" where upload_data.py records the ingest generation.
+GENERATION_META_KEY = "ingest_generation"
+
+def canonical(value):
+    """
+    Return value as compact JSON with sorted keys, so equal values always give the same string.
+    Cache keys, planned search groups and query filters are all compared through it.
+    """
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+
+def cache_key(index_name, body):
+    """
+    Return a canonical hash of an index name and query body.
+    Two bodies that differ only in key order produce the same key.
+    """
+    return hashlib.sha256(canonical({"index": index_name, "body": body}).encode("utf-8")).hexdigest()
+
+def get_ingest_generation(client, index_name):
+    """
+    Return the ingest generation recorded on the index (0 if none has been recorded yet).
+    When index_name resolves to several indices, the highest generation wins.
+    """
+    try:
+        mappings = client.indices.get_mapping(index=index_name)
+    except NotFoundError:
+        return 0
+    return max(
+        (m.get("mappings", {}).get("_meta", {}).get(GENERATION_META_KEY, 0) for m in mappings.values()),
+        default=0
+    )
+
+def bump_ingest_generation(client, index_name):
+    """
+    Increment the ingest generation on the index and return the new value.
+    Every dashboard process clears its search cache once it sees the new generation.
+    """
+    generation = get_ingest_generation(client, index_name) + 1
+    client.indices.put_mapping(index=index_name, body={"_meta": {GENERATION_META_KEY: generation}})
+    return generation
+
+# Key under a rollup index's "_meta" where the ingest generation of its source index is recorded.
+SOURCE_GENERATION_META_KEY = "source_generation"
+
+def get_source_generation(client, rollup_index_name):
+    """
+    Return the ingest generation of the index the rollup was built from, or None if the rollup
+    index does not exist or has not been completed.
+    """
+    try:
+        mappings = client.indices.get_mapping(index=rollup_index_name)
+    except NotFoundError:
+        return None
+    generations = [m.get("mappings", {}).get("_meta", {}).get(SOURCE_GENERATION_META_KEY) for m in mappings.values()]
+    return min(generations) if generations and None not in generations else None
+
+def set_source_generation(client, rollup_index_name, generation):
+    """
+    Record that the rollup is up to date with the given ingest generation of its source index.
+    """
+    client.indices.put_mapping(index=rollup_index_name, body={"_meta": {SOURCE_GENERATION_META_KEY: generation}})
+
+class SearchCache:
+    """
+    A thread-safe LRU/TTL cache of search responses, shared by every session of the dashboard.
+
+    Cached responses are handed out as-is, so callers must treat them as read-only.
+    """
+    def __init__(self, max_entries, ttl_seconds, generation_check_seconds):
+        self.max_entries = max_entries
+        self.generation_check_seconds = generation_check_seconds
+        self._entries = TTLCache(maxsize=max(max_entries, 1), ttl=ttl_seconds)
+        self._lock = threading.Lock()
+        self._generation = None
+        self._generation_checked_at = None
+        self.hits = 0
+        self.misses = 0
+
+    def sync_generation(self, client, index_names):
+        """
+        Clear the cache if the ingest generation of one of the indices has changed.
+        The generations are looked up at most once every generation_check_seconds.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if (self._generation_checked_at is not None and
+                    now - self._generation_checked_at < self.generation_check_seconds):
+                return
+            self._generation_checked_at = now
+        if isinstance(index_names, str):
+            index_names = [index_names]
+        generation = tuple(get_ingest_generation(client, index_name) for index_name in index_names)
+        with self._lock:
+            if generation != self._generation:
+                self._entries.clear()
+                self._generation = generation
+
+    def get(self, index_name, body):
+        """
+        Return the cached response for the search, or None on a miss.
+        """
+        if self.max_entries <= 0:
+            return None
+        key = cache_key(index_name, body)
+        with self._lock:
+            response = self._entries.get(key)
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def put(self, index_name, body, response):
+        """
+        Store a search response in the cache.
+        """
+        if self.max_entries <= 0:
+            return
+        key = cache_key(index_name, body)
+        with self._lock:
+            self._entries[key] = response
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class CachedSearchClient:
+    """
+    Wrap an OpenSearch client so that repeated searches are answered from a SearchCache, which
+    is cleared when new data is ingested into any of index_names.
+    Searches with extra parameters (e.g. scroll) and every other client API go straight through.
+    """
+    def __init__(self, client, cache, index_names):
+        self._client = client
+        self.cache = cache
+        self.cache.sync_generation(client, index_names)
+
+    def search(self, index=None, body=None, **params):
+        if params:
+            return self._client.search(index=index, body=body, **params)
+        response = self.cache.get(index, body)
+        if response is None:
+            # Aggregation-only searches can also be served from the shard request cache
+            if body and body.get("size") == 0:
+                response = self._client.search(index=index, body=body, request_cache="true")
+            else:
+                response = self._client.search(index=index, body=body)
+            self.cache.put(index, body, response)
+        return response
+
+    def msearch(self, body=None, index=None, **params):
+        """
+        Run a multi-search, sending only the searches that are not already cached.
+        body is the usual list of alternating header and search body entries.
+        """
+        if params:
+            return self._client.msearch(body=body, index=index, **params)
+        searches = [(header.get("index", index), search) for header, search in zip(body[::2], body[1::2])]
+        responses = [self.cache.get(search_index, search) for search_index, search in searches]
+        missing = [i for i, response in enumerate(responses) if response is None]
+        if missing:
+            lines = []
+            for i in missing:
+                lines.extend([body[2 * i], body[2 * i + 1]])
+            fetched = self._client.msearch(body=lines, index=index)["responses"]
+            for i, response in zip(missing, fetched):
+                responses[i] = response
+                if "error" not in response:
+                    self.cache.put(searches[i][0], searches[i][1], response)
+        return {"responses": responses}
+
+    def scan(self, index=None, body=None, scroll="1m", page_size=10000):
+        """
+        Return the _source of every hit of a search, paging through them with a scroll.
+        The combined hits are cached like a search response.
+        """
+        key = {"scan": body}
+        sources = self.cache.get(index, key)
+        if sources is None:
+            sources = []
+            filter_path = "_scroll_id,hits.hits._source"
+            response = self._client.search(
+                index=index, body=dict(body, size=page_size, sort=["_doc"]),
+                scroll=scroll, filter_path=filter_path
+            )
+            scroll_id = response.get("_scroll_id")
+            try:
+                while True:
+                    hits = response.get("hits", {}).get("hits", [])
+                    sources.extend(hit["_source"] for hit in hits)
+                    if len(hits) < page_size or scroll_id is None:
+                        break
+                    response = self._client.scroll(scroll_id=scroll_id, scroll=scroll, filter_path=filter_path)
+                    scroll_id = response.get("_scroll_id", scroll_id)
+            finally:
+                if scroll_id is not None:
+                    self._client.clear_scroll(scroll_id=scroll_id, ignore=(404,))
+            self.cache.put(index, key, sources)
+        return sources
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
@@ -0,0 +1,144 @@
+# catalog.py
+import os
+import json
+import time
+import hashlib
+import threading
+from opensearchpy.exceptions import NotFoundError
+
+# The index mapping used by search_configuration/upload_data.py when it creates the index
+MAPPING_FILE = os.path.join(os.path.dirname(__file__), "..", "search_configuration", "index_mapping.json")
+
+NUMERIC_TYPES = {
+    "long", "integer", "short", "byte", "double", "float",
+    "half_float", "scaled_float", "unsigned_long"
+}
+# Field types that support doc values, i.e. can be used in aggregations without fielddata
+AGGREGATABLE_TYPES = NUMERIC_TYPES | {
+    "keyword", "constant_keyword", "date", "date_nanos", "boolean", "ip", "geo_point"
+}
+
+def flatten_properties(properties, prefix=""):
+    """
+    Flatten a mapping's "properties" (including object fields and multi-fields such as
+    "<field>.keyword") into a dict of dotted field name -> field type.
+    """
+    fields = {}
+    for name, definition in properties.items():
+        full_name = f"{prefix}{name}"
+        if "properties" in definition:
+            fields.update(flatten_properties(definition["properties"], prefix=f"{full_name}."))
+            continue
+        fields[full_name] = definition.get("type", "object")
+        for sub_name, sub_definition in definition.get("fields", {}).items():
+            fields[f"{full_name}.{sub_name}"] = sub_definition.get("type", "object")
+    return fields
+
+class FieldCatalog:
+    """
+    The fields of an index with their type, whether they are numeric or aggregatable,
+    and the sensors (instruments) whose documents carry them.
+    """
+    def __init__(self, fields, fingerprint):
+        self.fields = fields
+        self.fingerprint = fingerprint
+
+    def names(self):
+        return set(self.fields)
+
+    def numeric_fields(self):
+        return {name for name, field in self.fields.items() if field["numeric"]}
+
+    def aggregatable_fields(self):
+        return {name for name, field in self.fields.items() if field["aggregatable"]}
+
+    def fields_for_sensor(self, sensor):
+        return {name for name, field in self.fields.items() if sensor in field["sensors"]}
+
+def _mapping_fingerprint(mappings):
+    payload = json.dumps(mappings, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _get_mappings(client, index_name):
+    try:
+        return client.indices.get_mapping(index=index_name)
+    except NotFoundError:
+        return {}
+
+def build_field_catalog(client, index_name, mappings=None, mapping_file=MAPPING_FILE):
+    """
+    Build a FieldCatalog from the live mapping of the index, completed with the fields declared
+    in index_mapping.json. The sensors carrying each field are found with a single search.
+    """
+    if mappings is None:
+        mappings = _get_mappings(client, index_name)
+
+    field_types = {}
+    if os.path.exists(mapping_file):
+        with open(mapping_file, "r") as file:
+            field_types.update(flatten_properties(json.load(file)["mappings"].get("properties", {})))
+    # The live mapping wins over the declared one
+    for mapping in mappings.values():
+        field_types.update(flatten_properties(mapping.get("mappings", {}).get("properties", {})))
+
+    sensors = {name: [] for name in field_types}
+    leaf_fields = [name for name, field_type in field_types.items() if field_type != "object"]
+    if mappings and leaf_fields:
+        query = {
+            "size": 0,
+            "aggs": {
+                "by_instrument": {
+                    "terms": {"field": "instrument", "size": 100},
+                    "aggs": {
+                        f"field_{i}": {"filter": {"exists": {"field": name}}}
+                        for i, name in enumerate(leaf_fields)
+                    }
+                }
+            }
+        }
+        response = client.search(index=index_name, body=query)
+        for bucket in response['aggregations']['by_instrument']['buckets']:
+            for i, name in enumerate(leaf_fields):
+                if bucket[f"field_{i}"]['doc_count'] > 0:
+                    sensors[name].append(bucket['key'])
+
+    fields = {
+        name: {
+            "type": field_type,
+            "numeric": field_type in NUMERIC_TYPES,
+            "aggregatable": field_type in AGGREGATABLE_TYPES,
+            "sensors": sensors[name]
+        }
+        for name, field_type in field_types.items()
+    }
+    return FieldCatalog(fields, _mapping_fingerprint(mappings))
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+
+def get_field_catalog(client, index_name, refresh_seconds):
+    """
+    Return the process-wide FieldCatalog of the index.
+
+    The mapping is looked up again at most every refresh_seconds, and the catalog is only
+    rebuilt when the mapping (including the ingest generation in its _meta) has changed.
+    """
+    now = time.monotonic()
+    with _catalogs_lock:
+        catalog, checked_at = _catalogs.get(index_name, (None, None))
+    if catalog is not None and now - checked_at < refresh_seconds:
+        return catalog
+
+    # Panels running concurrently wait for a single refresh instead of each doing their own
+    with _refresh_lock:
+        with _catalogs_lock:
+            catalog, checked_at = _catalogs.get(index_name, (None, None))
+        if catalog is not None and now - checked_at < refresh_seconds:
+            return catalog
+        mappings = _get_mappings(client, index_name)
+        if catalog is None or catalog.fingerprint != _mapping_fingerprint(mappings):
+            catalog = build_field_catalog(client, index_name, mappings=mappings)
+        with _catalogs_lock:
+            _catalogs[index_name] = (catalog, time.monotonic())
+    return catalog
@@ -1,19 +1,91 @@
 # client.py
-from opensearchpy import OpenSearch
+import threading
+from opensearchpy import OpenSearch, RoundRobinSelector
+from opensearchpy.exceptions import SerializationError
+from opensearchpy.serializer import JSONSerializer
 
-def create_opensearch_client(host, port, auth):
+# orjson is optional: it is only used when installed and enabled with fast_json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class OrjsonSerializer(JSONSerializer):
+    """
+    A drop-in replacement for the default JSON serializer, backed by orjson.
+    """
+    def loads(self, s):
+        try:
+            return orjson.loads(s)
+        except (orjson.JSONDecodeError, TypeError) as e:
+            raise SerializationError(s, e)
+
+    def dumps(self, data):
+        # don't serialize strings
+        if isinstance(data, str):
+            return data
+        try:
+            return orjson.dumps(data, default=self.default, option=orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
+        except (orjson.JSONEncodeError, TypeError) as e:
+            raise SerializationError(data, e)
+
+def parse_hosts(hosts, port, scheme="http"):
+    """
+    Turn a comma-separated string (or list) of "host" / "host:port" entries into the
+    host dictionaries expected by OpenSearch.
+    """
+    if isinstance(hosts, str):
+        hosts = hosts.split(",")
+    parsed = []
+    for host in hosts:
+        host = host.strip()
+        if not host:
+            continue
+        name, _, host_port = host.partition(":")
+        parsed.append({'host': name, 'port': int(host_port or port), 'scheme': scheme})
+    return parsed
+
+def create_opensearch_client(hosts, port, auth, use_ssl=False, sniff=False, pool_maxsize=10, fast_json=False):
     """
     Create and return an OpenSearch client.
+
+    - hosts: one or more nodes, as a comma-separated string or a list. Requests are spread
+      over them round-robin.
+    - sniff: discover the other nodes of the cluster at start-up and when a node fails.
+    - pool_maxsize: number of keep-alive connections kept open per node; size it to the
+      number of threads sharing the client.
+    - fast_json: serialize with orjson when it is installed.
     """
-    # Check if the index exists, if not create it
+    options = {}
+    if sniff:
+        options.update(sniff_on_start=True, sniff_on_connection_fail=True, sniffer_timeout=60)
+    if fast_json and orjson is not None:
+        options["serializer"] = OrjsonSerializer()
+
     client = OpenSearch(
-        hosts=[{'host': host, 'port': port, 'scheme': 'http'}],
+        hosts=parse_hosts(hosts, port, scheme='https' if use_ssl else 'http'),
         http_compress=True,  # enables gzip compression for request bodies
         http_auth=auth,
-        # use_ssl=True,
-        use_ssl=False,
+        use_ssl=use_ssl,
         verify_certs=False,
         ssl_assert_hostname=False,
-        ssl_show_warn=False
+        ssl_show_warn=False,
+        selector_class=RoundRobinSelector,
+        pool_maxsize=pool_maxsize,
+        **options
     )
     return client
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_opensearch_client(hosts, port, auth, **options):
+    """
+    Return the OpenSearch client for these connection settings, creating it on first use.
+    The client (and its connection pools) is shared by everything running in the process.
+    """
+    key = (str(hosts), port, tuple(auth) if auth else None, tuple(sorted(options.items())))
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = create_opensearch_client(hosts, port, auth, **options)
+        return _clients[key]
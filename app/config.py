@@ -6,8 +6,76 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # OpenSearch/Elastic configuration
+# The plant documents are stored in one index per year and season (PARTITION_PREFIX + "y2022-s14"),
+# created from the PARTITION_TEMPLATE_NAME index template and read through the INDEX_NAME alias
 INDEX_NAME = "phytooracle-index"
+PARTITION_PREFIX = "phytooracle-"
+PARTITION_TEMPLATE_NAME = "phytooracle-partitions"
 ELASTIC_HOST = os.getenv("ELASTIC_HOST")
+# Comma-separated list of nodes ("host" or "host:port"); defaults to ELASTIC_HOST
+ELASTIC_HOSTS = os.getenv("ELASTIC_HOSTS", ELASTIC_HOST or "localhost")
 ELASTIC_PORT = int(os.getenv("ELASTIC_PORT", "9200"))
 ELASTIC_USER = os.getenv("ELASTIC_USER")
 ELASTIC_PASSWORD = os.getenv("ELASTIC_PASSWORD")
+ELASTIC_USE_SSL = os.getenv("ELASTIC_USE_SSL", "false").lower() == "true"
+ELASTIC_SNIFF = os.getenv("ELASTIC_SNIFF", "false").lower() == "true"
+ELASTIC_POOL_MAXSIZE = int(os.getenv("ELASTIC_POOL_MAXSIZE", "10"))
+ELASTIC_FAST_JSON = os.getenv("ELASTIC_FAST_JSON", "false").lower() == "true"
+
+# Connection settings shared by the dashboard and the search_configuration scripts,
+# e.g. get_opensearch_client(**OPENSEARCH_CLIENT_OPTIONS)
+OPENSEARCH_CLIENT_OPTIONS = {
+    "hosts": ELASTIC_HOSTS,
+    "port": ELASTIC_PORT,
+    "auth": (ELASTIC_USER, ELASTIC_PASSWORD) if ELASTIC_USER else None,
+    "use_ssl": ELASTIC_USE_SSL,
+    "sniff": ELASTIC_SNIFF,
+    "pool_maxsize": ELASTIC_POOL_MAXSIZE,
+    "fast_json": ELASTIC_FAST_JSON,
+}
+
+# Search cache configuration (shared by every session of the dashboard)
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "512"))
+SEARCH_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", "3600"))
+# How often (at most) the dashboard checks the ingest generation written by upload_data.py
+GENERATION_CHECK_SECONDS = int(os.getenv("GENERATION_CHECK_SECONDS", "30"))
+# How often (at most) the dashboard re-reads the index mapping for its field catalog
+CATALOG_REFRESH_SECONDS = int(os.getenv("CATALOG_REFRESH_SECONDS", "60"))
+
+# How the dashboard panels are executed: "sequential" or "concurrent" (bounded thread pool)
+PANEL_EXECUTION = os.getenv("PANEL_EXECUTION", "concurrent")
+PANEL_WORKERS = int(os.getenv("PANEL_WORKERS", "4"))
+
+# Query and render instrumentation: measurements are appended as JSON lines to METRICS_LOG_FILE
+# (disabled when empty) and shown in a sidebar panel when DEBUG_METRICS is true
+METRICS_LOG_FILE = os.getenv("METRICS_LOG_FILE", "")
+DEBUG_METRICS = os.getenv("DEBUG_METRICS", "false").lower() == "true"
+
+# Field map: zoomed out, plants are averaged into tiles of about FIELD_MAP_TILE_PIXELS on screen;
+# they are drawn individually once the viewport holds at most FIELD_MAP_RAW_POINTS plants
+FIELD_MAP_TILE_PIXELS = int(os.getenv("FIELD_MAP_TILE_PIXELS", "16"))
+FIELD_MAP_RAW_POINTS = int(os.getenv("FIELD_MAP_RAW_POINTS", "5000"))
+
+# Number of unique files fetched per page when get_scan_count sums the file sizes
+SCAN_COUNT_PAGE_SIZE = int(os.getenv("SCAN_COUNT_PAGE_SIZE", "1000"))
+
+# Pre-aggregated rollup of the plant documents, maintained by search_configuration/upload_data.py:
+# one document per (scan hour, instrument, crop_type, season, year) with count, sum, min, max and
+# a quantile sketch of each of ROLLUP_FIELDS. The dashboard reads it instead of the plant
+# documents whenever the filters allow it (disable with USE_ROLLUP=false).
+ROLLUP_INDEX_NAME = "phytooracle-rollup"
+ROLLUP_FIELDS = ["roi_temp", "bounding_area_m2", "mean_tgi", "q1_tgi", "q3_tgi"]
+ROLLUP_DIMENSIONS = ["instrument", "crop_type", "season", "year"]
+ROLLUP_SKETCH_ACCURACY = 0.01
+USE_ROLLUP = os.getenv("USE_ROLLUP", "true").lower() == "true"
+
+# Bulk upload (search_configuration/upload_data.py): documents are sent by UPLOAD_WORKERS threads
+# in requests of at most UPLOAD_CHUNK_BYTES
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", str(os.cpu_count() or 4)))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(10 * 1024 * 1024)))
+
+# AZMET weather: one document per station-day in AZMET_INDEX_NAME, written by
+# search_configuration/upload_weather.py and joined onto the dashboard's date buckets.
+# Set DENORMALIZE_WEATHER=true to also copy the weather onto every plant document when uploading.
+AZMET_INDEX_NAME = "azmet"
+DENORMALIZE_WEATHER = os.getenv("DENORMALIZE_WEATHER", "false").lower() == "true"
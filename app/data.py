@@ -1,62 +1,98 @@
 # data.py
+import time
 import datetime
+import threading
 import pandas as pd
 import streamlit as st
+from opensearchpy.exceptions import NotFoundError
+from catalog import get_field_catalog
+from config import CATALOG_REFRESH_SECONDS, PARTITION_PREFIX
+from partitions import select_partitions
+from query import QuerySpec
+from instrumentation import instrument_panel
+
+# The partitions behind each alias, as last looked up by this process
+_partitions = {}
+_partitions_lock = threading.Lock()
 
 def get_all_columns(client, index_name):
     """
     Retrieve and return a union of all fields across sensor types.
     """
-    all_columns = set()
-    sensor_types = ['flirIrCamera', 'scanner3DTop', 'drone', 'stereoTop']
-
-    for sensor in sensor_types:
-        query = {
-            "query": {
-                "bool": {
-                    "must": [{"term": {"instrument": sensor}}]
-                }
-            },
-            "size": 1
-        }
-        data = client.search(index=index_name, body=query)
-        for hit in data['hits']['hits']:
-            all_columns.update(hit['_source'].keys())
-    return all_columns
+    return get_field_catalog(client, index_name, CATALOG_REFRESH_SECONDS).names()
 
-def get_data(client, crop_type, from_date, to_date, sensor_type, year, index_name):
+def get_numeric_columns(client, index_name):
     """
-    Build a query from the filter options, show an overview of the returned data,
-    and return the query (with filters) for further use.
+    Retrieve and return the numeric fields of the index, i.e. the fields that can be aggregated
+    with avg/stats/percentiles.
     """
-    query = {"query": {"bool": {"must": []}}}
+    catalog = get_field_catalog(client, index_name, CATALOG_REFRESH_SECONDS)
+    return catalog.numeric_fields() & catalog.aggregatable_fields()
 
-    if crop_type:
-        query["query"]["bool"]["must"].append({"terms": {"crop_type": crop_type}})
-    
+def build_query(crop_type, from_date, to_date, sensor_type, year):
+    """
+    Build a query from the filter options.
+    """
     date_range_query = {}
     if from_date:
         date_range_query["gte"] = from_date.strftime("%Y%m%dT%H%M%S.%f%z") + "-0700"
     if to_date:
         date_range_query["lte"] = to_date.strftime("%Y%m%dT%H%M%S.%f%z") + "-0700"
-    if from_date or to_date:
-        query["query"]["bool"]["must"].append({"range": {"scan_date": date_range_query}})
-    
-    if sensor_type:
-        query["query"]["bool"]["must"].append({"terms": {"instrument": sensor_type}})
-    
-    if year:
-        query["query"]["bool"]["must"].append({"terms": {"year": year}})
-
-    # Temporarily limit the number of results for an overview
-    query["size"] = 5
+
+    return (QuerySpec()
+            .terms("crop_type", crop_type)
+            .range("scan_date", **date_range_query)
+            .terms("instrument", sensor_type)
+            .terms("year", year))
+
+def get_partitions(client, index_name):
+    """
+    Return the indices behind the index_name alias (none if index_name is a single index).
+    The alias is looked up again at most every CATALOG_REFRESH_SECONDS.
+    """
+    now = time.monotonic()
+    with _partitions_lock:
+        checked = _partitions.get(index_name)
+        if checked is not None and now - checked[0] < CATALOG_REFRESH_SECONDS:
+            return checked[1]
+    try:
+        partitions = sorted(client.indices.get_alias(name=index_name))
+    except NotFoundError:
+        partitions = []
+    with _partitions_lock:
+        _partitions[index_name] = (now, partitions)
+    return partitions
+
+def search_index(client, index_name, query):
+    """
+    Return the indices to search for the query: with year or season filters, only the partitions
+    of index_name holding those years and seasons, otherwise index_name itself.
+    """
+    years, seasons = query.values("year"), query.values("season")
+    if not years and not seasons:
+        return index_name
+    partitions = select_partitions(PARTITION_PREFIX, get_partitions(client, index_name), years, seasons)
+    # Without a matching partition, the filters match no document of index_name anyway
+    return ",".join(partitions) if partitions else index_name
+
+def overview_body(query):
+    """
+    Return the search body for the data overview: the first few documents matching the query.
+    """
+    return query.body(size=5)
+
+@instrument_panel
+def get_data(client, crop_type, from_date, to_date, sensor_type, year, index_name):
+    """
+    Build a query from the filter options, show an overview of the returned data,
+    and return the query (with filters) for further use.
+    """
+    query = build_query(crop_type, from_date, to_date, sensor_type, year)
 
     st.write("Data Overview")
-    data = client.search(index=index_name, body=query)
+    data = client.search(index=index_name, body=overview_body(query))
     df = pd.DataFrame([hit['_source'] for hit in data['hits']['hits']])
-    st.dataframe(df)
-
-    # Remove the temporary size limit
-    del query["size"]
+    # The content hash is only used by upload_data.py to skip unchanged documents
+    st.dataframe(df.drop(columns=["content_hash"], errors="ignore"))
 
     return query
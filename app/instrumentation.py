@@ -0,0 +1,216 @@
+# instrumentation.py
+import sys
+import json
+import time
+import uuid
+import threading
+import functools
+from contextlib import contextmanager
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from config import METRICS_LOG_FILE
+
+_local = threading.local()
+_log_lock = threading.Lock()
+_records_lock = threading.Lock()
+
+def _current_panel():
+    return getattr(_local, "panel", None)
+
+def _render_metrics():
+    # Only available when running inside a Streamlit script run (including panel worker threads)
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return None
+    return st.session_state.get("_render_metrics")
+
+def record(kind, wall_ms, **fields):
+    """
+    Record one measurement, attributed to the current render and panel.
+    It is kept for the debug sidebar and appended to METRICS_LOG_FILE when it is set.
+    """
+    metrics = _render_metrics()
+    entry = {
+        "ts": time.time(),
+        "render_id": metrics["render_id"] if metrics else None,
+        "panel": _current_panel(),
+        "kind": kind,
+        "wall_ms": round(wall_ms, 3),
+        **fields
+    }
+    if metrics is not None:
+        with _records_lock:
+            metrics["records"].append(entry)
+    if METRICS_LOG_FILE:
+        line = json.dumps(entry, default=str)
+        with _log_lock:
+            with open(METRICS_LOG_FILE, "a") as file:
+                file.write(line + "\n")
+    return entry
+
+def start_render():
+    """
+    Start collecting the measurements of a new script run under a fresh render_id.
+    """
+    st.session_state["_render_metrics"] = {"render_id": uuid.uuid4().hex, "records": []}
+
+@contextmanager
+def measure(kind, **fields):
+    """
+    Time the enclosed block (e.g. building a DataFrame or a figure) within the current panel.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(kind, (time.perf_counter() - start) * 1000, **fields)
+
+def instrument_panel(func):
+    """
+    Decorate a panel function: its total time is recorded, and the searches, DataFrames and
+    figures measured while it runs are attributed to it. Put it below @st.fragment so
+    fragment reruns are measured too.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        previous = _current_panel()
+        _local.panel = func.__name__
+        try:
+            with measure("panel"):
+                return func(*args, **kwargs)
+        finally:
+            _local.panel = previous
+    return wrapper
+
+def count_buckets(aggregations):
+    """
+    Count the buckets returned in a (possibly nested) aggregations response.
+    """
+    count = 0
+    if isinstance(aggregations, dict):
+        for key, value in aggregations.items():
+            if key == "buckets":
+                buckets = value.values() if isinstance(value, dict) else value
+                count += len(buckets)
+                for bucket in buckets:
+                    count += count_buckets(bucket)
+            elif isinstance(value, dict):
+                count += count_buckets(value)
+    return count
+
+class _MeasuringDeserializer:
+    """
+    Wrap the transport's deserializer to note the size and decoding time of each response
+    body; the measurement is read back by the thread that sent the request.
+    """
+    def __init__(self, deserializer):
+        self._deserializer = deserializer
+
+    def loads(self, s, mimetype=None):
+        start = time.perf_counter()
+        try:
+            return self._deserializer.loads(s, mimetype)
+        finally:
+            _local.response = (len(s), (time.perf_counter() - start) * 1000)
+
+    def __getattr__(self, name):
+        return getattr(self._deserializer, name)
+
+def _response_fields(response):
+    fields = {"took_ms": response.get("took"), "buckets": count_buckets(response.get("aggregations"))}
+    hits = response.get("hits", {}).get("hits")
+    if hits is not None:
+        fields["hits"] = len(hits)
+    return fields
+
+class InstrumentedClient:
+    """
+    Wrap an OpenSearch client so that every search and multi-search that reaches the cluster
+    is recorded: server time (took), wall time, response bytes, decoding time and bucket counts.
+    Wrap the client innermost (below the cache) so only real round trips are recorded.
+    """
+    def __init__(self, client):
+        self._client = client
+        transport = getattr(client, "transport", None)
+        if transport is not None and not isinstance(transport.deserializer, _MeasuringDeserializer):
+            transport.deserializer = _MeasuringDeserializer(transport.deserializer)
+
+    def _call(self, kind, method, **kwargs):
+        index = kwargs.get("index")
+        _local.response = (None, None)
+        start = time.perf_counter()
+        try:
+            response = method(**kwargs)
+        except Exception as e:
+            record(kind, (time.perf_counter() - start) * 1000, index=index, error=type(e).__name__)
+            raise
+        wall_ms = (time.perf_counter() - start) * 1000
+        response_bytes, decode_ms = _local.response
+        if kind == "msearch":
+            responses = response.get("responses", [])
+            fields = {
+                "searches": len(responses),
+                "took_ms": max((r.get("took", 0) for r in responses), default=None),
+                "buckets": sum(count_buckets(r.get("aggregations")) for r in responses),
+                "errors": sum(1 for r in responses if "error" in r)
+            }
+        else:
+            fields = _response_fields(response)
+        record(kind, wall_ms, index=index, bytes=response_bytes, decode_ms=decode_ms, **fields)
+        return response
+
+    def search(self, index=None, body=None, **params):
+        return self._call("search", self._client.search, index=index, body=body, **params)
+
+    def msearch(self, body=None, index=None, **params):
+        return self._call("msearch", self._client.msearch, index=index, body=body, **params)
+
+    def scroll(self, body=None, **params):
+        return self._call("scroll", self._client.scroll, body=body, **params)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+def render_metrics_sidebar():
+    """
+    Show the measurements of the current render in the sidebar.
+    """
+    metrics = _render_metrics()
+    if not metrics:
+        return
+    with _records_lock:
+        df = pd.DataFrame(metrics["records"])
+    with st.sidebar.expander("Query metrics", expanded=False):
+        st.caption(f"Render {metrics['render_id']}")
+        if df.empty:
+            st.write("No measurements yet.")
+            return
+        searches = df[df["kind"].isin(["search", "msearch", "scroll"])]
+        st.write(f"Round trips: {len(searches)}")
+        st.dataframe(df.drop(columns=["ts", "render_id"]), hide_index=True)
+
+def summarize(path):
+    """
+    Return p50/p95 wall time (and server time) per panel and kind from a metrics JSONL file.
+    """
+    df = pd.read_json(path, lines=True)
+    df["panel"] = df["panel"].fillna("(main)")
+    if "took_ms" not in df:
+        df["took_ms"] = None
+    df["took_ms"] = pd.to_numeric(df["took_ms"])
+    grouped = df.groupby(["panel", "kind"])
+    summary = grouped["wall_ms"].quantile([0.5, 0.95]).unstack()
+    summary.columns = ["wall_p50_ms", "wall_p95_ms"]
+    took = grouped["took_ms"].quantile([0.5, 0.95]).unstack()
+    summary["took_p50_ms"] = took[0.5]
+    summary["took_p95_ms"] = took[0.95]
+    summary["count"] = grouped.size()
+    return summary
+
+if __name__ == "__main__":
+    # Usage: python instrumentation.py [metrics.jsonl]
+    path = sys.argv[1] if len(sys.argv) > 1 else METRICS_LOG_FILE
+    if not path:
+        sys.exit("Usage: python instrumentation.py <metrics.jsonl> (or set METRICS_LOG_FILE)")
+    pd.set_option("display.width", 200)
+    print(summarize(path).round(1).to_string())
@@ -1,53 +1,96 @@
 # app.py
 import streamlit as st
-from client import create_opensearch_client
-from config import ELASTIC_HOST, ELASTIC_PORT, ELASTIC_USER, ELASTIC_PASSWORD, INDEX_NAME
+from client import get_opensearch_client
+from cache import SearchCache, CachedSearchClient
+from planner import SearchPlan
+from runner import run_panels
+from instrumentation import InstrumentedClient, start_render, render_metrics_sidebar
+from config import (
+    OPENSEARCH_CLIENT_OPTIONS, INDEX_NAME,
+    SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_TTL_SECONDS, GENERATION_CHECK_SECONDS,
+    PANEL_EXECUTION, PANEL_WORKERS, DEBUG_METRICS, ROLLUP_INDEX_NAME, AZMET_INDEX_NAME
+)
 from filters import render_filters
-from data import get_data, get_all_columns
+from rollup import rollup_query, rollup_scan_date_body
+from data import build_query, search_index, overview_body, get_data, get_numeric_columns
 from visualizations import (
+    scan_count_body,
+    scan_date_body,
+    field_bounds_body,
     get_scan_count,
     get_vis,
     get_comparison_vis,
     # get_vis_over_time,  # Uncomment if you want to include this visualization.
     visualize_parameters,
-    compare_axis
+    compare_axis,
+    field_map
 )
 
+@st.cache_resource
+def get_search_cache():
+    """
+    Return the search cache shared by every session served by this process.
+    """
+    return SearchCache(SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_TTL_SECONDS, GENERATION_CHECK_SECONDS)
+
 def app():
     # Use session state to control one-time initializations
     if 'first_time' not in st.session_state:
         st.session_state.first_time = True
 
+    start_render()
+
     # st.set_page_config(page_title="PhytoOracle Analytics", layout="wide")
     st.title("PhytoOracle Analytics")
     
     # Render the sidebar filters and retrieve filter values
     crop_type, from_date, to_date, sensor_type, year = render_filters()
 
-    # Connect to OpenSearch
-    auth = (ELASTIC_USER, ELASTIC_PASSWORD)
-    client = create_opensearch_client(ELASTIC_HOST, ELASTIC_PORT, auth)
+    # Connect to OpenSearch (the client is created once per process and reused by every rerun)
+    client = get_opensearch_client(**OPENSEARCH_CLIENT_OPTIONS)
+    # Record every search that reaches the cluster
+    client = InstrumentedClient(client)
     
     try:
+        # Serve repeated searches from the shared cache; it is cleared when new data (or weather)
+        # is ingested
+        client = CachedSearchClient(client, get_search_cache(), [INDEX_NAME, AZMET_INDEX_NAME])
         if st.session_state.first_time:
+            # Send the searches of the overview and the filter-only panels in one round trip
+            query = build_query(crop_type, from_date, to_date, sensor_type, year)
+            # Only the season partitions matching the year filter are searched
+            index_name = search_index(client, INDEX_NAME, query)
+            client = SearchPlan(client)
+            client.add(index_name, overview_body(query))
+            client.add(index_name, scan_count_body(query))
+            rollup_spec = rollup_query(client, index_name, query)
+            if rollup_spec is not None:
+                client.add(ROLLUP_INDEX_NAME, rollup_scan_date_body(rollup_spec))
+            else:
+                client.add(index_name, scan_date_body(query))
+            client.add(index_name, field_bounds_body(query))
+            client.execute()
             # Build the query and show a data overview
-            query = get_data(client, crop_type, from_date, to_date, sensor_type, year, INDEX_NAME)
-            # Call various visualizations
+            query = get_data(client, crop_type, from_date, to_date, sensor_type, year, index_name)
+            # Call various visualizations, each one rendering into its own placeholder.
+            # The query is immutable, so the panels can safely share it.
             col1, col2 = st.columns(2, gap="medium")
             col3, col4 = st.columns(2, gap="medium")
-            with col1:
-                get_scan_count(client, INDEX_NAME, query)
-            with col2:
-                get_vis(client, INDEX_NAME, query)
-            with col3:
-                get_comparison_vis(client, INDEX_NAME, query)
-            with col4:
-                visualize_parameters(client, INDEX_NAME, query, get_all_columns)
-            compare_axis(client, INDEX_NAME, query, get_all_columns)
+            run_panels([
+                (col1, get_scan_count, (client, index_name, query)),
+                (col2, get_vis, (client, index_name, query)),
+                (col3, get_comparison_vis, (client, index_name, query)),
+                (col4, visualize_parameters, (client, index_name, query, get_numeric_columns)),
+                (st.container(), compare_axis, (client, index_name, query, get_numeric_columns)),
+                (st.container(), field_map, (client, index_name, query, get_numeric_columns)),
+            ], mode=PANEL_EXECUTION, max_workers=PANEL_WORKERS)
     except Exception as e:
         st.warning("Either the data is not available or there was an error processing the data.")
         st.write(e)
 
+    if DEBUG_METRICS:
+        render_metrics_sidebar()
+
 if __name__ == "__main__":
     st.set_page_config(page_title="PhytoOracle Analytics", layout="wide")
     app()
@@ -0,0 +1,193 @@
+# maps.py
+import json
+import math
+import numpy as np
+import pandas as pd
+import pydeck as pdk
+from pydeck.bindings.json_tools import default_serialize
+
+# Color ramp (low to high) used to color polygons by a trait, and the color of missing values
+COLOR_STOPS = np.array([
+    [68, 1, 84], [59, 82, 139], [33, 145, 140], [94, 201, 98], [253, 231, 37]
+])
+MISSING_COLOR = [160, 160, 160]
+
+# Nominal size of a map on the page, used to turn a center and zoom into a viewport
+MAP_WIDTH_PIXELS = 800
+MAP_HEIGHT_PIXELS = 500
+
+def trait_colors(values, alpha=200):
+    """
+    Map trait values to RGBA colors along COLOR_STOPS, scaled between the 2nd and 98th
+    percentiles so a few outliers do not flatten the ramp. Missing values are grey.
+    """
+    values = np.asarray(values, dtype=float)
+    colors = np.tile(np.array(MISSING_COLOR + [alpha], dtype=np.uint8), (len(values), 1))
+    valid = ~np.isnan(values)
+    if valid.any():
+        low, high = np.percentile(values[valid], [2, 98])
+        scaled = np.clip((values[valid] - low) / ((high - low) or 1), 0, 1)
+        positions = np.linspace(0, 1, len(COLOR_STOPS))
+        for channel in range(3):
+            colors[valid, channel] = np.interp(scaled, positions, COLOR_STOPS[:, channel])
+    return colors
+
+def view_for_bounds(min_lon, min_lat, max_lon, max_lat):
+    """
+    Return a view centered on the bounds, zoomed so they fit the map.
+    """
+    extent = max(max_lon - min_lon, max_lat - min_lat, 1e-6)
+    zoom = min(max(math.log2(360 / extent) - 1, 1), 22)
+    return pdk.ViewState(longitude=(min_lon + max_lon) / 2, latitude=(min_lat + max_lat) / 2, zoom=zoom)
+
+def viewport_bounds(lon, lat, zoom, width=MAP_WIDTH_PIXELS, height=MAP_HEIGHT_PIXELS):
+    """
+    Return the (west, south, east, north) bounds shown by a web-mercator map of
+    width x height pixels centered on lon/lat at the given zoom.
+    """
+    degrees_per_pixel = 360 / (256 * 2 ** zoom)
+    half_width = width / 2 * degrees_per_pixel
+    half_height = height / 2 * degrees_per_pixel * math.cos(math.radians(lat))
+    return lon - half_width, max(lat - half_height, -85), lon + half_width, min(lat + half_height, 85)
+
+def tile_precision(zoom, tile_pixels):
+    """
+    Return the geotile_grid precision whose tiles are about tile_pixels wide at the given zoom
+    (a tile of precision p is 256 pixels wide at zoom p).
+    """
+    return int(min(max(round(zoom + math.log2(256 / tile_pixels)), 0), 29))
+
+def max_tiles(tile_pixels, width=MAP_WIDTH_PIXELS, height=MAP_HEIGHT_PIXELS):
+    """
+    Return the number of tiles of about tile_pixels that can be (partly) visible on the map.
+    """
+    return (width // tile_pixels + 2) * (height // tile_pixels + 2)
+
+def tile_bounds(keys):
+    """
+    Return the west, north, east and south edges of geotile_grid keys ("zoom/x/y") as arrays.
+    """
+    zxy = np.array([key.split("/") for key in keys], dtype=float).reshape(-1, 3)
+    tiles = 2 ** zxy[:, 0]
+    west = zxy[:, 1] / tiles * 360 - 180
+    east = (zxy[:, 1] + 1) / tiles * 360 - 180
+    north = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * zxy[:, 2] / tiles))))
+    south = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (zxy[:, 2] + 1) / tiles))))
+    return west, north, east, south
+
+class CompactDeck(pdk.Deck):
+    """
+    A Deck serialized without indentation or key sorting, which keeps the JSON sent to the
+    browser for tens of thousands of features small and fast to produce.
+    """
+    def to_json(self):
+        return json.dumps(self, default=default_serialize, separators=(",", ":"))
+
+def _rounded(values, decimals):
+    # NaN is not valid JSON: missing values are sent as null
+    values = np.round(np.asarray(values, dtype=float), decimals).astype(object)
+    values[pd.isna(values)] = None
+    return values.tolist()
+
+def _labels(df, column):
+    # Missing labels are sent as null rather than NaN
+    if column not in df:
+        return [None] * len(df)
+    return df[column].astype(object).where(df[column].notna(), None).tolist()
+
+def _records(columns, values=None):
+    """
+    Turn column lists into the records of a layer, adding the color (and value) of each
+    record from the trait values when given.
+    """
+    n = len(next(iter(columns.values())))
+    if values is not None:
+        columns["color"] = trait_colors(values).tolist()
+        columns["value"] = _rounded(values, 3)
+    else:
+        columns["color"] = [COLOR_STOPS[2].tolist() + [160]] * n
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*columns.values())]
+
+def _edge_layer(layer_id, data, stroked=True):
+    # Each rectangle is sent as its 4 edges (w, n, e, s) and its polygon is computed in the
+    # browser, which halves the coordinates to serialize compared to sending the 4 corners.
+    return pdk.Layer(
+        "PolygonLayer",
+        data,
+        id=layer_id,
+        get_polygon="[[w, n], [e, n], [e, s], [w, s]]",
+        get_fill_color="color",
+        get_line_color=[40, 40, 40, 120],
+        line_width_min_pixels=0.5,
+        stroked=stroked,
+        filled=True,
+        pickable=True
+    )
+
+def _trait_values(df, color_column):
+    if color_column in df:
+        return pd.to_numeric(df[color_column], errors="coerce").to_numpy(dtype=float)
+    return np.full(len(df), np.nan)
+
+def box_map(df, color_column=None):
+    """
+    Build a pydeck map drawing every plot box of df (columns nw_lon, nw_lat, se_lon, se_lat),
+    colored by color_column when given. The polygons are drawn on the GPU by a PolygonLayer.
+    """
+    columns = {
+        # 7 decimals of a degree is about 1 cm
+        "w": _rounded(df['nw_lon'], 7),
+        "n": _rounded(df['nw_lat'], 7),
+        "e": _rounded(df['se_lon'], 7),
+        "s": _rounded(df['se_lat'], 7),
+        "plot": _labels(df, 'plot')
+    }
+    tooltip = {"text": "Plot {plot}"}
+    values = None
+    if color_column:
+        values = _trait_values(df, color_column)
+        tooltip = {"text": f"Plot {{plot}}\n{color_column}: {{value}}"}
+    view = view_for_bounds(
+        float(np.nanmin(df['nw_lon'])), float(np.nanmin(df['se_lat'])),
+        float(np.nanmax(df['se_lon'])), float(np.nanmax(df['nw_lat']))
+    )
+    layer = _edge_layer("plot_boxes", _records(columns, values))
+    return CompactDeck(layers=[layer], initial_view_state=view, map_style="light", tooltip=tooltip)
+
+def tile_map(tiles, value_column, view):
+    """
+    Build a pydeck map of geotile_grid buckets (columns key, doc_count and value_column),
+    each tile colored by its aggregated value.
+    """
+    west, north, east, south = tile_bounds(tiles['key'])
+    columns = {
+        "w": _rounded(west, 7), "n": _rounded(north, 7),
+        "e": _rounded(east, 7), "s": _rounded(south, 7),
+        "count": tiles['doc_count'].tolist()
+    }
+    layer = _edge_layer("field_tiles", _records(columns, _trait_values(tiles, value_column)), stroked=False)
+    tooltip = {"text": f"{{count}} plants\navg {value_column}: {{value}}"}
+    return CompactDeck(layers=[layer], initial_view_state=view, map_style="light", tooltip=tooltip)
+
+def point_map(points, value_column, view):
+    """
+    Build a pydeck map of individual plants (columns lon, lat, plot and value_column).
+    """
+    columns = {
+        "lon": _rounded(points['lon'], 7),
+        "lat": _rounded(points['lat'], 7),
+        "plot": _labels(points, 'plot')
+    }
+    layer = pdk.Layer(
+        "ScatterplotLayer",
+        _records(columns, _trait_values(points, value_column)),
+        id="field_points",
+        get_position="[lon, lat]",
+        get_fill_color="color",
+        get_radius=0.5,
+        radius_min_pixels=2,
+        pickable=True
+    )
+    tooltip = {"text": f"Plot {{plot}}\n{value_column}: {{value}}"}
+    return CompactDeck(layers=[layer], initial_view_state=view, map_style="light", tooltip=tooltip)
@@ -0,0 +1,68 @@
+# partitions.py
+import re
+
+# The part of a partition name after the prefix, e.g. "y2022-s14", or "y2022-s14-v20250101120000"
+# for a partition of a version built next to the live one
+_partition = re.compile(r"y(?P<year>[a-z0-9]+)-s(?P<season>[a-z0-9]+)(?:-v(?P<version>[0-9]+))?")
+_version = re.compile(r"-v(?P<version>[0-9]+)$")
+
+def _part(value):
+    # Documents without a year or season go to the "na" partitions
+    if value is None or value == "":
+        return "na"
+    try:
+        return str(int(value))
+    except (TypeError, ValueError):
+        return re.sub(r"[^a-z0-9]", "", str(value).lower()) or "na"
+
+def partition_name(prefix, year, season):
+    """
+    Return the name of the index holding the documents of a year and season,
+    e.g. phytooracle-y2022-s14.
+    """
+    return f"{prefix}y{_part(year)}-s{_part(season)}"
+
+def versioned_name(name, version):
+    """
+    Return the name of the index of a version (e.g. phytooracle-y2022-s14-v20250101120000),
+    or name itself for the unversioned indices (version None or "").
+    """
+    return f"{name}-v{version}" if version else name
+
+def index_version(name):
+    """
+    Return the version of an index name, or "" for an unversioned index.
+    """
+    match = _version.search(name)
+    return match["version"] if match else ""
+
+def partition_pattern(prefix):
+    """
+    Return the index pattern matching every partition name.
+    """
+    return f"{prefix}y*"
+
+def parse_partition(prefix, name):
+    """
+    Return the (year, season) of a partition name as strings, or None if name is not a partition.
+    """
+    if not name.startswith(prefix):
+        return None
+    match = _partition.fullmatch(name[len(prefix):])
+    return (match["year"], match["season"]) if match else None
+
+def select_partitions(prefix, partitions, years=None, seasons=None):
+    """
+    Return the partitions holding documents of the given years and seasons (any year or season
+    when not given), sorted by name.
+    """
+    years = {_part(year) for year in years} if years else None
+    seasons = {_part(season) for season in seasons} if seasons else None
+    selected = []
+    for name in partitions:
+        parsed = parse_partition(prefix, name)
+        if parsed is None:
+            continue
+        if (years is None or parsed[0] in years) and (seasons is None or parsed[1] in seasons):
+            selected.append(name)
+    return sorted(selected)
@@ -0,0 +1,93 @@
+# planner.py
+import copy
+from cache import canonical
+
+class SearchPlan:
+    """
+    Collect the searches one render is going to issue and send them in a single _msearch.
+
+    Planned bodies that only differ in their "aggs" and "size" are merged into one search:
+    identical aggregations are sent once, aggregations that share a name but not a definition
+    are renamed, and the largest size wins. Panels keep calling search() as they would on the
+    client; planned bodies are answered from their slice of the merged response and anything
+    else goes straight to the wrapped client.
+    """
+    def __init__(self, client):
+        self._client = client
+        # canonical (index, body) -> (group, {requested agg name: merged agg name}, size)
+        self._planned = {}
+        # canonical (index, body without aggs/size) -> merged search
+        self._groups = {}
+
+    def add(self, index, body):
+        """
+        Register a search that a panel will issue during this render.
+        """
+        key = canonical([index, body])
+        if key in self._planned:
+            return
+        base = {k: v for k, v in body.items() if k not in ("aggs", "size")}
+        group = self._groups.setdefault(canonical([index, base]), {
+            "index": index,
+            "body": copy.deepcopy(base),
+            "aggs": {},
+            "size": 0,
+            "response": None
+        })
+
+        renames = {}
+        for name, definition in body.get("aggs", {}).items():
+            merged_name, suffix = name, 1
+            while (merged_name in group["aggs"] and
+                   canonical(group["aggs"][merged_name]) != canonical(definition)):
+                merged_name = f"{name}_{suffix}"
+                suffix += 1
+            group["aggs"][merged_name] = copy.deepcopy(definition)
+            renames[name] = merged_name
+
+        # OpenSearch returns 10 hits when no size is given
+        size = body.get("size", 10)
+        group["size"] = max(group["size"], size)
+        self._planned[key] = (group, renames, size)
+
+    def execute(self):
+        """
+        Send every planned search that has not been answered yet in one _msearch round trip.
+        Searches that fail are left unanswered and will be retried individually by search().
+        """
+        pending = [group for group in self._groups.values() if group["response"] is None]
+        if not pending:
+            return
+        lines = []
+        for group in pending:
+            body = dict(group["body"], size=group["size"])
+            if group["aggs"]:
+                body["aggs"] = group["aggs"]
+            header = {"index": group["index"]}
+            # Aggregation-only searches can also be served from the shard request cache
+            if body["size"] == 0:
+                header["request_cache"] = True
+            lines.extend([header, body])
+
+        responses = self._client.msearch(body=lines)["responses"]
+        for group, response in zip(pending, responses):
+            if "error" not in response:
+                group["response"] = response
+
+    def search(self, index=None, body=None, **params):
+        planned = None if params else self._planned.get(canonical([index, body]))
+        if planned is None or planned[0]["response"] is None:
+            return self._client.search(index=index, body=body, **params)
+
+        group, renames, size = planned
+        response = group["response"]
+        sliced = {k: v for k, v in response.items() if k not in ("hits", "aggregations")}
+        sliced["hits"] = dict(response["hits"], hits=response["hits"]["hits"][:size])
+        if renames:
+            sliced["aggregations"] = {
+                name: response["aggregations"][merged_name] for name, merged_name in renames.items()
+            }
+        return sliced
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
@@ -0,0 +1,89 @@
+# query.py
+import json
+from dataclasses import dataclass
+from cache import canonical
+
+@dataclass(frozen=True)
+class QuerySpec:
+    """
+    An immutable set of filter clauses.
+
+    Every method returns a new QuerySpec, so panels can derive their own queries from the
+    shared one without affecting each other. The clauses compile to a bool.filter query
+    (no scoring, so OpenSearch can use its filter cache) in a stable order, so the same
+    filters always produce byte-identical bodies.
+    """
+    filters: tuple = ()
+
+    def where(self, clause):
+        """
+        Return a copy with an additional filter clause (e.g. {"term": {...}}).
+        """
+        return QuerySpec(tuple(sorted(set(self.filters) | {canonical(clause)})))
+
+    def terms(self, field, values):
+        """
+        Return a copy that also requires field to match one of values (no-op if values is empty).
+        """
+        if not values:
+            return self
+        return self.where({"terms": {field: list(values)}})
+
+    def term(self, field, value):
+        return self.where({"term": {field: value}})
+
+    def range(self, field, **bounds):
+        """
+        Return a copy that also requires field to fall within bounds (gte/gt/lte/lt).
+        """
+        bounds = {op: value for op, value in bounds.items() if value is not None}
+        if not bounds:
+            return self
+        return self.where({"range": {field: bounds}})
+
+    def exists(self, *fields):
+        spec = self
+        for field in fields:
+            spec = spec.where({"exists": {"field": field}})
+        return spec
+
+    def without_terms(self, field):
+        """
+        Return a copy without the terms clauses on field.
+        """
+        return QuerySpec(tuple(
+            clause for clause in self.filters
+            if field not in json.loads(clause).get("terms", {})
+        ))
+
+    def replace_terms(self, field, values):
+        """
+        Return a copy where the terms clause on field (if any) is replaced by values.
+        """
+        return self.without_terms(field).terms(field, values)
+
+    def values(self, field):
+        """
+        Return the values of the terms clause on field, or None if there is no such clause.
+        """
+        for clause in self.clauses():
+            if field in clause.get("terms", {}):
+                return clause["terms"][field]
+        return None
+
+    def clauses(self):
+        return [json.loads(clause) for clause in self.filters]
+
+    def to_query(self):
+        return {"bool": {"filter": self.clauses()}}
+
+    def body(self, aggs=None, size=0, **extra):
+        """
+        Compile the filters into a new search body.
+        size defaults to 0, i.e. an aggregation-only search.
+        """
+        body = {"query": self.to_query(), "size": size}
+        if aggs:
+            body["aggs"] = aggs
+        body.update(extra)
+        return body
@@ -0,0 +1,172 @@
+# rollup.py
+import time
+import threading
+from datetime import datetime, timezone
+import pandas as pd
+from cache import get_ingest_generation, get_source_generation
+from query import QuerySpec
+from sketch import QuantileSketch
+from config import ROLLUP_INDEX_NAME, ROLLUP_FIELDS, ROLLUP_DIMENSIONS, USE_ROLLUP, GENERATION_CHECK_SECONDS
+
+# Whether the rollup is up to date with the plant index, as last checked by this process
+_availability = {}
+_availability_lock = threading.Lock()
+
+def rollup_available(client, index_name):
+    """
+    Return True if the rollup was built from the current ingest generation of index_name.
+    The generations are looked up at most once every GENERATION_CHECK_SECONDS.
+    """
+    if not USE_ROLLUP:
+        return False
+    now = time.monotonic()
+    with _availability_lock:
+        checked = _availability.get(index_name)
+        if checked is not None and now - checked[0] < GENERATION_CHECK_SECONDS:
+            return checked[1]
+    source_generation = get_source_generation(client, ROLLUP_INDEX_NAME)
+    available = source_generation is not None and source_generation == get_ingest_generation(client, index_name)
+    with _availability_lock:
+        _availability[index_name] = (now, available)
+    return available
+
+def _scan_hour(value):
+    # The rollup is bucketed by UTC hour: only bounds falling on an hour can be translated
+    try:
+        date = datetime.strptime(value, "%Y%m%dT%H%M%S.%f%z")
+    except (TypeError, ValueError):
+        return None
+    date = date.astimezone(timezone.utc)
+    if (date.minute, date.second, date.microsecond) != (0, 0, 0):
+        return None
+    return date.strftime("%Y-%m-%dT%H:00:00Z")
+
+def to_rollup_spec(spec):
+    """
+    Translate a plant query into the equivalent query on the rollup, or return None if one of
+    its clauses cannot be answered from the rollup (e.g. a filter on a field that is not a
+    rollup dimension).
+    """
+    rollup_spec = QuerySpec()
+    for clause in spec.clauses():
+        if "terms" in clause and len(clause["terms"]) == 1:
+            field, values = next(iter(clause["terms"].items()))
+            if field not in ROLLUP_DIMENSIONS:
+                return None
+            rollup_spec = rollup_spec.terms(field, values)
+        elif "range" in clause and list(clause["range"]) == ["scan_date"]:
+            bounds = clause["range"]["scan_date"]
+            if set(bounds) - {"gte", "lte"}:
+                return None
+            hours = {op: _scan_hour(value) for op, value in bounds.items()}
+            if None in hours.values():
+                return None
+            # An upper bound includes the documents of its whole hour
+            rollup_spec = rollup_spec.range("scan_hour", **hours)
+        else:
+            return None
+    return rollup_spec
+
+def rollup_query(client, index_name, spec):
+    """
+    Return the rollup query answering spec, or None if the plant index must be searched instead.
+    """
+    rollup_spec = to_rollup_spec(spec)
+    if rollup_spec is None or not rollup_available(client, index_name):
+        return None
+    return rollup_spec
+
+def _by_day(aggs):
+    return {
+        "by_scan_date": {
+            "date_histogram": {
+                "field": "scan_hour",
+                "calendar_interval": "day",
+                "format": "yyyy-MM-dd"
+            },
+            "aggs": aggs
+        }
+    }
+
+def rollup_scan_date_body(rollup_spec):
+    """
+    Return the rollup search body counting the records by scan date and instrument.
+    The record counts are in the "records" sum of each instrument bucket.
+    """
+    return rollup_spec.body(aggs=_by_day({
+        "by_instrument": {
+            "terms": {"field": "instrument"},
+            "aggs": {"records": {"sum": {"field": "count"}}}
+        }
+    }))
+
+def rollup_daily_means_body(rollup_spec, columns):
+    """
+    Return the rollup search body with the sum and count of each column by scan date.
+    """
+    aggs = {}
+    for col in columns:
+        aggs[f"{col}_sum"] = {"sum": {"field": f"{col}_sum"}}
+        aggs[f"{col}_count"] = {"sum": {"field": f"{col}_count"}}
+    return rollup_spec.body(aggs=_by_day(aggs))
+
+def daily_means(response, columns):
+    """
+    Return the daily mean of each column from a rollup_daily_means_body response, as rows
+    shaped like the avg aggregations of the plant index (None on days without values).
+    """
+    rows = []
+    for bucket in response['aggregations']['by_scan_date']['buckets']:
+        row = {'scan_date': bucket['key_as_string']}
+        for col in columns:
+            count = bucket[f"{col}_count"]['value']
+            row[col] = bucket[f"{col}_sum"]['value'] / count if count else None
+        rows.append(row)
+    return rows
+
+def daily_statistics(client, rollup_spec, columns):
+    """
+    Return, for each column, a DataFrame of its daily mean, median, max and min computed from
+    the rollup documents. Medians come from the merged quantile sketches of each day.
+    """
+    source = ["scan_hour"]
+    for col in columns:
+        source.extend([f"{col}_count", f"{col}_sum", f"{col}_min", f"{col}_max", f"{col}_sketch"])
+    documents = client.scan(index=ROLLUP_INDEX_NAME, body=rollup_spec.body(_source=source))
+
+    days = {}
+    for document in documents:
+        day = days.setdefault(document["scan_hour"][:10], {})
+        for col in columns:
+            if not document.get(f"{col}_count"):
+                continue
+            stats = day.get(col)
+            if stats is None:
+                stats = day[col] = {"count": 0, "sum": 0.0, "min": float("inf"), "max": float("-inf"), "sketch": None}
+            stats["count"] += document[f"{col}_count"]
+            stats["sum"] += document[f"{col}_sum"]
+            stats["min"] = min(stats["min"], document[f"{col}_min"])
+            stats["max"] = max(stats["max"], document[f"{col}_max"])
+            sketch = QuantileSketch.from_dict(document[f"{col}_sketch"])
+            stats["sketch"] = sketch if stats["sketch"] is None else stats["sketch"].merge(sketch)
+
+    results = {}
+    for col in columns:
+        data = [
+            {
+                'scan_date': day,
+                'mean': stats[col]["sum"] / stats[col]["count"],
+                'median': stats[col]["sketch"].quantile(0.5),
+                'max': stats[col]["max"],
+                'min': stats[col]["min"]
+            }
+            for day, stats in sorted(days.items()) if col in stats
+        ]
+        results[col] = pd.DataFrame(data, columns=['scan_date', 'mean', 'median', 'max', 'min']).dropna()
+    return results
+
+def rollup_columns(columns):
+    """
+    Return True if every column has statistics in the rollup.
+    """
+    return all(col in ROLLUP_FIELDS for col in columns)
@@ -0,0 +1,68 @@
+# runner.py
+import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+PANEL_EXECUTION_MODES = ("sequential", "concurrent")
+
+# The concurrent mode hands each worker thread a copy of Streamlit's private ScriptRunContext.
+# That relies on its internals (cursors, widget_ids_this_run and the fragment bookkeeping are
+# shared between the copies), which were only checked against these releases (the version pinned
+# in requirements.txt); with any other release the panels run sequentially.
+SUPPORTED_STREAMLIT_VERSIONS = ("1.40.",)
+
+def concurrent_panels_supported():
+    """
+    Return True if the installed Streamlit release supports the concurrent panel execution.
+    """
+    return st.__version__.startswith(SUPPORTED_STREAMLIT_VERSIONS)
+
+def _run_panel(container, panel, args):
+    """
+    Render one panel inside its placeholder; a failing panel only reports its own error.
+    """
+    with container:
+        try:
+            panel(*args)
+        except Exception as e:
+            st.warning("Either the data is not available or there was an error processing the data.")
+            st.write(e)
+
+def run_panels(panels, mode="sequential", max_workers=4):
+    """
+    Run dashboard panels, each given as (placeholder container, panel function, args).
+
+    - "sequential": panels run one after another, in order.
+    - "concurrent": panels run in a bounded thread pool. Each panel renders into its own
+      placeholder as soon as its searches return, so the page is complete after roughly
+      the slowest panel instead of the sum of all of them. Only with a supported Streamlit
+      release (see SUPPORTED_STREAMLIT_VERSIONS); otherwise the panels run sequentially.
+    """
+    if mode not in PANEL_EXECUTION_MODES:
+        raise ValueError(f"Unknown panel execution mode '{mode}', expected one of {PANEL_EXECUTION_MODES}")
+    if mode == "concurrent" and not concurrent_panels_supported():
+        print(f"Streamlit {st.__version__} is not supported by the concurrent panel execution; "
+              "running the panels sequentially.")
+        mode = "sequential"
+
+    if mode == "sequential" or len(panels) <= 1:
+        for container, panel, args in panels:
+            _run_panel(container, panel, args)
+        return
+
+    # Worker threads need the script run context to be allowed to write to the page.
+    # Each worker gets a shallow copy: the session, page state and fragment storage are
+    # shared, but per-thread bookkeeping such as the fragment currently being run is not.
+    ctx = get_script_run_ctx()
+
+    def run_in_worker(container, panel, args):
+        add_script_run_ctx(threading.current_thread(), copy.copy(ctx))
+        _run_panel(container, panel, args)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="panel") as executor:
+        futures = [executor.submit(run_in_worker, container, panel, args) for container, panel, args in panels]
+    # Re-raise anything that escaped a panel (e.g. st.rerun()) in the script thread
+    for future in futures:
+        future.result()
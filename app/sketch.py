@@ -0,0 +1,117 @@
+# sketch.py
+import math
+import numpy as np
+
+class QuantileSketch:
+    """
+    A mergeable quantile sketch with relative accuracy guarantees (in the spirit of DDSketch).
+
+    Values are counted in logarithmically sized bins, so any quantile is returned within
+    relative_accuracy of its true value. Sketches built over different sets of values (e.g. one
+    per day and instrument) merge exactly by adding their bin counts, which is what makes
+    percentiles computable from pre-aggregated rollup documents.
+    """
+    # Values closer to zero than this are counted as zero
+    MIN_VALUE = 1e-9
+
+    def __init__(self, relative_accuracy=0.01, max_bins=2048):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zero_count = 0
+
+    @property
+    def count(self):
+        return self.zero_count + sum(self.positive.values()) + sum(self.negative.values())
+
+    def _add_bins(self, bins, indexes):
+        keys, counts = np.unique(indexes, return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            bins[key] = bins.get(key, 0) + count
+
+    def add(self, values):
+        """
+        Add a value or an iterable of values; missing values (None/NaN) are ignored.
+        """
+        values = np.asarray(values if np.ndim(values) else [values], dtype=float)
+        values = values[~np.isnan(values)]
+        magnitudes = np.abs(values)
+        indexable = magnitudes > self.MIN_VALUE
+        self.zero_count += int((~indexable).sum())
+        indexes = np.ceil(np.log(magnitudes[indexable]) / self._log_gamma).astype(np.int64)
+        signs = values[indexable] > 0
+        self._add_bins(self.positive, indexes[signs])
+        self._add_bins(self.negative, indexes[~signs])
+        self._collapse()
+        return self
+
+    def merge(self, other):
+        """
+        Add the counts of another sketch (with the same relative accuracy) to this one.
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with a different relative accuracy")
+        for bins, other_bins in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in other_bins.items():
+                bins[key] = bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self._collapse()
+        return self
+
+    def _collapse(self):
+        # Keep memory bounded: fold the bins of the smallest magnitudes into their neighbour
+        for bins in (self.positive, self.negative):
+            if len(bins) > self.max_bins:
+                keys = sorted(bins)
+                folded = sum(bins.pop(key) for key in keys[:len(keys) - self.max_bins + 1])
+                first = keys[len(keys) - self.max_bins + 1]
+                bins[first] = bins.get(first, 0) + folded
+
+    def _value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q):
+        """
+        Return the estimated q-quantile (0 <= q <= 1), or None if the sketch is empty.
+        """
+        total = self.count
+        if total == 0:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        # From the most negative value to the largest positive one
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self.positive)) if self.positive else 0.0
+
+    def to_dict(self):
+        """
+        Return a compact JSON-serializable form of the sketch.
+        """
+        positive, negative = sorted(self.positive.items()), sorted(self.negative.items())
+        return {
+            "accuracy": self.relative_accuracy,
+            "positive": [[key for key, _ in positive], [count for _, count in positive]],
+            "negative": [[key for key, _ in negative], [count for _, count in negative]],
+            "zero": self.zero_count
+        }
+
+    @classmethod
+    def from_dict(cls, data, max_bins=2048):
+        sketch = cls(data["accuracy"], max_bins=max_bins)
+        sketch.positive = dict(zip(*data["positive"]))
+        sketch.negative = dict(zip(*data["negative"]))
+        sketch.zero_count = data["zero"]
+        return sketch
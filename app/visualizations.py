@@ -1,71 +1,56 @@
 # visualizations.py
-import math
-import copy
 import pandas as pd
 import streamlit as st
+import pydeck as pdk
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+from instrumentation import instrument_panel, measure
+from maps import box_map, view_for_bounds, viewport_bounds, tile_precision, max_tiles, tile_map, point_map
+from rollup import rollup_query, rollup_scan_date_body, rollup_daily_means_body, daily_means, daily_statistics, rollup_columns
+from weather import weather_columns, join_weather
+from config import SCAN_COUNT_PAGE_SIZE, FIELD_MAP_TILE_PIXELS, FIELD_MAP_RAW_POINTS, ROLLUP_INDEX_NAME
 
-def get_scan_count(client, index_name, query):
+# Files whose sizes are accounted by get_scan_count: aggregation name -> (path field, size field)
+FILE_SIZE_FIELDS = {
+    "unique_files": ("file_path", "file_size"),
+    "unique_fieldbook_files": ("fieldbook_file_path", "fieldbook_file_size"),
+    "unique_entropy_files": ("entropy_file_name.keyword", "entropy_file_size")
+}
+
+def scan_count_body(query, after_keys=None):
     """
-    Aggregate and display the number of records by instrument.
+    Return the search body that counts records by instrument and pages through the unique
+    files of each kind with composite aggregations, one page of each per search.
+
+    Without after_keys, this is the first page, which also counts the records. Otherwise only
+    the file aggregations in after_keys are continued from their after key.
     """
-    query['aggs'] = {
-        "by_instrument": {
-            "terms": {"field": "instrument"},
-            "aggs": {
-                "unique_files": {
-                    "terms": {"field": "file_path", "size": 10000},
-                    "aggs": {"total_file_size": {"sum": {"field": "file_size"}}}
-                },
-                "unique_fieldbook_files": {
-                    "terms": {"field": "fieldbook_file_path", "size": 10000},
-                    "aggs": {"total_fieldbook_file_size": {"sum": {"field": "fieldbook_file_size"}}}
-                },
-                "unique_entropy_files": {
-                    "terms": {"field": "entropy_file_name.keyword", "size": 10000},
-                    "aggs": {"total_entropy_file_size": {"sum": {"field": "entropy_file_size"}}}
-                }
-            }
+    aggs = {}
+    if after_keys is None:
+        aggs["by_instrument"] = {"terms": {"field": "instrument", "size": 100}}
+    for name, (path_field, size_field) in FILE_SIZE_FIELDS.items():
+        if after_keys is not None and name not in after_keys:
+            continue
+        composite = {
+            "size": SCAN_COUNT_PAGE_SIZE,
+            "sources": [
+                {"instrument": {"terms": {"field": "instrument"}}},
+                {"file": {"terms": {"field": path_field}}}
+            ]
         }
-    }
-    query["size"] = 0
+        if after_keys is not None:
+            composite["after"] = after_keys[name]
+        # Every record of a file carries the file's size: count it once per file
+        aggs[name] = {"composite": composite, "aggs": {"file_size": {"max": {"field": size_field}}}}
+    return query.body(aggs=aggs)
 
-    response = client.search(index=index_name, body=query)
-    data = []
-    total_scans = 0
-    total_file_size = 0
-    for instrument in response['aggregations']['by_instrument']['buckets']:
-        instrument_scans = instrument['doc_count']
-        instrument_file_size = sum(bucket['total_file_size']['value'] for bucket in instrument['unique_files']['buckets'])
-        instrument_fieldbook_file_size = sum(bucket['total_fieldbook_file_size']['value'] for bucket in instrument['unique_fieldbook_files']['buckets'])
-        instrument_entropy_file_size = sum(bucket['total_entropy_file_size']['value'] for bucket in instrument['unique_entropy_files']['buckets'])
-        total_instrument_file_size = instrument_file_size + instrument_fieldbook_file_size + instrument_entropy_file_size
-
-        data.append({
-            'Instrument': instrument['key'],
-            'Number of Scans': instrument_scans,
-            'Total File Size (in bytes)': total_instrument_file_size
-        })
-        total_scans += instrument_scans
-        total_file_size += total_instrument_file_size
-
-    data.append({
-        'Instrument': 'Total',
-        'Number of Scans': total_scans,
-        'Total File Size (in bytes)': total_file_size
-    })
-
-    df = pd.DataFrame(data)
-    st.subheader("Scan Count by Instrument")
-    st.dataframe(df)
-
-def get_vis(client, index_name, query):
+def scan_date_body(query):
     """
-    Create a line chart of record counts by scan date for each instrument.
+    Return the search body that counts records by scan date and instrument.
+    Shared by get_vis and get_comparison_vis, so a planned render sends it only once.
     """
-    query['aggs'] = {
+    return query.body(aggs={
         "by_scan_date": {
             "date_histogram": {
                 "field": "scan_date",
@@ -76,30 +61,126 @@ def get_vis(client, index_name, query):
                 "by_instrument": {"terms": {"field": "instrument"}}
             }
         }
-    }
-    query["size"] = 0
-    response = client.search(index=index_name, body=query)
-    
+    })
+
+def scan_date_counts(client, index_name, query):
+    """
+    Return the record counts by scan date and instrument, read from the rollup when it can
+    answer the query.
+    """
+    rollup_spec = rollup_query(client, index_name, query)
+    if rollup_spec is not None:
+        response = client.search(index=ROLLUP_INDEX_NAME, body=rollup_scan_date_body(rollup_spec))
+    else:
+        response = client.search(index=index_name, body=scan_date_body(query))
+
     data = []
     for date_bucket in response['aggregations']['by_scan_date']['buckets']:
         for instrument in date_bucket['by_instrument']['buckets']:
             data.append({
                 'scan_date': date_bucket['key_as_string'],
                 'instrument': instrument['key'],
-                'count': instrument['doc_count']
+                'count': int(instrument['records']['value']) if rollup_spec is not None else instrument['doc_count']
             })
+    return data
+
+def scan_days(client, index_name, query):
+    """
+    Return the dates (yyyy-MM-dd) on which documents matching the query were scanned.
+    """
+    return sorted({row['scan_date'] for row in scan_date_counts(client, index_name, query)})
+
+def field_bounds_body(query):
+    """
+    Return the search body that finds the extent and center of the plants matching the query.
+    """
+    return query.body(aggs={
+        "field_bounds": {"geo_bounds": {"field": "loc"}}
+    })
+
+def field_tiles_body(query, viewport, precision, trait, max_tiles, count_up_to):
+    """
+    Return the search body that averages trait over the geotiles of the given precision inside
+    the viewport (west, south, east, north). Plants are counted exactly up to count_up_to.
+    """
+    west, south, east, north = (round(edge, 6) for edge in viewport)
+    query = query.where({"geo_bounding_box": {"loc": {
+        "top_left": {"lat": north, "lon": west},
+        "bottom_right": {"lat": south, "lon": east}
+    }}})
+    return query.body(aggs={
+        "tiles": {
+            "geotile_grid": {"field": "loc", "precision": precision, "size": max_tiles},
+            "aggs": {"value": {"avg": {"field": trait}}}
+        }
+    }, track_total_hits=count_up_to)
+
+@instrument_panel
+def get_scan_count(client, index_name, query):
+    """
+    Aggregate and display the number of records by instrument.
+    """
+    response = client.search(index=index_name, body=scan_count_body(query))
+    scans = {bucket['key']: bucket['doc_count'] for bucket in response['aggregations']['by_instrument']['buckets']}
+
+    # Sum the file sizes page by page, so memory use does not grow with the number of files
+    file_sizes = {}
+    while True:
+        after_keys = {}
+        for name in FILE_SIZE_FIELDS:
+            files = response['aggregations'].get(name)
+            if files is None:
+                continue
+            for bucket in files['buckets']:
+                instrument = bucket['key']['instrument']
+                file_sizes[instrument] = file_sizes.get(instrument, 0) + (bucket['file_size']['value'] or 0)
+            if len(files['buckets']) == SCAN_COUNT_PAGE_SIZE and 'after_key' in files:
+                after_keys[name] = files['after_key']
+        if not after_keys:
+            break
+        response = client.search(index=index_name, body=scan_count_body(query, after_keys))
+
+    data = []
+    for instrument, instrument_scans in scans.items():
+        data.append({
+            'Instrument': instrument,
+            'Number of Scans': instrument_scans,
+            'Total File Size (in bytes)': file_sizes.get(instrument, 0)
+        })
+
+    data.append({
+        'Instrument': 'Total',
+        'Number of Scans': sum(scans.values()),
+        'Total File Size (in bytes)': sum(file_sizes.get(instrument, 0) for instrument in scans)
+    })
+
+    with measure("dataframe"):
+        df = pd.DataFrame(data)
+    st.subheader("Scan Count by Instrument")
+    st.dataframe(df)
+
+@st.fragment
+@instrument_panel
+def get_vis(client, index_name, query):
+    """
+    Create a line chart of record counts by scan date for each instrument.
+    """
+    data = scan_date_counts(client, index_name, query)
     st.subheader("Record Counts by Scan Date")
     graph_type = st.selectbox('Select the graph type', ['Bar', 'Line', 'Scatter'], key="graph_type_scan_date")
-    df = pd.DataFrame(data)
-    if graph_type == 'Line':
-        fig = px.line(df, x='scan_date', y='count', color='instrument', line_shape='linear')
-    elif graph_type == 'Bar':
-        fig = px.bar(df, x='scan_date', y='count', color='instrument')
-    else:
-        fig = px.scatter(df, x='scan_date', y='count', color='instrument')
+    with measure("figure"):
+        df = pd.DataFrame(data)
+        if graph_type == 'Line':
+            fig = px.line(df, x='scan_date', y='count', color='instrument', line_shape='linear')
+        elif graph_type == 'Bar':
+            fig = px.bar(df, x='scan_date', y='count', color='instrument')
+        else:
+            fig = px.scatter(df, x='scan_date', y='count', color='instrument')
 
     st.plotly_chart(fig)
 
+@st.fragment
+@instrument_panel
 def get_comparison_vis(client, index_name, query):
     """
     Compare scan data across selected sensors and seasons.
@@ -108,40 +189,19 @@ def get_comparison_vis(client, index_name, query):
     sensors = st.multiselect('Select the sensors to visualize', ['flirIrCamera', 'scanner3DTop', 'drone', 'stereoTop'], default=['flirIrCamera'])
     years = [2022, 2021, 2020, 2019, 2018]
     # Override years if provided in the query
-    for f in query['query']['bool']['must']:
-        if 'terms' in f and 'year' in f['terms']:
-            years = f['terms']['year']
+    if query.values('year'):
+        years = [int(year) for year in query.values('year')]
 
-    seasons = st.multiselect('Select the seasons to compare', years, default = [2020, 2022])
+    seasons = st.multiselect('Select the seasons to compare', years,
+                             default=[year for year in [2020, 2022] if year in years])
     graph_type = st.selectbox('Select the graph type', ['Line', 'Bar', 'Scatter'])
 
-    query['aggs'] = {
-        "by_scan_date": {
-            "date_histogram": {
-                "field": "scan_date",
-                "calendar_interval": "day",
-                "format": "yyyy-MM-dd"
-            },
-            "aggs": {
-                "by_instrument": {"terms": {"field": "instrument"}}
-            }
-        }
-    }
-    query["size"] = 0
-    response = client.search(index=index_name, body=query)
-
-    data = []
-    for date_bucket in response['aggregations']['by_scan_date']['buckets']:
-        for instrument in date_bucket['by_instrument']['buckets']:
-            data.append({
-                'scan_date': date_bucket['key_as_string'],
-                'instrument': instrument['key'],
-                'count': instrument['doc_count']
-            })
-    df = pd.DataFrame(data)
-    df['year'] = pd.to_datetime(df['scan_date']).dt.year
-    df['scan_date'] = pd.to_datetime(df['scan_date']).dt.strftime('%m-%d')
-    df['scan_date'] = pd.to_datetime(df['scan_date'], format='%m-%d')
+    data = scan_date_counts(client, index_name, query)
+    with measure("dataframe"):
+        df = pd.DataFrame(data)
+        df['year'] = pd.to_datetime(df['scan_date']).dt.year
+        df['scan_date'] = pd.to_datetime(df['scan_date']).dt.strftime('%m-%d')
+        df['scan_date'] = pd.to_datetime(df['scan_date'], format='%m-%d')
 
     # Organize data by season and sensor
     seasons_dict = {}
@@ -160,15 +220,16 @@ def get_comparison_vis(client, index_name, query):
                 if season in seasons_dict and sensor in seasons_dict[season]:
                     df_combined = pd.concat([df_combined, seasons_dict[season][sensor]])
             df_combined['year'] = df_combined['year'].astype(str)
-            if graph_type == 'Bar':
-                fig = px.bar(df_combined, x='scan_date', y='count', color='year',
-                             title=f'Scans available by date for {sensor}')
-            elif graph_type == 'Scatter':
-                fig = px.scatter(df_combined, x='scan_date', y='count', color='year',
+            with measure("figure"):
+                if graph_type == 'Bar':
+                    fig = px.bar(df_combined, x='scan_date', y='count', color='year',
                                  title=f'Scans available by date for {sensor}')
-            else:
-                fig = px.line(df_combined, x='scan_date', y='count', color='year',
-                              title=f'Scans available by date for {sensor}')
+                elif graph_type == 'Scatter':
+                    fig = px.scatter(df_combined, x='scan_date', y='count', color='year',
+                                     title=f'Scans available by date for {sensor}')
+                else:
+                    fig = px.line(df_combined, x='scan_date', y='count', color='year',
+                                  title=f'Scans available by date for {sensor}')
             figs.append(fig)
         for fig in figs:
             st.plotly_chart(fig)
@@ -188,6 +249,7 @@ def get_comparison_vis(client, index_name, query):
         else:
             st.warning("Either no data is available or there was an error processing the data.")
 
+@instrument_panel
 def get_vis_over_time(client, index_name, query):
     """
     Visualize selected column(s) over time using a user‐chosen graph type.
@@ -201,18 +263,13 @@ def get_vis_over_time(client, index_name, query):
     graph_type = st.selectbox('Select the graph type', ['Line', 'Bar', 'Scatter'], key='graph_type')
     
     # Ensure the query uses the selected sensors
-    instrument_term_found = False
-    for f in query['query']['bool']['must']:
-        if 'terms' in f and 'instrument' in f['terms'] and sensors:
-            f['terms']['instrument'] = sensors
-            instrument_term_found = True
-    if not instrument_term_found and sensors:
-        query['query']['bool']['must'].append({"terms": {"instrument": sensors}})
+    if sensors:
+        query = query.replace_terms('instrument', sensors)
     
     cols_to_vis = [cols_to_vis]
     unq_count_values = [col for col in cols_to_vis if col in ['accession', 'crop_type']]
     
-    query['aggs'] = {
+    aggs = {
         "by_scan_date": {
             "date_histogram": {
                 "field": "scan_date",
@@ -223,14 +280,13 @@ def get_vis_over_time(client, index_name, query):
         }
     }
     for col in unq_count_values:
-        query['aggs']['by_scan_date']['aggs'][col] = {"terms": {"field": f"{col}.keyword"}}
+        aggs['by_scan_date']['aggs'][col] = {"terms": {"field": f"{col}.keyword"}}
     
-    query["size"] = 0
     numeric_cols = [col for col in cols_to_vis if col not in unq_count_values]
     for col in numeric_cols:
-        query['aggs']['by_scan_date']['aggs'][col] = {"avg": {"field": col}}
+        aggs['by_scan_date']['aggs'][col] = {"avg": {"field": col}}
     
-    response = client.search(index=index_name, body=query)
+    response = client.search(index=index_name, body=query.body(aggs=aggs))
     
     data = []
     for bucket in response['aggregations']['by_scan_date']['buckets']:
@@ -270,6 +326,8 @@ def get_vis_over_time(client, index_name, query):
         else:
             st.warning("Either no data is available or there was an error processing the data.")
 
+@st.fragment
+@instrument_panel
 def visualize_parameters(client, index_name, query, get_all_columns_func):
     """
     Visualize the value of one or more parameters over time including statistics.
@@ -281,17 +339,19 @@ def visualize_parameters(client, index_name, query, get_all_columns_func):
     """
     st.subheader("Visualize aggregated parameters over time")
     
-    # Build a list of visualizable columns and extend with any azmet_ columns found.
-    visualizable_columns = ['roi_temp', 'bounding_area_m2', 'mean_tgi', 'q1_tgi', 'q3_tgi', 'box axis']
+    # Build a list of visualizable columns, keeping only the columns that the index can aggregate,
+    # and extend it with the azmet_ columns of the weather index.
     all_columns = get_all_columns_func(client, index_name)
-    azmet_columns = [col for col in all_columns if col.startswith('azmet_')]
-    visualizable_columns.extend(azmet_columns)
+    visualizable_columns = [col for col in ['roi_temp', 'bounding_area_m2', 'mean_tgi', 'q1_tgi', 'q3_tgi']
+                            if col in all_columns]
+    visualizable_columns.append('box axis')
+    visualizable_columns.extend(weather_columns(client))
     
     # Use a multiselect so the user can pick one or more columns.
     selected_columns = st.multiselect(
         'Select the columns to visualize', 
         visualizable_columns,
-        default=[visualizable_columns[0]]
+        default=visualizable_columns[:1]
     )
     
     # Enforce the rule that if "box axis" is selected it must be the only option.
@@ -310,164 +370,106 @@ def visualize_parameters(client, index_name, query, get_all_columns_func):
     crop = st.multiselect('Select the crop type (optional)', ['sorghum', 'lettuce', 'maize'])
     
     # Add filters to the query.
-    if crop:
-        query['query']['bool']['must'].append({"terms": {"crop_type": crop}})
+    query = query.terms("crop_type", crop)
     
     # --- SPECIAL CASE: BOX AXIS ---
     if len(selected_columns) == 1 and selected_columns[0] == "box axis":
         # Ensure the coordinate fields exist.
-        query['query']['bool']['must'].append({"exists": {"field": "nw_lat"}})
-        query['query']['bool']['must'].append({"exists": {"field": "nw_lon"}})
-        query['query']['bool']['must'].append({"exists": {"field": "se_lat"}})
-        query['query']['bool']['must'].append({"exists": {"field": "se_lon"}})
-        query['aggs'] = {
+        query = query.exists("nw_lat", "nw_lon", "se_lat", "se_lon")
+        # Only the scan dates are needed here: every non-empty bucket has boxes to draw.
+        aggs = {
             "by_scan_date": {
                 "date_histogram": {
                     "field": "scan_date",
                     "calendar_interval": "day",
-                    "format": "yyyy-MM-dd"
-                },
-                "aggs": {
-                    "box_axis": {
-                        "top_hits": {
-                            "_source": {"includes": ["nw_lat", "nw_lon", "se_lat", "se_lon"]},
-                            "size": 1
-                        }
-                    }
+                    "format": "yyyy-MM-dd",
+                    "min_doc_count": 1
                 }
             }
         }
-        response = client.search(index=index_name, body=query)
-        data = []
-        for bucket in response['aggregations']['by_scan_date']['buckets']:
-            row = {'scan_date': bucket['key_as_string'], 'boxes': []}
-            for hit in bucket['box_axis']['hits']['hits']:
-                row['boxes'].append(hit['_source'])
-            data.append(row)
-        df = pd.DataFrame(data).dropna()
-        
-        # Map visualization: let the user choose a scan date.
-        date_choice = st.selectbox(
-            'Select a date to visualize the boxes',
-            df[df['boxes'].apply(lambda x: len(x) > 0)]['scan_date'].unique()
-        )
-        # Prepare a new query to get the boxes for the chosen date.
-        query['query']['bool']['must'].append({"exists": {"field": "nw_lat"}})
-        query['query']['bool']['must'].append({"exists": {"field": "nw_lon"}})
-        query['query']['bool']['must'].append({"exists": {"field": "se_lat"}})
-        query['query']['bool']['must'].append({"exists": {"field": "se_lon"}})
-        date_choice_formatted = pd.to_datetime(date_choice).strftime('%Y%m%dT%H%M%S.%f') + '-0700'
-        query['query']['bool']['must'].append({"term": {"scan_date": date_choice_formatted}})
-        query['size'] = 10000
-        if "aggs" in query:
-            del query['aggs']
-        response = client.search(index=index_name, body=query)
-        
-        data = []
-        for hit in response['hits']['hits']:
-            data.append(hit['_source'])
-        df_boxes = pd.DataFrame(data)
-        if len(df_boxes) > 1000:
-            df_boxes = df_boxes.sample(n=1000)
+        response = client.search(index=index_name, body=query.body(aggs=aggs))
+        dates = [bucket['key_as_string'] for bucket in response['aggregations']['by_scan_date']['buckets']]
+        if not dates:
+            st.warning("No plot boxes are available for the selected filters.")
+            return
         
-        lon, lat = [], []
-        min_nw_lon = math.inf
-        max_se_lon = -math.inf
-        min_se_lat = math.inf
-        max_nw_lat = -math.inf
-        for _, box in df_boxes.iterrows():
-            lon.extend([box['nw_lon'], box['se_lon'], box['se_lon'], box['nw_lon'], None])
-            lat.extend([box['nw_lat'], box['nw_lat'], box['se_lat'], box['se_lat'], None])
-            min_nw_lon = min(min_nw_lon, box['nw_lon'])
-            max_se_lon = max(max_se_lon, box['se_lon'])
-            min_se_lat = min(min_se_lat, box['se_lat'])
-            max_nw_lat = max(max_nw_lat, box['nw_lat'])
-        zoom_lon = max_se_lon - min_nw_lon
-        zoom_lat = max_nw_lat - min_se_lat
-        zoom = -1.446 * max(zoom_lon, zoom_lat) + 8.5
+        # Map visualization: let the user choose a scan date and the trait coloring the boxes.
+        date_choice = st.selectbox('Select a date to visualize the boxes', dates)
+        trait_columns = [col for col in visualizable_columns if col != 'box axis' and not col.startswith('azmet_')]
+        color_column = st.selectbox('Color the boxes by', ['None'] + trait_columns)
         
-        fig = go.Figure(go.Scattermapbox(
-            mode="lines",
-            fill="toself",
-            lon=lon,
-            lat=lat
-        ))
-        fig.update_layout(
-            mapbox={
-                'style': "open-street-map",
-                "center": {"lon": (min_nw_lon + max_se_lon) / 2,
-                           "lat": (min_se_lat + max_nw_lat) / 2},
-                "zoom": zoom
-            },
-            showlegend=False,
-            margin={"l": 0, "r": 0, "t": 0, "b": 0},
-        )
+        # Fetch every box of the chosen day bucket (no sampling), with only the fields drawn on the map.
+        next_day = (pd.to_datetime(date_choice) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+        date_query = query.range("scan_date", gte=date_choice, lt=next_day, format="yyyy-MM-dd")
+        source = ["plot", "nw_lat", "nw_lon", "se_lat", "se_lon"] + trait_columns
+        boxes = client.scan(index=index_name, body=date_query.body(_source=source))
+        box_fields = ["nw_lat", "nw_lon", "se_lat", "se_lon"]
+        with measure("dataframe"):
+            df_boxes = pd.DataFrame(boxes, columns=None if boxes else box_fields).dropna(subset=box_fields)
+        if df_boxes.empty:
+            st.warning("No plot boxes are available for the selected date.")
+            return
+        with measure("figure"):
+            deck = box_map(df_boxes, None if color_column == 'None' else color_column)
+        st.caption(f"{len(df_boxes)} plots")
+        st.pydeck_chart(deck)
+        return
     
     # --- GENERAL CASE: ONE OR MORE (non–box axis) COLUMNS ---
     else:
-        # For each column (which is not box axis), run its query separately.
+        # Plant columns are aggregated from the plant index (or the rollup); the weather of
+        # the days with data is joined from the weather index.
+        plant_selected = [col for col in selected_columns if not col.startswith("azmet_")]
+        weather_selected = [col for col in selected_columns if col.startswith("azmet_")]
+
+        # Compute every selected column in a single date histogram, with one set of
+        # sub-aggregations per column, so adding columns does not add searches.
+        column_aggs = {}
+        for col in plant_selected:
+            # "stats" returns avg, max and min in one pass over the column.
+            column_aggs[f"{col}_stats"] = {"stats": {"field": col}}
+            column_aggs[f"{col}_median"] = {"percentiles": {"field": col, "percents": [50]}}
+
         results = {}  # dict to hold DataFrames keyed by column name.
-        for col in selected_columns:
-            # Create a deep copy of the query so that changes for one column
-            # do not affect the queries for others.
-            q = copy.deepcopy(query)
-            # Use the same query modifications as already in your code.
-            if col.startswith("azmet_"):
-                q['aggs'] = {
-                    "by_scan_date": {
-                        "date_histogram": {
-                            "field": "scan_date",
-                            "calendar_interval": "day",
-                            "format": "yyyy-MM-dd"
-                        },
-                        "aggs": {
-                            "value": {
-                                "top_hits": {
-                                    "_source": {"includes": [col]},
-                                    "size": 1
-                                }
-                            }
-                        }
-                    }
-                }
-            else:
-                q['aggs'] = {
-                    "by_scan_date": {
-                        "date_histogram": {
-                            "field": "scan_date",
-                            "calendar_interval": "day",
-                            "format": "yyyy-MM-dd"
-                        },
-                        "aggs": {
-                            "mean": {"avg": {"field": col}},
-                            "median": {"percentiles": {"field": col, "percents": [50]}},
-                            "max": {"max": {"field": col}},
-                            "min": {"min": {"field": col}}
-                        }
-                    }
+        rollup_spec = rollup_query(client, index_name, query) if rollup_columns(plant_selected) else None
+        if plant_selected and rollup_spec is not None:
+            # Daily statistics merged from the pre-aggregated rollup documents
+            with measure("dataframe"):
+                results = daily_statistics(client, rollup_spec, plant_selected)
+        elif plant_selected:
+            aggs = {
+                "by_scan_date": {
+                    "date_histogram": {
+                        "field": "scan_date",
+                        "calendar_interval": "day",
+                        "format": "yyyy-MM-dd"
+                    },
+                    "aggs": column_aggs
                 }
-            q["size"] = 0
-            response = client.search(index=index_name, body=q)
-            data = []
-            if col.startswith("azmet_"):
-                for bucket in response['aggregations']['by_scan_date']['buckets']:
-                    row = {'scan_date': bucket['key_as_string']}
-                    hits = bucket['value']['hits']['hits']
-                    if hits:
-                        row[col] = hits[0]['_source'][col]
-                    data.append(row)
-            else:
-                for bucket in response['aggregations']['by_scan_date']['buckets']:
+            }
+            response = client.search(index=index_name, body=query.body(aggs=aggs))
+            buckets = response['aggregations']['by_scan_date']['buckets']
+            for col in plant_selected:
+                data = []
+                for bucket in buckets:
+                    stats = bucket[f"{col}_stats"]
                     row = {
                         'scan_date': bucket['key_as_string'],
-                        'mean': bucket['mean']['value'],
-                        'median': bucket['median']['values']['50.0'],
-                        'max': bucket['max']['value'],
-                        'min': bucket['min']['value']
+                        'mean': stats['avg'],
+                        'median': bucket[f"{col}_median"]['values']['50.0'],
+                        'max': stats['max'],
+                        'min': stats['min']
                     }
                     data.append(row)
-            df = pd.DataFrame(data).dropna()
-            results[col] = df
+                with measure("dataframe", column=col):
+                    df = pd.DataFrame(data).dropna()
+                results[col] = df
+        if weather_selected:
+            days = pd.DataFrame({'scan_date': scan_days(client, index_name, query)})
+            with measure("dataframe", column="weather"):
+                weather = join_weather(client, days, weather_selected)
+            for col in weather_selected:
+                results[col] = weather[['scan_date', col]].dropna()
         
         # Create subplots so that each column is shown in its own panel,
         # with the x-axis (scan_date) shared across all panels.
@@ -476,59 +478,63 @@ def visualize_parameters(client, index_name, query, get_all_columns_func):
             st.warning("Please select at least one column to visualize.")
             return
 
-        fig = make_subplots(rows=n_rows, cols=1, shared_xaxes=True,
-                            subplot_titles=selected_columns)
-        for i, col in enumerate(selected_columns, start=1):
-            df = results[col]
-            # For a given column, choose which trace to plot.
-            # Here, for normal columns we choose the "mean" value (but you can extend this if needed),
-            # and for azmet_ columns we plot the value.
-            if col.startswith("azmet_"):
-                if graph_type == 'Line':
-                    fig.add_trace(go.Scatter(x=df['scan_date'], y=df[col],
-                                             mode='lines', name=col), row=i, col=1)
-                elif graph_type == 'Scatter':
-                    fig.add_trace(go.Scatter(x=df['scan_date'], y=df[col],
-                                             mode='markers', name=col), row=i, col=1)
-                else:
-                    fig.add_trace(go.Box(x=df['scan_date'], y=df[col],
-                                           name=col), row=i, col=1)
-            else:
-                # Plot only the "mean" value (or you could plot all four if desired).
-                if graph_type == 'Line':
-                    fig.add_trace(go.Scatter(x=df['scan_date'], y=df['mean'],
-                                             mode='lines', name=f'{col} mean'), row=i, col=1)
-                elif graph_type == 'Scatter':
-                    fig.add_trace(go.Scatter(x=df['scan_date'], y=df['mean'],
-                                             mode='markers', name=f'{col} mean'), row=i, col=1)
+        with measure("figure"):
+            fig = make_subplots(rows=n_rows, cols=1, shared_xaxes=True,
+                                subplot_titles=selected_columns)
+            for i, col in enumerate(selected_columns, start=1):
+                df = results[col]
+                # For a given column, choose which trace to plot.
+                # Here, for normal columns we choose the "mean" value (but you can extend this if needed),
+                # and for azmet_ columns we plot the value.
+                if col.startswith("azmet_"):
+                    if graph_type == 'Line':
+                        fig.add_trace(go.Scatter(x=df['scan_date'], y=df[col],
+                                                 mode='lines', name=col), row=i, col=1)
+                    elif graph_type == 'Scatter':
+                        fig.add_trace(go.Scatter(x=df['scan_date'], y=df[col],
+                                                 mode='markers', name=col), row=i, col=1)
+                    else:
+                        fig.add_trace(go.Box(x=df['scan_date'], y=df[col],
+                                               name=col), row=i, col=1)
                 else:
-                    fig.add_trace(go.Box(x=df['scan_date'], y=df['mean'],
-                                           name=f'{col} mean'), row=i, col=1)
-        fig.update_layout(title_text='Value of parameters over time',
-                          showlegend=True,
-                          height=300 * n_rows)
+                    # Plot only the "mean" value (or you could plot all four if desired).
+                    if graph_type == 'Line':
+                        fig.add_trace(go.Scatter(x=df['scan_date'], y=df['mean'],
+                                                 mode='lines', name=f'{col} mean'), row=i, col=1)
+                    elif graph_type == 'Scatter':
+                        fig.add_trace(go.Scatter(x=df['scan_date'], y=df['mean'],
+                                                 mode='markers', name=f'{col} mean'), row=i, col=1)
+                    else:
+                        fig.add_trace(go.Box(x=df['scan_date'], y=df['mean'],
+                                               name=f'{col} mean'), row=i, col=1)
+            fig.update_layout(title_text='Value of parameters over time',
+                              showlegend=True,
+                              height=300 * n_rows)
     
     st.plotly_chart(fig)
 
 
 
+@st.fragment
+@instrument_panel
 def compare_axis(client, index_name, query, get_all_columns_func):
     """
     Compare the values of multiple columns.
     """
     st.subheader("Compare and analyze trends in values of multiple columns")
     
-    # Build a list of visualizable columns and extend with any azmet_ columns found.
-    visualizable_columns = ['roi_temp', 'bounding_area_m2', 'mean_tgi', 'q1_tgi', 'q3_tgi']
+    # Build a list of visualizable columns, keeping only the columns that the index can aggregate,
+    # and extend it with the azmet_ columns of the weather index.
     all_columns = get_all_columns_func(client, index_name)
-    azmet_columns = [col for col in all_columns if col.startswith('azmet_')]
-    visualizable_columns.extend(azmet_columns)
+    visualizable_columns = [col for col in ['roi_temp', 'bounding_area_m2', 'mean_tgi', 'q1_tgi', 'q3_tgi']
+                            if col in all_columns]
+    visualizable_columns.extend(weather_columns(client))
     
     # Use a multiselect so the user can pick one or more columns.
     selected_columns = st.multiselect(
         'Select the columns to visualize', 
         visualizable_columns,
-        default=[visualizable_columns[0], visualizable_columns[1]]
+        default=visualizable_columns[:2]
     )
 
     if len(selected_columns) < 2:
@@ -564,8 +570,13 @@ def compare_axis(client, index_name, query, get_all_columns_func):
         # Extract actual colorscale name from selection
         colorscale_type, colorscale_name = selected_colorscale.split(": ")
 
+    # Plant columns are averaged per day from the plant index (or the rollup); the weather of
+    # each day is joined from the weather index.
+    plant_selected = [col for col in selected_columns if not col.startswith("azmet_")]
+    weather_selected = [col for col in selected_columns if col.startswith("azmet_")]
+
     # Ensure the query uses the selected columns.
-    query['aggs'] = {
+    aggs = {
         "by_scan_date": {
             "date_histogram": {
                 "field": "scan_date",
@@ -575,28 +586,38 @@ def compare_axis(client, index_name, query, get_all_columns_func):
             "aggs": {}
         }
     }
-    for col in selected_columns:
-        query['aggs']['by_scan_date']['aggs'][col] = {"avg": {"field": col}}
+    for col in plant_selected:
+        aggs['by_scan_date']['aggs'][col] = {"avg": {"field": col}}
     
-    query["size"] = 0
-    response = client.search(index=index_name, body=query)
-    
-    data = []
-    
-    for bucket in response['aggregations']['by_scan_date']['buckets']:
-        row = {'scan_date': bucket['key_as_string']}
-        for col in selected_columns:
-            row[col] = bucket[col]['value']
-        data.append(row)
+    rollup_spec = rollup_query(client, index_name, query) if rollup_columns(plant_selected) else None
+    if not plant_selected:
+        # Only weather columns: one row per day with data
+        data = [{'scan_date': day} for day in scan_days(client, index_name, query)]
+    elif rollup_spec is not None:
+        response = client.search(index=ROLLUP_INDEX_NAME, body=rollup_daily_means_body(rollup_spec, plant_selected))
+        data = daily_means(response, plant_selected)
+    else:
+        response = client.search(index=index_name, body=query.body(aggs=aggs))
+
+        data = []
+
+        for bucket in response['aggregations']['by_scan_date']['buckets']:
+            row = {'scan_date': bucket['key_as_string']}
+            for col in plant_selected:
+                row[col] = bucket[col]['value']
+            data.append(row)
     
-    df = pd.DataFrame(data)
-    df['year'] = pd.to_datetime(df['scan_date']).dt.year
+    with measure("dataframe"):
+        df = pd.DataFrame(data, columns=['scan_date'] + plant_selected)
+        if weather_selected:
+            df = join_weather(client, df, weather_selected)
+        df['year'] = pd.to_datetime(df['scan_date']).dt.year
 
-    # filter data by columns where both columns have values
-    df = df.dropna(subset=selected_columns)
+        # filter data by columns where both columns have values
+        df = df.dropna(subset=selected_columns)
 
-    # Convert the year to integer to avoid fractional years in the color legend
-    df['year'] = df['year'].astype(int)
+        # Convert the year to integer to avoid fractional years in the color legend
+        df['year'] = df['year'].astype(int)
     # st.write(df)
 
     # Get the correct colorscale based on selection
@@ -608,32 +629,33 @@ def compare_axis(client, index_name, query, get_all_columns_func):
         color_scale = getattr(px.colors.qualitative, colorscale_name)
 
     if plot_type == 'Scatterplot Matrix':
-        # For qualitative scales, map each year to a color
-        if colorscale_type == "Qualitative":
-            color_map = {str(year): color for year, color in zip(df['year'].unique(), color_scale)}
+        with measure("figure"):
+            # For qualitative scales, map each year to a color
+            if colorscale_type == "Qualitative":
+                color_map = {str(year): color for year, color in zip(df['year'].unique(), color_scale)}
             
-            # Build a scatter matrix comparing the columns
-            fig = px.scatter_matrix(df, dimensions=selected_columns, color='year', color_discrete_map=color_map)
+                # Build a scatter matrix comparing the columns
+                fig = px.scatter_matrix(df, dimensions=selected_columns, color='year', color_discrete_map=color_map)
             
-            # Ensure the color legend is discrete
-            fig.update_layout(coloraxis_colorbar=dict(
-                title="Year",
-                tickvals=list(color_map.keys()),
-                ticktext=list(color_map.keys())
-            ))
-        else:
-            # For sequential and diverging scales, use continuous color mapping
-            fig = px.scatter_matrix(
-                df, 
-                dimensions=selected_columns, 
-                color='year',
-                color_continuous_scale=color_scale
-            )
+                # Ensure the color legend is discrete
+                fig.update_layout(coloraxis_colorbar=dict(
+                    title="Year",
+                    tickvals=list(color_map.keys()),
+                    ticktext=list(color_map.keys())
+                ))
+            else:
+                # For sequential and diverging scales, use continuous color mapping
+                fig = px.scatter_matrix(
+                    df, 
+                    dimensions=selected_columns, 
+                    color='year',
+                    color_continuous_scale=color_scale
+                )
         
-        # make the figure a bit larger, proportional to the number of columns
-        fig.update_layout(width=400 + 100 * len(selected_columns), height=400 + 100 * len(selected_columns))
-        # Adjust marker size
-        fig.update_traces(marker=dict(size=5))
+            # make the figure a bit larger, proportional to the number of columns
+            fig.update_layout(width=400 + 100 * len(selected_columns), height=400 + 100 * len(selected_columns))
+            # Adjust marker size
+            fig.update_traces(marker=dict(size=5))
 
         st.plotly_chart(fig, config={'displayModeBar': True})
         st.markdown(
@@ -670,7 +692,8 @@ def compare_axis(client, index_name, query, get_all_columns_func):
         for i, dim in enumerate(dimensions):
             if cols[i].button(dim, key=f"color_by_{dim}"):
                 st.session_state.color_dimension = dim
-                st.rerun()
+                # Only this panel needs to be redrawn with the new coloring
+                st.rerun(scope="fragment")
 
         # Get the current coloring dimension
         color_dim = st.session_state.color_dimension
@@ -685,28 +708,29 @@ def compare_axis(client, index_name, query, get_all_columns_func):
             selected_color_scale = px.colors.qualitative.Set1
             st.info(f"Note: Using 'Set1' qualitative palette for categorical 'year' dimension instead of {colorscale_name}")
 
-        # Build a parallel coordinates plot with the selected colorscale
-        fig = px.parallel_coordinates(
-            df, 
-            dimensions=dimensions,
-            color=color_dim,
-            color_continuous_scale=selected_color_scale if color_dim != 'year' or colorscale_type == "Qualitative" else selected_color_scale
-        )
+        with measure("figure"):
+            # Build a parallel coordinates plot with the selected colorscale
+            fig = px.parallel_coordinates(
+                df, 
+                dimensions=dimensions,
+                color=color_dim,
+                color_continuous_scale=selected_color_scale if color_dim != 'year' or colorscale_type == "Qualitative" else selected_color_scale
+            )
         
-        # Update layout
-        fig.update_layout(
-            width=800, 
-            height=400,
-            hovermode='closest',
-            margin=dict(t=80, b=20, l=50, r=50),
-            title={
-                'text': f'Parallel Coordinates Plot (Colored by {color_dim})',
-                'y':0.98,
-                'x':0.5,
-                'xanchor': 'center',
-                'yanchor': 'top'
-            }
-        )
+            # Update layout
+            fig.update_layout(
+                width=800, 
+                height=400,
+                hovermode='closest',
+                margin=dict(t=80, b=20, l=50, r=50),
+                title={
+                    'text': f'Parallel Coordinates Plot (Colored by {color_dim})',
+                    'y':0.98,
+                    'x':0.5,
+                    'xanchor': 'center',
+                    'yanchor': 'top'
+                }
+            )
         
         # Update the plot
         plot_container.plotly_chart(fig, config={'displayModeBar': True})
@@ -729,4 +753,92 @@ def compare_axis(client, index_name, query, get_all_columns_func):
             </style>
             """,
             unsafe_allow_html=True
-        )
\ No newline at end of file
+        )
+
+def _lon_lat(loc):
+    """
+    Return (lon, lat) from a geo_point stored as an object, an array or a "lat,lon" string.
+    """
+    if isinstance(loc, dict):
+        return loc.get('lon'), loc.get('lat')
+    if isinstance(loc, (list, tuple)):
+        return loc[0], loc[1]
+    if isinstance(loc, str) and ',' in loc:
+        lat, lon = loc.split(',', 1)
+        return float(lon), float(lat)
+    return None, None
+
+@st.fragment
+@instrument_panel
+def field_map(client, index_name, query, get_all_columns_func):
+    """
+    Map a trait over the field. Zoomed out, the plants are averaged into tiles of about
+    FIELD_MAP_TILE_PIXELS on screen, so the amount of data depends on the map size and not on
+    the number of plants; once the viewport holds few enough plants they are drawn one by one.
+    """
+    st.subheader("Field map")
+    all_columns = get_all_columns_func(client, index_name)
+    traits = [col for col in ['roi_temp', 'mean_tgi', 'bounding_area_m2', 'q1_tgi', 'q3_tgi'] if col in all_columns]
+    if not traits:
+        st.warning("No trait is available to map.")
+        return
+    trait = st.selectbox('Select the trait to map', traits, key="field_map_trait")
+
+    response = client.search(index=index_name, body=field_bounds_body(query))
+    bounds = response['aggregations']['field_bounds'].get('bounds')
+    if not bounds:
+        st.warning("No plant locations are available for the selected filters.")
+        return
+    west, north = bounds['top_left']['lon'], bounds['top_left']['lat']
+    east, south = bounds['bottom_right']['lon'], bounds['bottom_right']['lat']
+    # Keep the sliders valid when all the plants are at the same location
+    if east - west < 1e-5:
+        west, east = west - 1e-4, east + 1e-4
+    if north - south < 1e-5:
+        south, north = south - 1e-4, north + 1e-4
+
+    fit = view_for_bounds(west, south, east, north)
+    col1, col2, col3 = st.columns(3)
+    zoom = col1.slider('Zoom', 1.0, 24.0, float(round(fit.zoom * 2) / 2), 0.5, key="field_map_zoom")
+    lon = col2.slider('Longitude', west, east, (west + east) / 2, (east - west) / 100,
+                      format="%.5f", key="field_map_lon")
+    lat = col3.slider('Latitude', south, north, (south + north) / 2, (north - south) / 100,
+                      format="%.5f", key="field_map_lat")
+    view = pdk.ViewState(longitude=lon, latitude=lat, zoom=zoom)
+    viewport = viewport_bounds(lon, lat, zoom)
+
+    precision = tile_precision(zoom, FIELD_MAP_TILE_PIXELS)
+    body = field_tiles_body(query, viewport, precision, trait, max_tiles(FIELD_MAP_TILE_PIXELS), FIELD_MAP_RAW_POINTS + 1)
+    response = client.search(index=index_name, body=body)
+    total = response['hits']['total']['value']
+
+    if total <= FIELD_MAP_RAW_POINTS:
+        # Few enough plants in view: fetch and draw them individually.
+        points_body = dict(body, size=FIELD_MAP_RAW_POINTS, _source=['loc', 'plot', trait])
+        del points_body['aggs']
+        response = client.search(index=index_name, body=points_body)
+        with measure("dataframe"):
+            points = pd.DataFrame([hit['_source'] for hit in response['hits']['hits']])
+            if points.empty:
+                st.info("No plants in view.")
+                return
+            points['lon'], points['lat'] = zip(*points['loc'].map(_lon_lat))
+            points = points.dropna(subset=['lon', 'lat'])
+        with measure("figure"):
+            deck = point_map(points, trait, view)
+        st.caption(f"{len(points)} plants in view")
+    else:
+        with measure("dataframe"):
+            tiles = pd.DataFrame([
+                {'key': bucket['key'], 'doc_count': bucket['doc_count'], trait: bucket['value']['value']}
+                for bucket in response['aggregations']['tiles']['buckets']
+            ])
+        with measure("figure"):
+            deck = tile_map(tiles, trait, view)
+        # The count stops at FIELD_MAP_RAW_POINTS + 1; past it, only a lower bound is known
+        if response['hits']['total'].get('relation') == 'gte':
+            plants = f"over {FIELD_MAP_RAW_POINTS}"
+        else:
+            plants = f"{total}"
+        st.caption(f"{plants} plants in view, averaged over {len(tiles)} tiles (precision {precision})")
+    st.pydeck_chart(deck)
@@ -0,0 +1,52 @@
+# weather.py
+import threading
+import pandas as pd
+from opensearchpy.exceptions import NotFoundError
+from config import AZMET_INDEX_NAME
+
+# Fields of the weather documents identifying a station-day rather than describing its weather
+KEY_FIELDS = ["date", "azmet_year", "azmet_day_of_year", "azmet_station_number"]
+
+# The daily table built from the last station-days fetched by this process
+_daily = {"sources": None, "table": None}
+_daily_lock = threading.Lock()
+
+def weather_table(client):
+    """
+    Return the daily AZMET weather as a DataFrame indexed by scan_date (yyyy-MM-dd), with one
+    azmet_<key> column per measurement, averaged over the stations of each day.
+
+    The station-days are read with a scan that the search cache keeps until new weather is
+    uploaded, and the table is only rebuilt when that scan was actually sent again.
+    """
+    try:
+        sources = client.scan(index=AZMET_INDEX_NAME, body={"query": {"match_all": {}}})
+    except NotFoundError:
+        sources = []
+    with _daily_lock:
+        if _daily["sources"] is sources:
+            return _daily["table"]
+
+    df = pd.DataFrame(sources)
+    measurements = [col for col in df.columns if col.startswith("azmet_") and col not in KEY_FIELDS]
+    if df.empty:
+        table = pd.DataFrame(index=pd.Index([], name="scan_date"))
+    else:
+        table = df.groupby("date")[measurements].mean().rename_axis("scan_date")
+    with _daily_lock:
+        _daily.update(sources=sources, table=table)
+    return table
+
+def weather_columns(client):
+    """
+    Return the names of the weather measurements that can be joined onto the date buckets.
+    """
+    return sorted(weather_table(client).columns)
+
+def join_weather(client, df, columns):
+    """
+    Add the given weather columns to df, matching its scan_date column (yyyy-MM-dd).
+    Days without weather get NaN.
+    """
+    table = weather_table(client)
+    return df.join(table.reindex(columns=columns), on="scan_date")
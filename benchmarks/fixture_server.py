@@ -0,0 +1,274 @@
+# fixture_server.py
+import os
+import sys
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl, unquote
+
+REPOSITORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPOSITORY_DIR)
+sys.path.append(os.path.join(REPOSITORY_DIR, "search_configuration"))
+from recording import decode_body
+from app.config import INDEX_NAME, PARTITION_PREFIX, ROLLUP_INDEX_NAME, ROLLUP_FIELDS, AZMET_INDEX_NAME
+from app.partitions import partition_name
+
+# A small synthetic data set, shaped like the real one: the same mappings, one partition per
+# year and season, and a few scan days per partition. Every response is derived from it and from
+# the request, so recording the benchmark against this server twice gives the same recording.
+SEASONS = {2020: 10, 2021: 12, 2022: 14}
+CROP_TYPES = ["sorghum", "lettuce"]
+INSTRUMENTS = ["flirIrCamera", "scanner3DTop", "drone", "stereoTop"]
+PLANTS_PER_PARTITION = 40
+GENERATION = 1
+
+def _load_mapping(file_name):
+    with open(os.path.join(REPOSITORY_DIR, "search_configuration", file_name), "r") as file:
+        return json.load(file)
+
+def plant_mapping():
+    """
+    Return the mapping of the partitions, with the traits and plot corners the sensors add.
+    """
+    mapping = _load_mapping("index_mapping.json")
+    for field in ROLLUP_FIELDS + ["nw_lat", "nw_lon", "se_lat", "se_lon"]:
+        mapping["mappings"]["properties"][field] = {"type": "float"}
+    mapping["mappings"]["_meta"] = {"ingest_generation": GENERATION}
+    return mapping
+
+def plant_documents(year, season):
+    documents = []
+    for i in range(PLANTS_PER_PARTITION):
+        lat, lon = 33.0745 + (i % 8) * 1e-5, -111.9750 + (i // 8) * 1e-5
+        documents.append({
+            "plant_name": f"plant_{year}_{i}",
+            "genotype": f"genotype_{i % 5}",
+            "season": season,
+            "year": year,
+            "crop_type": CROP_TYPES[i % len(CROP_TYPES)],
+            "instrument": INSTRUMENTS[i % len(INSTRUMENTS)],
+            "scan_date": f"{year}06{1 + i % 4:02d}T1{i % 6}0000.000000-0700",
+            "plot": i // 4,
+            "loc": {"lat": lat, "lon": lon},
+            "nw_lat": lat + 5e-6, "nw_lon": lon - 5e-6, "se_lat": lat - 5e-6, "se_lon": lon + 5e-6,
+            "roi_temp": 30.0 + i % 7,
+            "bounding_area_m2": 0.2 + (i % 9) / 10,
+            "mean_tgi": 0.05 * (i % 11),
+            "q1_tgi": 0.03 * (i % 11),
+            "q3_tgi": 0.07 * (i % 11),
+            "file_path": f"/{year}/scan_{i % 4}.tar",
+            "file_size": 1000 + i,
+            "azmet_air_temp_max": 35.0 + i % 3,
+        })
+    return documents
+
+def weather_documents():
+    documents = []
+    for year in SEASONS:
+        for day in range(1, 5):
+            documents.append({
+                "date": f"{year}-06-{day:02d}", "azmet_year": year, "azmet_day_of_year": 152 + day,
+                "azmet_station_number": 6, "azmet_air_temp_max": 35.0 + day, "azmet_rh_mean": 40.0 + day
+            })
+    return documents
+
+class Fixture:
+    """
+    Answer the requests the dashboard sends (mappings, aliases, searches, multi-searches and
+    scrolls) from the synthetic data set. Aggregations are answered with buckets and values derived
+    from their definition, not computed from the documents: the fixture is for benchmarking the
+    dashboard, not for checking its numbers.
+    """
+    def __init__(self):
+        self.partitions = {
+            partition_name(PARTITION_PREFIX, year, season): plant_documents(year, season)
+            for year, season in SEASONS.items()
+        }
+        self.mapping = plant_mapping()
+        self.weather = weather_documents()
+        from build_rollup import RollupBuilder
+        builder = RollupBuilder()
+        for documents in self.partitions.values():
+            builder.add_documents(documents)
+        self.rollup = [action["_source"] for action in builder.actions()]
+
+    def _indices(self, name):
+        # The partitions an index name or alias resolves to
+        indices = []
+        for part in name.split(","):
+            if part in (INDEX_NAME, "_all", "*") or part.startswith(PARTITION_PREFIX + "y"):
+                indices += [index for index in self.partitions if part in (INDEX_NAME, "_all", "*", index)]
+        return indices
+
+    def _documents(self, name):
+        if name == AZMET_INDEX_NAME:
+            return self.weather
+        if name == ROLLUP_INDEX_NAME:
+            return self.rollup
+        return [document for index in self._indices(name) for document in self.partitions[index]]
+
+    def exists(self, name):
+        return name in (AZMET_INDEX_NAME, ROLLUP_INDEX_NAME) or bool(self._indices(name))
+
+    def mapping_of(self, name):
+        if name == AZMET_INDEX_NAME:
+            return {name: _load_mapping("azmet_mapping.json")}
+        if name == ROLLUP_INDEX_NAME:
+            mapping = _load_mapping("rollup_mapping.json")
+            mapping["mappings"]["_meta"] = {"source_generation": GENERATION}
+            return {name: mapping}
+        return {index: self.mapping for index in self._indices(name)}
+
+    def search(self, name, body, params):
+        documents = self._documents(name)
+        if "scroll" in params:
+            hits = documents
+        else:
+            hits = documents[:body.get("size", 10)]
+        includes = body.get("_source")
+        if isinstance(includes, dict):
+            includes = includes.get("includes")
+        if isinstance(includes, str):
+            includes = [includes]
+        if isinstance(includes, list):
+            hits = [{field: document[field] for field in includes if field in document} for document in hits]
+        elif includes is False:
+            hits = [{} for _ in hits]
+        response = {
+            "took": 1, "timed_out": False,
+            "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+            "hits": {
+                "total": {"value": len(documents), "relation": "eq"},
+                "hits": [{"_index": name, "_id": str(i), "_source": document} for i, document in enumerate(hits)]
+            }
+        }
+        if "scroll" in params:
+            response["_scroll_id"] = f"fixture-{name}"
+        aggs = body.get("aggs") or body.get("aggregations")
+        if aggs:
+            response["aggregations"] = {agg_name: self.aggregate(definition) for agg_name, definition in aggs.items()}
+        return response
+
+    def aggregate(self, definition, position=0):
+        kind = next(key for key in definition if key not in ("aggs", "aggregations", "meta"))
+        options = definition[kind]
+        subs = definition.get("aggs") or definition.get("aggregations") or {}
+
+        def bucket(**fields):
+            fields.update({name: self.aggregate(sub, position + len(fields)) for name, sub in subs.items()})
+            return fields
+
+        if kind == "terms":
+            keys = {"instrument": INSTRUMENTS, "crop_type": CROP_TYPES}.get(options.get("field"), ["a", "b"])
+            return {"buckets": [bucket(key=key, doc_count=5 + i) for i, key in enumerate(keys)]}
+        if kind == "date_histogram":
+            days = [f"{year}-06-{day:02d}" for year in SEASONS for day in range(1, 5)]
+            return {"buckets": [bucket(key_as_string=day, key=i, doc_count=5 + i) for i, day in enumerate(days)]}
+        if kind == "filter":
+            return bucket(doc_count=3)
+        if kind == "composite":
+            keys = {name: "a" for source in options["sources"] for name in source}
+            return {"buckets": [bucket(key=keys, doc_count=2)]}
+        if kind == "geotile_grid":
+            return {"buckets": [bucket(key=f"16/12345/{26000 + i}", doc_count=3 + i) for i in range(4)]}
+        if kind == "stats":
+            return {"count": 5, "min": 1.0, "max": 9.0, "avg": 4.0 + position, "sum": 20.0}
+        if kind == "percentiles":
+            return {"values": {str(float(percent)): 4.0 + position for percent in options.get("percents", [50])}}
+        if kind in ("avg", "max", "min", "sum", "cardinality", "value_count"):
+            return {"value": 2.0 + position}
+        if kind == "top_hits":
+            includes = options.get("_source", {}).get("includes", [])
+            return {"hits": {"hits": [{"_source": {field: 1.0 for field in includes}}]}}
+        if kind == "geo_bounds":
+            return {"bounds": {"top_left": {"lat": 33.0755, "lon": -111.9755},
+                               "bottom_right": {"lat": 33.0740, "lon": -111.9740}}}
+        if kind == "geo_centroid":
+            return {"location": {"lat": 33.0745, "lon": -111.9748}, "count": 3}
+        raise ValueError(f"The fixture does not support '{kind}' aggregations")
+
+    def respond(self, method, path, body):
+        """
+        Return the status and JSON response (None for no body) of a request.
+        """
+        parts = urlsplit(path)
+        segments = [unquote(segment) for segment in parts.path.strip("/").split("/") if segment]
+        params = dict(parse_qsl(parts.query))
+        name = segments[0] if segments and not segments[0].startswith("_") else INDEX_NAME
+        api = next((segment for segment in segments if segment.startswith("_")), None)
+
+        if api is None:
+            return (200 if self.exists(name) else 404), None
+        if not self.exists(name):
+            return 404, {"error": {"type": "index_not_found_exception", "reason": f"no such index [{name}]"}, "status": 404}
+        if api == "_mapping":
+            return 200, self.mapping_of(name)
+        if api == "_alias":
+            alias = segments[-1] if segments[-1] != "_alias" else INDEX_NAME
+            if alias != INDEX_NAME:
+                return 404, {"error": f"alias [{alias}] missing", "status": 404}
+            return 200, {index: {"aliases": {INDEX_NAME: {}}} for index in self._indices(name)}
+        if api == "_search" and segments[-1] == "scroll":
+            if method == "DELETE":
+                return 200, {"succeeded": True, "num_freed": 1}
+            return 200, {"_scroll_id": json.loads(body or "{}").get("scroll_id"), "hits": {"hits": []},
+                         "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0}}
+        if api == "_search":
+            return 200, self.search(name, json.loads(body) if body.strip() else {}, params)
+        if api == "_count":
+            return 200, {"count": len(self._documents(name))}
+        if api == "_msearch":
+            lines = [json.loads(line) for line in body.strip().split("\n") if line.strip()]
+            return 200, {"responses": [
+                dict(self.search(header.get("index", name), search, {}), status=200)
+                for header, search in zip(lines[::2], lines[1::2])
+            ]}
+        return 404, {"error": {"type": "unsupported", "reason": f"The fixture does not answer {method} {path}"}, "status": 404}
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = decode_body(self.rfile.read(length), self.headers.get("Content-Encoding"))
+        status, response = self.server.fixture.respond(self.command, self.path, body)
+        payload = json.dumps(response).encode("utf-8") if response is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+class FixtureServer(ThreadingHTTPServer):
+    """
+    A local OpenSearch stand-in serving the synthetic data set, to record a benchmark recording
+    without a cluster (see README.md).
+    """
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=9500):
+        super().__init__((host, port), FixtureHandler)
+        self.fixture = Fixture()
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        host, port = self.server_address[:2]
+        return f"{host}:{port}"
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        print("Usage: python benchmarks/fixture_server.py [port]")
+        sys.exit(1)
+    server = FixtureServer(port=int(sys.argv[1]) if len(sys.argv) == 2 else 9500)
+    print(f"Serving the benchmark fixture on {server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
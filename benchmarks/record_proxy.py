@@ -0,0 +1,87 @@
+# record_proxy.py
+import os
+import sys
+import ssl
+import urllib.request
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from recording import Recording, decode_body
+from app.client import parse_hosts
+from app.config import ELASTIC_HOSTS, ELASTIC_PORT, ELASTIC_USE_SSL
+
+# The cluster may use a self-signed certificate, as in app/client.py
+_ssl_context = ssl.create_default_context()
+_ssl_context.check_hostname = False
+_ssl_context.verify_mode = ssl.CERT_NONE
+
+class RecordingProxyHandler(BaseHTTPRequestHandler):
+    """
+    Forward every request to the upstream cluster and record the request/response pair.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length)
+        body = decode_body(raw, self.headers.get("Content-Encoding"))
+
+        headers = {"Content-Type": self.headers.get("Content-Type", "application/json")}
+        if self.headers.get("Authorization"):
+            headers["Authorization"] = self.headers["Authorization"]
+        request = urllib.request.Request(
+            self.server.upstream + self.path, data=body.encode("utf-8") if body else None,
+            headers=headers, method=self.command
+        )
+        try:
+            with urllib.request.urlopen(request, context=_ssl_context) as upstream:
+                status, content_type, payload = upstream.status, upstream.headers.get("Content-Type"), upstream.read()
+        except urllib.error.HTTPError as e:
+            status, content_type, payload = e.code, e.headers.get("Content-Type"), e.read()
+
+        self.server.recording.add(self.command, self.path, body, status, content_type, payload.decode("utf-8"))
+        self.send_response(status)
+        self.send_header("Content-Type", content_type or "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+class RecordingProxy(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, recording, upstream, host="127.0.0.1", port=9400):
+        super().__init__((host, port), RecordingProxyHandler)
+        self.recording = recording
+        self.upstream = upstream.rstrip("/")
+
+def default_upstream():
+    """
+    Return the URL of the first node configured for the dashboard (see app/config.py).
+    """
+    node = parse_hosts(ELASTIC_HOSTS, ELASTIC_PORT, scheme="https" if ELASTIC_USE_SSL else "http")[0]
+    return f"{node['scheme']}://{node['host']}:{node['port']}"
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3, 4):
+        print("Usage: python benchmarks/record_proxy.py <recording.jsonl> [port] [upstream url]")
+        sys.exit(1)
+    # Exchanges already in the file are kept; new ones are appended
+    path = sys.argv[1]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    recording = Recording.load(path) if os.path.exists(path) else Recording(path)
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 9400
+    upstream = sys.argv[3] if len(sys.argv) > 3 else default_upstream()
+    proxy = RecordingProxy(recording, upstream, port=port)
+    print(f"Recording requests to {upstream} through 127.0.0.1:{port} into {path}")
+    try:
+        proxy.serve_forever()
+    except KeyboardInterrupt:
+        pass
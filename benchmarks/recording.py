@@ -0,0 +1,81 @@
+# recording.py
+import gzip
+import json
+import threading
+from urllib.parse import urlsplit, parse_qsl
+
+def decode_body(raw, content_encoding=None):
+    """
+    Return a request body as text, decompressing it if the client gzipped it (http_compress).
+    """
+    if not raw:
+        return ""
+    if content_encoding == "gzip" or raw[:2] == b"\x1f\x8b":
+        raw = gzip.decompress(raw)
+    return raw.decode("utf-8")
+
+def canonical_body(body):
+    """
+    Normalize a JSON or NDJSON (e.g. _msearch, _bulk) body so that equivalent requests
+    serialized with a different key order or whitespace get the same key.
+    """
+    if not body.strip():
+        return ""
+    lines = []
+    for line in body.strip().split("\n"):
+        try:
+            lines.append(json.dumps(json.loads(line), sort_keys=True, separators=(",", ":")))
+        except ValueError:
+            # Not JSON (or a single document spread over several lines): parse it as a whole
+            try:
+                return json.dumps(json.loads(body), sort_keys=True, separators=(",", ":"))
+            except ValueError:
+                return body
+    return "\n".join(lines)
+
+def request_key(method, url, body):
+    """
+    Key a request by its method, path, sorted query parameters and canonical body.
+    """
+    parts = urlsplit(url)
+    params = "&".join(f"{k}={v}" for k, v in sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return f"{method.upper()} {parts.path}?{params}\n{canonical_body(body)}"
+
+class Recording:
+    """
+    Recorded OpenSearch request/response pairs, stored one JSON object per line.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.exchanges = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        recording = cls(path)
+        with open(path, "r") as file:
+            for line in file:
+                if line.strip():
+                    exchange = json.loads(line)
+                    recording.exchanges[request_key(exchange["method"], exchange["url"], exchange["body"])] = exchange
+        return recording
+
+    def add(self, method, url, body, status, content_type, response):
+        """
+        Store an exchange, appending it to the recording file if it is new.
+        """
+        key = request_key(method, url, body)
+        exchange = {
+            "method": method, "url": url, "body": body,
+            "status": status, "content_type": content_type, "response": response
+        }
+        with self._lock:
+            if key in self.exchanges:
+                return
+            self.exchanges[key] = exchange
+            if self.path:
+                with open(self.path, "a") as file:
+                    file.write(json.dumps(exchange) + "\n")
+
+    def find(self, method, url, body):
+        return self.exchanges.get(request_key(method, url, body))
@@ -0,0 +1,84 @@
+# replay_server.py
+import os
+import sys
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(__file__))
+from recording import Recording, decode_body
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """
+    Answer OpenSearch requests from a Recording. Requests that were not recorded get a 404
+    with an OpenSearch-style error body and are counted as misses.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = decode_body(self.rfile.read(length), self.headers.get("Content-Encoding"))
+        self.server.count_request(self.command, self.path)
+        exchange = self.server.recording.find(self.command, self.path, body)
+        if exchange is None:
+            self.server.count_miss(self.command, self.path)
+            status, content_type = 404, "application/json"
+            response = json.dumps({
+                "error": {"type": "replay_miss", "reason": f"No recorded response for {self.command} {self.path}"},
+                "status": 404
+            })
+        else:
+            status, content_type, response = exchange["status"], exchange["content_type"], exchange["response"]
+        payload = response.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type or "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+class ReplayServer(ThreadingHTTPServer):
+    """
+    A local stand-in for the OpenSearch cluster that replays a recording.
+    It counts the requests it serves, so a benchmark can report round trips per render.
+    """
+    daemon_threads = True
+
+    def __init__(self, recording, host="127.0.0.1", port=0):
+        super().__init__((host, port), ReplayHandler)
+        self.recording = recording
+        self.requests = 0
+        self.misses = []
+        self._counter_lock = threading.Lock()
+
+    def count_request(self, method, path):
+        with self._counter_lock:
+            self.requests += 1
+
+    def count_miss(self, method, path):
+        with self._counter_lock:
+            self.misses.append(f"{method} {path}")
+
+    def start(self):
+        """
+        Serve in a background thread and return the "host:port" to connect to.
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        host, port = self.server_address[:2]
+        return f"{host}:{port}"
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python benchmarks/replay_server.py <recording.jsonl> [port]")
+        sys.exit(1)
+    server = ReplayServer(Recording.load(sys.argv[1]), port=int(sys.argv[2]) if len(sys.argv) == 3 else 9400)
+    print(f"Replaying {len(server.recording.exchanges)} recorded requests on {server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,162 @@
+# run_benchmark.py
+import os
+import sys
+import json
+import time
+import datetime
+import argparse
+import resource
+import tracemalloc
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(BENCHMARK_DIR, "..", "app")
+sys.path.append(BENCHMARK_DIR)
+from recording import Recording
+from replay_server import ReplayServer
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Render the dashboard headlessly over a matrix of filters and report its performance.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--recording", help="replay this recording through a local stand-in server (no network needed)")
+    target.add_argument("--host", help="use this live node (\"host:port\"), e.g. the recording proxy")
+    parser.add_argument("--matrix", default=os.path.join(BENCHMARK_DIR, "matrix.json"), help="filter combinations to render")
+    parser.add_argument("--repeat", type=int, default=3, help="number of passes over the matrix")
+    parser.add_argument("--warmup", type=int, default=1, help="renders excluded from the results (at least 1)")
+    parser.add_argument("--mode", choices=["sequential", "concurrent"], help="panel execution mode (default: PANEL_EXECUTION)")
+    parser.add_argument("--no-cache", action="store_true", help="disable the dashboard's search cache")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report the peak of Python allocations (slower)")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="fail if renders/sec dropped by more than --tolerance compared to this results file")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    if args.warmup < 1:
+        # The filters are set through the sidebar widgets, which only exist once the page has rendered
+        parser.error("--warmup must be at least 1")
+    return args
+
+def configure_environment(args, host):
+    # Must happen before the app's config module is imported
+    os.environ["ELASTIC_HOSTS"] = host
+    os.environ["ELASTIC_USE_SSL"] = "false"
+    os.environ["ELASTIC_SNIFF"] = "false"
+    os.environ["METRICS_LOG_FILE"] = ""
+    os.environ["DEBUG_METRICS"] = "false"
+    if args.mode:
+        os.environ["PANEL_EXECUTION"] = args.mode
+    if args.no_cache:
+        os.environ["SEARCH_CACHE_MAX_ENTRIES"] = "0"
+    sys.path.insert(0, APP_DIR)
+
+def apply_filters(at, filters):
+    """
+    Set the sidebar filters of the AppTest to one combination of the matrix.
+    """
+    multiselects = {widget.label: widget for widget in at.sidebar.multiselect}
+    date_inputs = {widget.label: widget for widget in at.sidebar.date_input}
+    multiselects["Crop Type"].set_value(filters.get("crop_type", []))
+    multiselects["Sensor Type"].set_value(filters.get("sensor_type", []))
+    multiselects["Year"].set_value(filters.get("year", []))
+    date_inputs["Scan Date From"].set_value(datetime.date.fromisoformat(filters.get("from", "2018-01-01")))
+    date_inputs["Scan Date To"].set_value(datetime.date.fromisoformat(filters.get("to", "2030-12-31")))
+
+def percentiles(values):
+    if not values:
+        return {"p50_ms": None, "p95_ms": None}
+    return {"p50_ms": round(float(np.percentile(values, 50)), 1), "p95_ms": round(float(np.percentile(values, 95)), 1)}
+
+def run(args):
+    server = None
+    if args.recording:
+        server = ReplayServer(Recording.load(args.recording))
+        host = server.start()
+    else:
+        host = args.host
+    configure_environment(args, host)
+
+    from streamlit.testing.v1 import AppTest
+    with open(args.matrix, "r") as file:
+        matrix = json.load(file)
+
+    at = AppTest.from_file(os.path.join(APP_DIR, "main.py"), default_timeout=120)
+    for _ in range(args.warmup):
+        at.run()
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    render_times, round_trips, panel_times = [], [], {}
+    errors = 0
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for filters in matrix:
+            apply_filters(at, filters)
+            requests_before = server.requests if server else 0
+            render_start = time.perf_counter()
+            at.run()
+            render_times.append((time.perf_counter() - render_start) * 1000)
+
+            records = at.session_state["_render_metrics"]["records"]
+            if server:
+                round_trips.append(server.requests - requests_before)
+            else:
+                round_trips.append(sum(1 for r in records if r["kind"] in ("search", "msearch", "scroll")))
+            for r in records:
+                if r["kind"] == "panel":
+                    panel_times.setdefault(r["panel"], []).append(r["wall_ms"])
+            errors += len(at.exception) + len(at.warning)
+    elapsed = time.perf_counter() - start
+
+    results = {
+        "renders": len(render_times),
+        "renders_per_sec": round(len(render_times) / elapsed, 3),
+        "render": percentiles(render_times),
+        "round_trips_per_render": round(float(np.mean(round_trips)), 2) if round_trips else None,
+        "panels": {panel: percentiles(times) for panel, times in sorted(panel_times.items())},
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "errors": errors,
+        "replay_misses": sorted(set(server.misses)) if server else [],
+        "cache": not args.no_cache,
+        "mode": os.environ.get("PANEL_EXECUTION", "concurrent")
+    }
+    if args.tracemalloc:
+        results["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+        tracemalloc.stop()
+    if server:
+        server.shutdown()
+    return results
+
+def print_results(results):
+    print(f"Renders:                {results['renders']} ({results['mode']} panels, cache {'on' if results['cache'] else 'off'})")
+    print(f"Renders/sec:            {results['renders_per_sec']}")
+    print(f"Render latency:         p50 {results['render']['p50_ms']} ms, p95 {results['render']['p95_ms']} ms")
+    print(f"Round trips per render: {results['round_trips_per_render']}")
+    print(f"Peak RSS:               {results['peak_rss_mb']} MB")
+    if "peak_traced_mb" in results:
+        print(f"Peak traced allocations: {results['peak_traced_mb']} MB")
+    print("Panel latency:")
+    for panel, stats in results["panels"].items():
+        print(f"  {panel:<22} p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms")
+    if results["errors"]:
+        print(f"Errors/warnings shown:  {results['errors']}")
+    for miss in results["replay_misses"]:
+        print(f"Not in the recording:   {miss}")
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = run(args)
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+    status = 0
+    if results["errors"] or results["replay_misses"]:
+        status = 1
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+        if results["renders_per_sec"] < baseline["renders_per_sec"] * (1 - args.tolerance):
+            print(f"Regression: {results['renders_per_sec']} renders/sec, baseline {baseline['renders_per_sec']}")
+            status = 1
+    sys.exit(status)
@@ -5,13 +5,14 @@ The data is then uploaded to the OpenSearch index.
 
 from os import path
 import sys
-import json
 import os
 import re
 import tarfile
 import pandas as pd
 from dateutil.parser import parse
 from irods.session import iRODSSession
+from helper.manifest import Manifest
+from helper.parquet_output import write_records
 
 try:
     _IRODS_ENV_FILE = os.environ['IRODS_ENVIRONMENT_FILE']
@@ -66,7 +67,7 @@ def extract_csv_from_tar_file(irods_file_path: str) -> pd.DataFrame:
 
 def get_output(df: pd.DataFrame, irods_file_path: str) -> list:
     """
-    Saves the output as JSON to output/drone/
+    Returns the documents of the drone data of a tar file.
 
     Parameters:
     - df (pd.DataFrame): The data to save.
@@ -147,17 +148,24 @@ if __name__ == "__main__":
     parent_dir = sys.argv[1]
     # Get all the tar files in the parent directory
     tar_files = get_all_tar_files(parent_dir)
+    # Tar files processed by a previous run and unchanged since are skipped
+    manifest = Manifest()
 
-    for irods_file_path in tar_files:
-        # Extract the CSV file from the tar file
-        df = extract_csv_from_tar_file(irods_file_path)
-        # Get the output
-        data = get_output(df, irods_file_path)
-
-        # Save the output as JSON
-        output_filename = f"{path.basename(irods_file_path)}.json"
-        os.makedirs(output_folder, exist_ok=True)
-        with open(path.join(output_folder, output_filename), "w", encoding="utf-8") as file:
-            json.dump(data, file, indent=4, ensure_ascii=False)
+    with iRODSSession(irods_env_file=_IRODS_ENV_FILE) as session:
+        for irods_file_path in tar_files:
+            fingerprint = manifest.fingerprint(session, irods_file_path)
+            if manifest.is_unchanged(irods_file_path, fingerprint):
+                print(f"Skipping {irods_file_path}: unchanged since it was last processed")
+                continue
+            # Extract the CSV file from the tar file
+            df = extract_csv_from_tar_file(irods_file_path)
+            # Get the output
+            data = get_output(df, irods_file_path)
+            if data is None:
+                continue
+
+            # Save the output to the Parquet dataset
+            output_paths = write_records(data, path.basename(irods_file_path), "drone", output_folder)
+            manifest.record(irods_file_path, fingerprint, output_paths)
 
 # /iplant/home/shared/phytooracle/season_14_sorghum_yr_2022/level_2/drone/sorghum/
@@ -1,5 +1,19 @@
-import json
+"""
+Parse AZMET daily weather files (.ext/.txt exports, one comma-separated line per station-day)
+into typed JSON files, one per year, in azmet_output/:
+
+    python3 data_preparation/helper/azmet.py <file.txt> [<file.txt> ...] [--output-dir azmet_output]
+
+Every file and station is parsed in a single pass. Values are converted to numbers, and AZMET's
+missing-value sentinels (e.g. 999) are written as null, so the weather fields can be aggregated
+as numbers once uploaded.
+"""
+import os
+import io
 import re
+import json
+import argparse
+import pandas as pd
 
 # Define column names in snake_case
 COLUMN_NAMES = [
@@ -14,34 +28,76 @@ COLUMN_NAMES = [
     "etos_reference", "actual_vapor_pressure_mean",
     "dewpoint_mean"
 ]
+# Columns identifying a station-day, stored as integers
+KEY_COLUMNS = ["year", "day_of_year", "station_number"]
+# Values AZMET reports when a sensor has no reading
+MISSING_VALUES = [999, 9999, -999, -9999]
 
-def parse_ext_file(file_path):
-    """Parses the .ext file and converts it to structured JSON format."""
-    data_entries = []
+# Data lines start with a 4-digit year
+_data_line = re.compile(r"^\s*\d{4},")
 
-    with open(file_path, "r") as file:
-        lines = file.readlines()
+def to_numeric(df):
+    """
+    Return the AZMET data with numeric columns: the key columns as nullable integers, the
+    measurements as floats, with unparseable values and missing-value sentinels as NaN.
+    """
+    df = df.apply(pd.to_numeric, errors="coerce")
+    measurements = [col for col in df.columns if col not in KEY_COLUMNS]
+    df[measurements] = df[measurements].astype(float).mask(df[measurements].isin(MISSING_VALUES))
+    for col in KEY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].round().astype("Int64")
+    return df
 
-    for line in lines:
-        # Extract numerical data from each line
-        line = line.strip()
-        if line and re.match(r"^\d{4},", line):  # Line starts with a 4-digit year
-            values = line.split(",")
-            if len(values) >= len(COLUMN_NAMES):
-                entry = {COLUMN_NAMES[i]: values[i] for i in range(len(COLUMN_NAMES))}
-                data_entries.append(entry)
+def parse_ext_files(file_paths):
+    """
+    Parse AZMET files into one typed DataFrame with a row per station-day. Header lines and
+    lines with too few values are skipped; a station-day present in several files keeps its
+    last version.
+    """
+    lines = []
+    for file_path in file_paths:
+        with open(file_path, "r") as file:
+            lines.extend(line.strip() for line in file if _data_line.match(line))
+    # Keep the lines with at least one value per column, like the files' documented layout
+    lines = [line for line in lines if line.count(",") >= len(COLUMN_NAMES) - 1]
+    if not lines:
+        return pd.DataFrame(columns=COLUMN_NAMES)
+    df = pd.read_csv(io.StringIO("\n".join(lines)), header=None, names=COLUMN_NAMES,
+                     usecols=range(len(COLUMN_NAMES)), dtype=str)
+    df = to_numeric(df).dropna(subset=KEY_COLUMNS)
+    return df.drop_duplicates(subset=KEY_COLUMNS, keep="last").sort_values(KEY_COLUMNS, ignore_index=True)
 
-    return data_entries
+def to_records(df):
+    """
+    Return the rows of df as dicts of plain Python values, with None for missing values.
+    """
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
 
 def save_json(data, output_file):
     """Saves parsed data as a JSON file."""
     with open(output_file, "w") as json_file:
         json.dump(data, json_file, indent=4)
 
-# Example usage
-input_file = "/home/tanmayagrawal21/Downloads/0623rd.txt"  # Replace with actual file path
-data = parse_ext_file(input_file)
-# extract year from data 
-year = data[0].get("year")
-output_file = f"azmet_output/{year}.json"
-save_json(data, output_file)
+def save_years(df, output_dir="azmet_output"):
+    """
+    Write the station-days of each year to <output_dir>/<year>.json. Returns the files written.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    output_files = []
+    for year, rows in df.groupby("year"):
+        output_file = os.path.join(output_dir, f"{year}.json")
+        save_json(to_records(rows), output_file)
+        output_files.append(output_file)
+    return output_files
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert AZMET daily weather files to typed JSON files, one per year.")
+    parser.add_argument("files", nargs="+", help="AZMET daily data files (e.g. 0623rd.txt)")
+    parser.add_argument("--output-dir", default="azmet_output", help="Directory of the <year>.json files")
+    args = parser.parse_args()
+
+    data = parse_ext_files(args.files)
+    for output_file in save_years(data, args.output_dir):
+        print(f"Wrote {output_file}")
+    print(f"Parsed {len(data)} station-days from {len(args.files)} files.")
@@ -0,0 +1,92 @@
+"""
+A local manifest of the inputs already processed by the data preparation scripts.
+
+Each entry is keyed by the iRODS path of an input and records its fingerprint (size, modify time
+and iRODS checksum, together with those of the inputs it depends on, e.g. the fieldbook) and the
+output files produced from it. A script skips an input whose fingerprint has not changed since
+its outputs were written, so only new or changed outputs reach search_configuration/upload_data.py.
+
+Delete the manifest file to process everything again.
+"""
+import os
+import json
+import threading
+from irods.exception import DataObjectDoesNotExist
+
+MANIFEST_FILE = os.getenv("PREPARATION_MANIFEST", "preparation_manifest.json")
+
+def irods_fingerprint(session, irods_path):
+    """
+    Return the size, modify time and checksum of an iRODS data object, or None if it does not exist.
+    """
+    try:
+        obj = session.data_objects.get(irods_path)
+    except DataObjectDoesNotExist:
+        return None
+    return {
+        "size": obj.size,
+        "modify_time": obj.modify_time.isoformat() if obj.modify_time else None,
+        "checksum": obj.checksum
+    }
+
+def file_fingerprint(file_path):
+    """
+    Return the size and modify time of a local file, or None if it does not exist.
+    """
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return {"size": stat.st_size, "modify_time": stat.st_mtime_ns}
+
+class Manifest:
+    """
+    The processed inputs, loaded from and saved to a JSON file. Safe to share between threads.
+    """
+    def __init__(self, manifest_file=MANIFEST_FILE):
+        self.manifest_file = manifest_file
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(manifest_file):
+            with open(manifest_file, "r") as file:
+                self.entries = json.load(file)
+
+    def fingerprint(self, session, irods_path, dependencies=()):
+        """
+        Return the fingerprint of an iRODS input and of the iRODS inputs it depends on,
+        or None if the input does not exist.
+        """
+        fingerprint = irods_fingerprint(session, irods_path)
+        if fingerprint is None:
+            return None
+        if dependencies:
+            fingerprint["dependencies"] = {path: irods_fingerprint(session, path) for path in dependencies}
+        return fingerprint
+
+    def is_unchanged(self, key, fingerprint):
+        """
+        Return True if key was processed with the same fingerprint and its outputs still exist.
+        """
+        if fingerprint is None:
+            return False
+        with self._lock:
+            entry = self.entries.get(key)
+        return (entry is not None and entry["fingerprint"] == fingerprint and
+                all(os.path.exists(output) for output in entry["outputs"]))
+
+    def record(self, key, fingerprint, outputs):
+        """
+        Record that key was processed with the given fingerprint into outputs, and save the manifest.
+        """
+        if fingerprint is None:
+            return
+        with self._lock:
+            self.entries[key] = {"fingerprint": fingerprint, "outputs": list(outputs)}
+            self._save()
+
+    def _save(self):
+        # Write a new file and swap it in, so an interrupted run never leaves a truncated manifest
+        temporary_file = f"{self.manifest_file}.tmp"
+        with open(temporary_file, "w") as file:
+            json.dump(self.entries, file, indent=4, sort_keys=True)
+        os.replace(temporary_file, self.manifest_file)
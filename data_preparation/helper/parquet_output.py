@@ -0,0 +1,178 @@
+"""
+The output files of the data preparation scripts, as one Parquet dataset partitioned by season,
+instrument and scan day (Hive-style directories under output/parquet/):
+
+    output/parquet/season=14/instrument=flirIrCamera/scan_day=2022-05-12/flir_ir_camera_14_sorghum_2.parquet
+
+The partition fields are stored in the directory names only. Each file is a columnar,
+zstd-compressed table with the schema of its sensor, so the dataset can also be read directly
+for offline analysis, e.g. pyarrow.dataset.dataset("output/parquet", partitioning="hive").
+search_configuration/upload_data.py streams the record batches of each file into bulk requests.
+
+Set OUTPUT_FORMAT=json to write pretty-printed JSON arrays to the sensor directories instead.
+"""
+import os
+import glob
+import json
+from urllib.parse import quote, unquote
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "parquet")
+PARQUET_ROOT = os.path.join("output", "parquet")
+
+# The Hive partitions of the dataset. season and instrument are document fields; scan_day
+# (yyyy-MM-dd) is the local day of scan_date and only names the directory.
+PARTITION_SCHEMA = pa.schema([("season", pa.int32()), ("instrument", pa.string()), ("scan_day", pa.string())])
+DOCUMENT_PARTITIONS = ["season", "instrument"]
+# Directory name of a null partition value
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+_COMMON_FIELDS = [
+    ("year", pa.int64()),
+    ("level", pa.int64()),
+    ("crop_type", pa.string()),
+    ("scan_date", pa.string()),
+    ("sensor", pa.string()),
+    ("genotype", pa.string()),
+    ("plant_name", pa.string()),
+]
+_CAMERA_FIELDS = [
+    ("lat", pa.float64()),
+    ("lon", pa.float64()),
+    ("loc", pa.struct([("lat", pa.float64()), ("lon", pa.float64())])),
+    ("file_path", pa.string()),
+    ("file_size", pa.int64()),
+]
+
+# Types of the fields set by each script; the other columns (read from the sensor CSVs) keep the
+# type inferred from their values
+SCHEMAS = {
+    "drone": pa.schema(_COMMON_FIELDS + [
+        ("gantry_location", pa.string()),
+        ("drone_type", pa.string()),
+        ("altitude_m", pa.int64()),
+        ("camera_type", pa.string()),
+        ("rep", pa.int64()),
+    ]),
+    "flirIrCamera": pa.schema(_COMMON_FIELDS + _CAMERA_FIELDS + [("roi_temp", pa.float64())]),
+    "stereoTop": pa.schema(_COMMON_FIELDS + _CAMERA_FIELDS),
+    "scanner3DTop": pa.schema(_COMMON_FIELDS + [
+        ("species", pa.string()),
+        ("accession", pa.string()),
+        ("fieldbook_file_path", pa.string()),
+        ("fieldbook_file_size", pa.int64()),
+        ("entropy_file_name", pa.string()),
+        ("entropy_file_size", pa.int64()),
+        ("id", pa.string()),
+    ]),
+}
+
+def _text(value):
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    return value if isinstance(value, str) else str(value)
+
+def _column(name, values, field_type=None):
+    # Convert a column to the type of the schema (numbers written as text are parsed, and text
+    # that is not a number becomes null), or infer it; a column mixing types is written as text
+    try:
+        if field_type is not None and (pa.types.is_integer(field_type) or pa.types.is_floating(field_type)):
+            values = pd.to_numeric(values, errors="coerce")
+        elif field_type is not None and pa.types.is_string(field_type):
+            values = values.map(_text)
+        return pa.array(values, type=field_type, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        print(f"Column '{name}' does not fit its type; writing it as text.")
+        return pa.array(values.map(_text), type=pa.string(), from_pandas=True)
+
+def _scan_day(scan_date):
+    # e.g. 20220512T000000.000000-0700 -> 2022-05-12
+    if not isinstance(scan_date, str) or len(scan_date) < 8 or not scan_date[:8].isdigit():
+        return None
+    return f"{scan_date[:4]}-{scan_date[4:6]}-{scan_date[6:8]}"
+
+def to_table(records, schema):
+    """
+    Return the records as a table with the partition columns and the fields of schema typed.
+    """
+    df = pd.DataFrame.from_records(records)
+    df["scan_day"] = df["scan_date"].map(_scan_day) if "scan_date" in df.columns else None
+    columns = {}
+    for name in df.columns:
+        if name in PARTITION_SCHEMA.names:
+            field_type = PARTITION_SCHEMA.field(name).type
+        else:
+            field_type = schema.field(name).type if name in schema.names else None
+        columns[name] = _column(name, df[name], field_type)
+    for name in PARTITION_SCHEMA.names:
+        if name not in columns:
+            columns[name] = pa.nulls(len(df), PARTITION_SCHEMA.field(name).type)
+    return pa.table(columns)
+
+def write_records(records, name, sensor, json_dir):
+    """
+    Write the documents produced from one input, replacing those previously written under name.
+    Returns the paths of the files written (one per partition), to be recorded in the manifest.
+    With OUTPUT_FORMAT=json, the documents are written to json_dir/name.json instead.
+    """
+    # The documents of name are written in one format only: files left by a previous run in the
+    # other format (or in other partitions, e.g. after a scan day was removed) are deleted, so
+    # search_configuration/upload_data.py never reads the same documents twice
+    file_name = f"{name}.parquet"
+    for stale_path in glob.glob(os.path.join(PARQUET_ROOT, "**", glob.escape(file_name)), recursive=True):
+        os.remove(stale_path)
+    json_path = os.path.join(json_dir, f"{name}.json")
+    if OUTPUT_FORMAT == "json":
+        os.makedirs(json_dir, exist_ok=True)
+        with open(json_path, "w", encoding="utf-8") as file:
+            json.dump(records, file, indent=4, ensure_ascii=False)
+        return [json_path]
+
+    if os.path.exists(json_path):
+        os.remove(json_path)
+    if not records:
+        return []
+    table = to_table(records, SCHEMAS[sensor])
+    rows = {}
+    for position, values in enumerate(table.select(PARTITION_SCHEMA.names).to_pylist()):
+        directory = os.path.join(PARQUET_ROOT, *(
+            f"{key}={NULL_PARTITION if value is None else quote(str(value), safe='')}" for key, value in values.items()
+        ))
+        rows.setdefault(directory, []).append(position)
+    written = []
+    for directory, positions in rows.items():
+        os.makedirs(directory, exist_ok=True)
+        output_path = os.path.join(directory, file_name)
+        pq.write_table(table.take(positions).drop_columns(PARTITION_SCHEMA.names), output_path, compression="zstd")
+        written.append(output_path)
+    return sorted(written)
+
+def partition_values(parquet_path):
+    """
+    Return the document fields stored in the directory names of a file of the dataset.
+    """
+    values = {}
+    for part in os.path.normpath(os.path.dirname(parquet_path)).split(os.sep):
+        key, separator, value = part.partition("=")
+        value = unquote(value)
+        if not separator or key not in DOCUMENT_PARTITIONS:
+            continue
+        if value == NULL_PARTITION:
+            values[key] = None
+        elif pa.types.is_integer(PARTITION_SCHEMA.field(key).type):
+            values[key] = int(value)
+        else:
+            values[key] = value
+    return values
+
+def iter_records(parquet_path, batch_size=5000):
+    """
+    Yield the documents of a file of the dataset, reading it one record batch at a time.
+    """
+    partition = partition_values(parquet_path)
+    for batch in pq.ParquetFile(parquet_path).iter_batches(batch_size=batch_size):
+        for record in batch.to_pylist():
+            record.update(partition)
+            yield record
@@ -1,19 +1,26 @@
 """
 This script combines information from a fieldbook file with an entropy tar file, producing a unified
 JSON file for indexing a single scan date. To cover all scan dates, execute this script multiple
-times and changing the entropy_file_path argument.
+times and changing the entropy_file_path argument, or run data_preparation/scanner3D.py, which
+processes every scan date of a directory in-process with a shared fieldbook.
 """
 
 from os import path
 import sys
 # import csv
 import re
-import json
 import os
 import tarfile
-import tempfile
+from contextlib import contextmanager
 import pandas as pd
 from irods.session import iRODSSession
+try:
+    from helper.manifest import Manifest
+    from helper.parquet_output import write_records
+except ModuleNotFoundError:
+    # Run as a script from data_preparation/helper
+    from manifest import Manifest
+    from parquet_output import write_records
 
 try:
     _IRODS_ENV_FILE = os.environ['IRODS_ENVIRONMENT_FILE']
@@ -21,16 +28,28 @@ except KeyError:
     _IRODS_ENV_FILE = path.expanduser('~/.irods/irods_environment.json')
 
 
+@contextmanager
+def _irods_session(session=None):
+    # Use the caller's session (each worker of data_preparation/scanner3D.py has its own), or open
+    # one for this call
+    if session is not None:
+        yield session
+    else:
+        with iRODSSession(irods_env_file=_IRODS_ENV_FILE) as session:
+            yield session
+
+
 # NOTE: This is supposed to be a temporary implemenation. The final implementation should use the simpler csv module.
 # For some reason, currently, the csv module is claiming that the file has been provided as a binary file, not string. 
 # This is a workaround to get the data from the file - so we can focus on the main task.
-def parse_fieldbook_csv_file(fieldbook_csv_path: str) -> dict:
+def parse_fieldbook_csv_file(fieldbook_csv_path: str, session=None) -> dict:
     """
     Parses the fieldbook CSV file into a dictionary with plant names as keys.
     Each value is a dictionary that contains details about the plant's fieldbook data.
 
     Parameters:
     - fieldbook_csv_path (str): The file path to the CSV file to be parsed from iRODS.
+    - session (iRODSSession): The session to read it with (a new one if not given).
 
     Returns:
         A dictionary with plant names as keys and a dictionary of their corresponding fieldbook
@@ -40,7 +59,7 @@ def parse_fieldbook_csv_file(fieldbook_csv_path: str) -> dict:
 
     try:
         # Access the file using iRODS
-        with iRODSSession(irods_env_file=_IRODS_ENV_FILE) as session:
+        with _irods_session(session) as session:
             with session.data_objects.open(fieldbook_csv_path, 'r') as csv_file:
                 # Use pandas to read the CSV content
                 df = pd.read_csv(csv_file, sep=",")  # Adjust the separator if needed
@@ -119,43 +138,33 @@ def parse_fieldbook_csv_file(fieldbook_csv_path: str) -> dict:
         print(f"An unexpected error occurred: {e}")
         return {}
 
-def download_and_extract_entropy_tar_file(irods_file_path: str) -> list[str]:
+def download_and_extract_entropy_tar_file(irods_file_path: str, session=None) -> list[str]:
     """
-    Downloads a tar file from an iRODS collection, extracts it, and returns a list containing the
-    file names inside the tar file.
+    Reads a tar file from an iRODS collection and returns the names and sizes of the files
+    inside it.
 
     Parameters:
     - irods_file_path (str): The iRODS path to the tar file.
-    - irods_env_file (str): Path to the iRODS environment file.
+    - session (iRODSSession): The session to read it with (a new one if not given).
 
     Returns:
     - file_names (list[string]): List containing the file names inside the tar file.
+    - file_sizes (list[int]): List containing the sizes of those files.
     """
-    with iRODSSession(irods_env_file=_IRODS_ENV_FILE) as session:
-        with tempfile.TemporaryDirectory() as tmpdir_name:
-            local_tar_path = os.path.join(tmpdir_name, "entropy_tar.tar")
-            obj = session.data_objects.get(irods_file_path)
-            replica = None
-            for r in obj.replicas:
-                if r.status.isnumeric() and int(r.status) == 1:
-                    replica = r
-                    break
-            # Read data from the iRODS object into a buffer
-            data_buffer = bytearray(replica.size)
-            num_bytes_read = obj.open('r').readinto(data_buffer)
-            if num_bytes_read != replica.size:
-                raise RuntimeError("Failed to read the entropy tar file, Exiting!!")
-            # Write the buffer to the temporary file
-            with open(local_tar_path, 'wb') as temp_file:
-                temp_file.write(data_buffer)
-            # Open the downloaded tar file, extract its contents, and list the names of the files
-            # inside
-            with tarfile.open(local_tar_path) as tar:
-                tar.extractall(path=tmpdir_name)
-                file_names = tar.getnames()  # List the file names after extracting
-                file_sizes = [tar.getmember(file_name).size for file_name in file_names]
-
-        return file_names, file_sizes
+    file_names, file_sizes = [], []
+    with _irods_session(session) as session:
+        # Only the member headers are needed: the tar file is streamed from iRODS and the
+        # contents of its members are skipped, so it is never held in memory or on disk
+        with session.data_objects.open(irods_file_path, 'r') as tar_file:
+            try:
+                with tarfile.open(fileobj=tar_file, mode="r|") as tar:
+                    for member in tar:
+                        file_names.append(member.name)
+                        file_sizes.append(member.size)
+            except tarfile.ReadError as e:
+                raise RuntimeError(f"Failed to read the entropy tar file ({e}), Exiting!!")
+
+    return file_names, file_sizes
 
 
 def parse_url_details(url: str) -> dict:
@@ -279,15 +288,33 @@ def _parse_entropy_tar_file(fieldbook_dict, csv_file_names, parsed_url):
             print(f"Ignoring {plant_name}")
 
     print(f"Null rows: {null_rows}")
-    # Create the output directory if it doesn't exist
+    # Writing the combined information to the Parquet dataset to be index ready by OpenSearch
     output_dir = "output/Scanner3DTop"
-    os.makedirs(output_dir, exist_ok=True)
+    return write_records(json_list, f"combined_plants_info_{scan_date}", "scanner3DTop", output_dir)
+
+
+def process_scan_date(fieldbook_dict: dict, entropy_file_path: str, session=None) -> list[str]:
+    """
+    Parameters:
+    - fieldbook_dict: The parsed fieldbook (see parse_fieldbook_csv_file), only read
+    - entropy_file_path: Absolute path of the entropy.tar file corresponding to a scan date in iRODS
+    - session: The iRODS session to download the tar file with (a new one if not given)
 
-    # Writing the combined information to a JSON file to be index ready by OpenSearch
-    with open(
-        path.join(output_dir, f"combined_plants_info_{scan_date}.json"), 'w', encoding='utf-8'
-    ) as json_file:
-        json.dump(json_list, json_file, indent=4)
+    Returns:
+    - The paths of the output files written for the scan date
+    """
+    # Parse the entropy file
+    csv_file_names = download_and_extract_entropy_tar_file(entropy_file_path, session)
+    # Pretty print the first 5 entries of the csv file names
+    print("First 5 entries of the csv file names:")
+    print(csv_file_names[0][:5])
+    # Parse the URL
+    parsed_url = parse_url_details(entropy_file_path)
+    # Pretty print the parsed URL
+    print("Parsed URL:")
+    print(parsed_url)
+    # # Combine everything above
+    return _parse_entropy_tar_file(fieldbook_dict, csv_file_names, parsed_url)
 
 
 def main(fieldbook_csv_path: str, entropy_file_path: str) -> None:
@@ -298,8 +325,12 @@ def main(fieldbook_csv_path: str, entropy_file_path: str) -> None:
 
     Returns:
     - None
-    Generates output/file.json file after successful completion of the script
+    Generates output/parquet/ files after successful completion of the script
     """
+    # Fingerprint the inputs before reading them, so a change made meanwhile is picked up next time
+    manifest = Manifest()
+    with iRODSSession(irods_env_file=_IRODS_ENV_FILE) as session:
+        fingerprint = manifest.fingerprint(session, entropy_file_path, dependencies=[fieldbook_csv_path])
     # Parse the fieldbook
     fieldbook_dict = parse_fieldbook_csv_file(fieldbook_csv_path)
     # Print all keys
@@ -307,18 +338,8 @@ def main(fieldbook_csv_path: str, entropy_file_path: str) -> None:
     print(fieldbook_dict.keys())
 
     # print(fieldbook_dict)
-    # Parse the entropy file
-    csv_file_names = download_and_extract_entropy_tar_file(entropy_file_path)
-    # Pretty print the first 5 entries of the csv file names
-    print("First 5 entries of the csv file names:")
-    print(csv_file_names[:5])
-    # Parse the URL
-    parsed_url = parse_url_details(entropy_file_path)
-    # Pretty print the parsed URL
-    print("Parsed URL:")
-    print(parsed_url)
-    # # Combine everything above
-    _parse_entropy_tar_file(fieldbook_dict, csv_file_names, parsed_url)
+    output_paths = process_scan_date(fieldbook_dict, entropy_file_path)
+    manifest.record(entropy_file_path, fingerprint, output_paths)
 
 
 if __name__ == "__main__":
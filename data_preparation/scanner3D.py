@@ -1,49 +1,108 @@
 import os
 import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from irods.session import iRODSSession
-from irods.exception import CollectionDoesNotExist, DataObjectDoesNotExist
+from irods.exception import CollectionDoesNotExist
+from helper.manifest import Manifest
+from helper.scanner3D import parse_fieldbook_csv_file, process_scan_date
 
-def run_script_on_files(fieldbook_csv_path, directory):
+# Scan dates processed at once; each worker streams the entropy tar file of its scan date
+DEFAULT_WORKERS = int(os.getenv("SCANNER3D_WORKERS", "4"))
+
+def _process(irods_env_file, manifest, fieldbook_dict, fingerprint, file_path):
+    # Returns the status of one scan date; a failure does not stop the other scan dates.
+    # Each scan date is read with its own iRODS session, so the workers share no connection.
+    try:
+        print(f"Running script on {file_path}")
+        with iRODSSession(irods_env_file=irods_env_file) as session:
+            output_paths = process_scan_date(fieldbook_dict, file_path, session)
+        manifest.record(file_path, fingerprint, output_paths)
+        return "done"
+    except Exception as e:
+        print(f"An error occurred while running the script on {file_path}: {e}")
+        return f"failed: {e}"
+
+def run_script_on_files(fieldbook_csv_path, directory, workers=DEFAULT_WORKERS):
+    """
+    Process the entropy tar file of every scan date of directory in a pool of workers. The
+    fieldbook is parsed once and shared by the workers, which each open their own iRODS session.
+    Returns the status of each scan date ("done", "skipped" or "failed: <error>").
+    """
     # Get iRODS environment file
     try:
         irods_env_file = os.environ['IRODS_ENVIRONMENT_FILE']
     except KeyError:
         irods_env_file = os.path.expanduser('~/.irods/irods_environment.json')
 
+    # Tar files processed with the same fieldbook by a previous run and unchanged since are skipped
+    manifest = Manifest()
+    statuses = {}
+
     try:
         # Start iRODSSession to handle iRODS interaction
         with iRODSSession(irods_env_file=irods_env_file) as session:
             # Access the specified directory in iRODS
             collection = session.collections.get(directory)
             print(f"Accessed directory {directory}")
-            # Loop through each data object (file) in the collection
+            # Fingerprint the inputs before reading them, so a change made meanwhile is picked up next time
+            pending = []
             for obj in collection.subcollections:
                 file_path = os.path.join(directory, obj.name)
                 file_name = file_path.split("/")[-1] + "_3d_volumes_entropy_v009.tar"
                 file_path+= "/individual_plants_out/"
                 file_path+= file_name
-                try: 
-                    # Run the script on the file
-                    print(f"Running script on {file_path}")
-                    os.system(f"python3 data_preparation/helper/scanner3D.py {fieldbook_csv_path} {file_path}")
-                except Exception as e:
-                    print(f"An error occurred while running the script on {file_path}: {e}")
+                fingerprint = manifest.fingerprint(session, file_path, dependencies=[fieldbook_csv_path])
+                if manifest.is_unchanged(file_path, fingerprint):
+                    print(f"Skipping {file_path}: unchanged since it was last processed")
+                    statuses[file_path] = "skipped"
+                    continue
+                pending.append((fingerprint, file_path))
+            if not pending:
+                return statuses
+
+            # Parse the fieldbook once for every scan date
+            fieldbook_dict = parse_fieldbook_csv_file(fieldbook_csv_path, session)
+            if not fieldbook_dict:
+                for _, file_path in pending:
+                    statuses[file_path] = "failed: the fieldbook could not be parsed"
+                return statuses
+
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scanner3D") as executor:
+                futures = {
+                    file_path: executor.submit(_process, irods_env_file, manifest, fieldbook_dict, fingerprint, file_path)
+                    for fingerprint, file_path in pending
+                }
+            for file_path, future in futures.items():
+                statuses[file_path] = future.result()
 
     except CollectionDoesNotExist:
         print(f"The directory {directory} does not exist in iRODS.")
         sys.exit(1)
 
+    return statuses
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Process every scanner3DTop scan date of an iRODS directory.")
+    parser.add_argument("fieldbook_csv_path", help="absolute path of the fieldbook CSV file in iRODS")
+    parser.add_argument("irods_directory_path", help="iRODS directory holding one subcollection per scan date")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="number of scan dates processed at once (default: SCANNER3D_WORKERS or 4)")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python script.py <fieldbook_csv_path> <irods_directory_path>")
-        sys.exit(1)
+    args = parse_args()
 
-    fieldbook_csv_path = sys.argv[1]
-    irods_directory_path = sys.argv[2]
+    statuses = run_script_on_files(args.fieldbook_csv_path, args.irods_directory_path, max(1, args.workers))
 
-    run_script_on_files(fieldbook_csv_path, irods_directory_path)
+    print("Status per scan date:")
+    for file_path, status in statuses.items():
+        print(f"  {status:<8} {file_path}")
+    # Exit with an error if any scan date failed, so callers can tell
+    if any(status.startswith("failed") for status in statuses.values()):
+        sys.exit(1)
 
 
 
 # python3 data_preparation/scanner3D.py /iplant/home/shared/phytooracle/season_14_sorghum_yr_2022/North_gantry_fieldbook_2022_replants.csv /iplant/home/shared/phytooracle/season_14_sorghum_yr_2022/level_2/scanner3DTop/sorghum/
-# python3 data_preparation/scanner3D.py /iplant/home/shared/phytooracle/season_11_sorghum_yr_2020/Gantry_fieldbook_Aug-2020_Revised_Irr_TRT.csv /iplant/home/shared/phytooracle/season_11_sorghum_yr_2020/level_2/scanner3DTop/
\ No newline at end of file
+# python3 data_preparation/scanner3D.py /iplant/home/shared/phytooracle/season_11_sorghum_yr_2020/Gantry_fieldbook_Aug-2020_Revised_Irr_TRT.csv /iplant/home/shared/phytooracle/season_11_sorghum_yr_2020/level_2/scanner3DTop/
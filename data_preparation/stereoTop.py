@@ -5,11 +5,12 @@ The data is then uploaded to the OpenSearch index.
 
 from os import path
 import sys
-import json
 import os
 import re
 import pandas as pd
 from irods.session import iRODSSession
+from helper.manifest import Manifest
+from helper.parquet_output import write_records
 
 try:
     _IRODS_ENV_FILE = os.environ['IRODS_ENVIRONMENT_FILE']
@@ -112,21 +113,26 @@ def main(ir_csv_path: str) -> None:
     - ir_csv_path (str): The path to the CSV file from the FLIR IR camera.
     """
 
+    # Skip the CSV file if it is unchanged since it was last processed
+    manifest = Manifest()
+    with iRODSSession(irods_env_file=_IRODS_ENV_FILE) as session:
+        fingerprint = manifest.fingerprint(session, ir_csv_path)
+    if manifest.is_unchanged(ir_csv_path, fingerprint):
+        print(f"Skipping {ir_csv_path}: unchanged since it was last processed")
+        return
+
     # Parse the CSV file
     data = parse_clustering_csv_file(ir_csv_path)
     url_details = parse_url_details(ir_csv_path)
     data = [dict(data_point, **url_details) for data_point in data]
 
-    # Save the data to a file
+    # Save the data to the Parquet dataset
     output_dir = "output/stereoTop"
-    if not path.exists(output_dir):
-        os.makedirs(output_dir)
-
-    output_path = path.join(output_dir, f"stereoTop.json_{url_details['season']}_{url_details['crop_type']}_{url_details['level']}.json")
-    with open(output_path, "w", encoding="utf-8") as file:
-        json.dump(data, file, indent=4)
+    output_name = f"stereoTop.json_{url_details['season']}_{url_details['crop_type']}_{url_details['level']}"
+    output_paths = write_records(data, output_name, "stereoTop", output_dir)
 
-    print(f"Data saved to {output_path}")
+    manifest.record(ir_csv_path, fingerprint, output_paths)
+    print(f"Data saved to {len(output_paths)} files")
 
 
 if __name__ == "__main__":
@@ -148,7 +148,12 @@ if [ "${UPDATE_DATA,,}" == "true" ]; then
     
     # Update the OpenSearch index with new data
     echo "Updating OpenSearch index..."
-    python3 search_configuration/upload_data.py
+    if [ "${REBUILD_INDEX,,}" == "true" ]; then
+        # Rebuild the index from every file as a new version next to the live one and swap the dashboard to it
+        python3 search_configuration/upload_data.py --blue-green
+    else
+        python3 search_configuration/upload_data.py --bulk-load
+    fi
     echo "Data update complete!"
 fi
 
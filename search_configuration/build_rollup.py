@@ -0,0 +1,208 @@
+"""
+Build the rollup index (phytooracle-rollup) from plant documents.
+
+The rollup holds one document per (scan hour, instrument, crop_type, season, year), with the
+document count and, for each of ROLLUP_FIELDS, the count, sum, min, max and a mergeable quantile
+sketch of its values. upload_data.py adds the documents it uploads to it; run this script to
+rebuild it from the documents already in the plant index:
+
+    python3 search_configuration/build_rollup.py
+"""
+import os
+import sys
+import json
+import hashlib
+from datetime import datetime, timezone
+# Add the parent directory to the path to import the environment variables
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+import pandas as pd
+from opensearchpy import helpers
+
+from app.cache import get_ingest_generation, set_source_generation
+from app.client import get_opensearch_client
+from app.config import (
+    INDEX_NAME, OPENSEARCH_CLIENT_OPTIONS,
+    ROLLUP_INDEX_NAME, ROLLUP_FIELDS, ROLLUP_DIMENSIONS, ROLLUP_SKETCH_ACCURACY
+)
+from app.sketch import QuantileSketch
+
+ROLLUP_MAPPING_FILE = os.path.join(os.path.dirname(__file__), "rollup_mapping.json")
+
+def scan_hour(scan_date):
+    """
+    Return the UTC hour of a scan_date ("%Y%m%dT%H%M%S.%f%z") as an ISO string, or None.
+    Hours are in UTC like the dashboard's date histograms, so daily buckets match exactly.
+    """
+    try:
+        date = datetime.strptime(scan_date, "%Y%m%dT%H%M%S.%f%z")
+    except (TypeError, ValueError):
+        return None
+    return date.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:00:00Z")
+
+def _dimension(value):
+    # season and year are integers in the rollup, even when a sensor stored them as strings
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+class RollupBuilder:
+    """
+    Accumulate plant documents into rollup groups. Memory depends on the number of groups
+    (and sketch bins), not on the number of documents added.
+    """
+    def __init__(self, fields=ROLLUP_FIELDS, dimensions=ROLLUP_DIMENSIONS, accuracy=ROLLUP_SKETCH_ACCURACY):
+        self.fields = fields
+        self.dimensions = dimensions
+        self.accuracy = accuracy
+        self.groups = {}
+        # Documents left out of the rollup because they have no valid scan_date
+        self.skipped = 0
+
+    def add_documents(self, documents):
+        """
+        Add a batch of plant documents (dicts with scan_date, the dimensions and the fields).
+        """
+        columns = ["scan_date"] + self.dimensions + self.fields
+        df = pd.DataFrame([{column: document.get(column) for column in columns} for document in documents],
+                          columns=columns)
+        if df.empty:
+            return
+        df["scan_hour"] = df["scan_date"].map(scan_hour)
+        self.skipped += int(df["scan_hour"].isna().sum())
+        df = df.dropna(subset=["scan_hour"])
+        for dimension in self.dimensions:
+            df[dimension] = df[dimension].map(_dimension).astype(object)
+        for field in self.fields:
+            df[field] = pd.to_numeric(df[field], errors="coerce")
+
+        keys = ["scan_hour"] + self.dimensions
+        for key, rows in df.groupby(keys, dropna=False, sort=False):
+            # Plain Python values, so a group always gets the same document id
+            key = tuple(None if pd.isna(value) else getattr(value, "item", lambda: value)() for value in key)
+            group = self.groups.setdefault(key, {"count": 0, "fields": {}})
+            group["count"] += len(rows)
+            for field in self.fields:
+                values = rows[field].dropna().to_numpy(dtype=float)
+                if len(values) == 0:
+                    continue
+                stats = self._stats(group, field)
+                stats["count"] += len(values)
+                stats["sum"] += float(values.sum())
+                stats["min"] = min(stats["min"], float(values.min()))
+                stats["max"] = max(stats["max"], float(values.max()))
+                stats["sketch"].add(values)
+
+    def _stats(self, group, field):
+        stats = group["fields"].get(field)
+        if stats is None:
+            stats = group["fields"][field] = {
+                "count": 0, "sum": 0.0, "min": float("inf"), "max": float("-inf"),
+                "sketch": QuantileSketch(self.accuracy)
+            }
+        return stats
+
+    def merge_document(self, key, source):
+        """
+        Add the statistics of an existing rollup document to the group of key.
+        """
+        group = self.groups.setdefault(key, {"count": 0, "fields": {}})
+        group["count"] += source.get("count", 0)
+        for field in self.fields:
+            if not source.get(f"{field}_count"):
+                continue
+            stats = self._stats(group, field)
+            stats["count"] += source[f"{field}_count"]
+            stats["sum"] += source[f"{field}_sum"]
+            stats["min"] = min(stats["min"], source[f"{field}_min"])
+            stats["max"] = max(stats["max"], source[f"{field}_max"])
+            stats["sketch"].merge(QuantileSketch.from_dict(source[f"{field}_sketch"]))
+
+    def document_id(self, key):
+        return hashlib.sha1(json.dumps(key, default=str).encode("utf-8")).hexdigest()
+
+    def actions(self, index_name=ROLLUP_INDEX_NAME):
+        """
+        Yield the bulk actions writing every rollup document. Document ids are derived from the
+        group key, so writing the rollup again replaces the documents instead of adding to them.
+        """
+        for key, group in self.groups.items():
+            source = dict(zip(["scan_hour"] + self.dimensions, key))
+            source["count"] = group["count"]
+            for field, stats in group["fields"].items():
+                source[f"{field}_count"] = stats["count"]
+                source[f"{field}_sum"] = stats["sum"]
+                source[f"{field}_min"] = stats["min"]
+                source[f"{field}_max"] = stats["max"]
+                source[f"{field}_sketch"] = stats["sketch"].to_dict()
+            yield {"_index": index_name, "_id": self.document_id(key), "_source": source}
+
+def _merge_existing(client, builder, index_name, chunk_size=1000):
+    # Fold the documents already in the rollup into the builder's groups, so that writing the
+    # groups adds the new plant documents to the rollup instead of replacing what it holds
+    keys = {builder.document_id(key): key for key in builder.groups}
+    ids = list(keys)
+    for start in range(0, len(ids), chunk_size):
+        response = client.mget(index=index_name, body={"ids": ids[start:start + chunk_size]})
+        for doc in response["docs"]:
+            if doc.get("found"):
+                builder.merge_document(keys[doc["_id"]], doc["_source"])
+
+def write_rollup(client, builder, index_name=ROLLUP_INDEX_NAME, merge=True):
+    """
+    Create the rollup index if needed and add the builder's documents to it (or overwrite the
+    documents of the same groups if merge is False). Returns the number of documents written.
+    """
+    if not client.indices.exists(index=index_name):
+        with open(ROLLUP_MAPPING_FILE, "r") as file:
+            client.indices.create(index=index_name, body=json.load(file))
+    elif merge:
+        _merge_existing(client, builder, index_name)
+    success, _ = helpers.bulk(client, builder.actions(index_name))
+    client.indices.refresh(index=index_name)
+    return success
+
+def rollup_total(client, index_name=ROLLUP_INDEX_NAME):
+    """
+    Return the number of plant documents counted by the rollup.
+    """
+    response = client.search(index=index_name, body={"size": 0, "aggs": {"records": {"sum": {"field": "count"}}}})
+    return int(response["aggregations"]["records"]["value"] or 0)
+
+def builder_from_index(client, source_index=INDEX_NAME, batch_size=10000):
+    """
+    Return a RollupBuilder holding every document of the plant index.
+    """
+    builder = RollupBuilder()
+    fields = ["scan_date"] + builder.dimensions + builder.fields
+    batch = []
+    for hit in helpers.scan(client, index=source_index, query={"_source": fields}, size=batch_size):
+        batch.append(hit["_source"])
+        if len(batch) >= batch_size:
+            builder.add_documents(batch)
+            batch = []
+    builder.add_documents(batch)
+    return builder
+
+def rebuild_from_index(client, source_index=INDEX_NAME, index_name=ROLLUP_INDEX_NAME, batch_size=10000):
+    """
+    Rebuild the rollup from every document of the plant index.
+    """
+    builder = builder_from_index(client, source_index, batch_size)
+    if client.indices.exists(index=index_name):
+        # Dashboards fall back to the plant index while the rollup is being replaced
+        set_source_generation(client, index_name, -1)
+        client.delete_by_query(index=index_name, body={"query": {"match_all": {}}}, refresh=True)
+    written = write_rollup(client, builder, index_name, merge=False)
+    # The rollup now reflects the current contents of the plant index
+    set_source_generation(client, index_name, get_ingest_generation(client, source_index))
+    return written
+
+if __name__ == "__main__":
+    client = get_opensearch_client(**OPENSEARCH_CLIENT_OPTIONS)
+    written = rebuild_from_index(client)
+    print(f"Wrote {written} rollup documents to '{ROLLUP_INDEX_NAME}' from '{INDEX_NAME}'.")
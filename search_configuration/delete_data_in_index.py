@@ -1,31 +1,15 @@
 import os
 import sys
-from dotenv import load_dotenv
-from opensearchpy import OpenSearch
 
-# Add the parent directory to the path to import the environment variables
+# Add the parent directory to the path to import the shared dashboard modules
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-# Load environment variables from .env file
-load_dotenv()
-
-# Get connection details from environment variables
-host = os.getenv("ELASTIC_HOST")
-port = os.getenv("ELASTIC_PORT")
-auth = (os.getenv("ELASTIC_USER"), os.getenv("ELASTIC_PASSWORD"))
-
-# Create the OpenSearch client with SSL/TLS and hostname verification disabled
-client = OpenSearch(
-    hosts=[{'host': host, 'port': port, 'scheme': 'https'}],
-    http_compress=True,  # enables gzip compression for request bodies
-    http_auth=auth,
-    use_ssl=True,
-    verify_certs=False,
-    ssl_assert_hostname=False,
-    ssl_show_warn=False
-)
-
-index_name = "phytooracle-index"
+from app.client import get_opensearch_client
+from app.config import INDEX_NAME, OPENSEARCH_CLIENT_OPTIONS
+
+client = get_opensearch_client(**OPENSEARCH_CLIENT_OPTIONS)
+
+index_name = INDEX_NAME
 
 # Check if the index exists
 if client.indices.exists(index=index_name):
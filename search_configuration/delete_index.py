@@ -1,29 +1,13 @@
 import os
 import sys
-from dotenv import load_dotenv
-from opensearchpy import OpenSearch
 
-# Add the parent directory to the path to import the environment variables
+# Add the parent directory to the path to import the shared dashboard modules
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-# Load environment variables from .env file
-load_dotenv()
-
-# Get connection details from environment variables
-host = os.getenv("ELASTIC_HOST")
-port = os.getenv("ELASTIC_PORT")
-auth = (os.getenv("ELASTIC_USER"), os.getenv("ELASTIC_PASSWORD"))
-
-# Create the OpenSearch client with SSL/TLS and hostname verification disabled
-client = OpenSearch(
-    hosts=[{'host': host, 'port': port, 'scheme': 'https'}],
-    http_compress=True,  # enables gzip compression for request bodies
-    http_auth=auth,
-    use_ssl=True,
-    verify_certs=False,
-    ssl_assert_hostname=False,
-    ssl_show_warn=False
-)
+from app.client import get_opensearch_client
+from app.config import OPENSEARCH_CLIENT_OPTIONS
+
+client = get_opensearch_client(**OPENSEARCH_CLIENT_OPTIONS)
 
 if len(sys.argv) != 2:
     print("Usage: python delete_index.py <index_name>")
@@ -35,6 +19,10 @@ index_name = sys.argv[1]
 if client.indices.exists(index=index_name):
     print(f"The index '{index_name}' exists.")
 
+    # An alias (e.g. the read alias of the season partitions) is deleted with the indices behind it
+    if client.indices.exists_alias(name=index_name):
+        index_name = ",".join(sorted(client.indices.get_alias(name=index_name)))
+
     # Delete the index
     response = client.indices.delete(index=index_name)
 
@@ -1,31 +1,17 @@
 import os
 import sys
 import csv
-from opensearchpy import OpenSearch, helpers
-from dotenv import load_dotenv
 import json
 
-# Load environment variables
+# Add the parent directory to the path to import the shared dashboard modules
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-load_dotenv()
 
-# Get connection details from environment variables
-host = os.getenv("ELASTIC_HOST")
-port = os.getenv("ELASTIC_PORT")
-auth = (os.getenv("ELASTIC_USER"), os.getenv("ELASTIC_PASSWORD"))
+from app.client import get_opensearch_client
+from app.config import INDEX_NAME, OPENSEARCH_CLIENT_OPTIONS
 
-# Initialize OpenSearch client
-client = OpenSearch(
-    hosts=[{'host': host, 'port': port, 'scheme': 'https'}],
-    http_compress=True,  # enables gzip compression for request bodies
-    http_auth=auth,
-    use_ssl=True,
-    verify_certs=False,
-    ssl_assert_hostname=False,
-    ssl_show_warn=False
-)
+client = get_opensearch_client(**OPENSEARCH_CLIENT_OPTIONS)
 
-index_name = "phytooracle-index"
+index_name = INDEX_NAME
 
 # Query all data from the index
 def fetch_all_data(client, index_name):
@@ -0,0 +1,332 @@
+"""
+Manage the season partitions of the plant index.
+
+Plant documents are written to one index per year and season (e.g. phytooracle-y2022-s14), created
+from the phytooracle-partitions index template (the mapping of index_mapping.json) and read through
+the phytooracle-index alias. The dashboard only searches the partitions of the years it filters on,
+and retiring or reloading a season is an index drop or an alias change:
+
+    python3 search_configuration/partitions.py list
+    python3 search_configuration/partitions.py template [--source-excludes FIELD ...]
+    python3 search_configuration/partitions.py detach|attach|drop <year> <season>
+    python3 search_configuration/partitions.py migrate
+    python3 search_configuration/partitions.py versions|rollback|gc [--keep N]
+
+migrate splits an index created before partitioning (a single phytooracle-index) into partitions.
+upload_data.py does so automatically.
+
+upload_data.py --blue-green builds a new version of every partition (e.g. phytooracle-y2022-s14-v
+20250101120000) and of the rollup next to the live ones, then swaps the read aliases to it in one
+atomic update. The previous version is kept, detached, so that rollback can swap back to it; gc
+deletes the older ones.
+"""
+import os
+import sys
+import time
+import json
+import argparse
+# Add the parent directory to the path to import the environment variables
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from opensearchpy.exceptions import NotFoundError
+
+from app.cache import GENERATION_META_KEY, get_ingest_generation, bump_ingest_generation, set_source_generation
+from app.client import get_opensearch_client
+from app.config import (
+    INDEX_NAME, OPENSEARCH_CLIENT_OPTIONS, PARTITION_PREFIX, PARTITION_TEMPLATE_NAME, ROLLUP_INDEX_NAME
+)
+from app.partitions import partition_name, partition_pattern, parse_partition, versioned_name, index_version
+
+INDEX_MAPPING_FILE = os.path.join(os.path.dirname(__file__), "index_mapping.json")
+
+def partition_of(document, version=""):
+    """
+    Return the name of the partition of version a plant document is written to.
+    """
+    return versioned_name(partition_name(PARTITION_PREFIX, document.get("year"), document.get("season")), version)
+
+def template_body(source_excludes=None):
+    """
+    Return the index template of the partitions, built from index_mapping.json. The source_excludes
+    fields are left out of the stored _source (they stay searchable and aggregatable).
+    """
+    with open(INDEX_MAPPING_FILE, "r") as file:
+        mapping = json.load(file)
+    if source_excludes:
+        mapping["mappings"]["_source"] = {"excludes": list(source_excludes)}
+    return {
+        "index_patterns": [partition_pattern(PARTITION_PREFIX)],
+        "priority": 100,
+        "template": mapping
+    }
+
+def put_template(client, source_excludes=None):
+    """
+    Create or update the index template. Only partitions created afterwards are affected.
+    """
+    client.indices.put_index_template(name=PARTITION_TEMPLATE_NAME, body=template_body(source_excludes))
+
+def list_partitions(client, alias=INDEX_NAME):
+    """
+    Return the partitions behind the read alias, sorted by name.
+    """
+    try:
+        return sorted(client.indices.get_alias(name=alias))
+    except NotFoundError:
+        return []
+
+def concrete_indices(client, name):
+    """
+    Return the indices behind name if it is an alias, [name] if it is an index, or [] if neither exists.
+    """
+    if not client.indices.exists(index=name):
+        return []
+    if client.indices.exists_alias(name=name):
+        return sorted(client.indices.get_alias(name=name))
+    return [name]
+
+def is_single_index(client, index_name=INDEX_NAME):
+    """
+    Return True if index_name is an index created before partitioning rather than the read alias.
+    """
+    return client.indices.exists(index=index_name) and not client.indices.exists_alias(name=index_name)
+
+def ensure_partition(client, name, settings=None, alias=INDEX_NAME):
+    """
+    Create the partition if it does not exist yet (with settings on top of the template's),
+    and add it to the read alias (unless alias is None). Returns True if it was created.
+    """
+    if client.indices.exists(index=name):
+        return False
+    body = {"aliases": {alias: {}}} if alias else {}
+    if settings:
+        body["settings"] = settings
+    client.indices.create(index=name, body=body)
+    return True
+
+def attach_partition(client, name, alias=INDEX_NAME):
+    client.indices.update_aliases(body={"actions": [{"add": {"index": name, "alias": alias}}]})
+
+def detach_partition(client, name, alias=INDEX_NAME):
+    """
+    Remove the partition from the read alias: dashboards stop reading it, but its documents are kept.
+    """
+    client.indices.update_aliases(body={"actions": [{"remove": {"index": name, "alias": alias}}]})
+
+def drop_partition(client, name):
+    client.indices.delete(index=name)
+
+# Routes each reindexed document to its partition, like partition_of (for integer years and seasons)
+_REINDEX_SCRIPT = """
+String year = ctx._source.year == null ? 'na' : String.valueOf(ctx._source.year);
+String season = ctx._source.season == null ? 'na' : String.valueOf(ctx._source.season);
+ctx._index = params.prefix + 'y' + year + '-s' + season;
+"""
+
+def migrate(client, index_name=INDEX_NAME):
+    """
+    Split an index created before partitioning into partitions: its documents are reindexed into
+    the partitions, the index is deleted and its name becomes the read alias of the partitions.
+    Returns the number of documents moved. Fields left out of the stored _source are not moved.
+    """
+    generation = get_ingest_generation(client, index_name)
+    put_template(client)
+    client.indices.refresh(index=index_name)
+    response = client.reindex(body={
+        "source": {"index": index_name},
+        "dest": {"index": f"{PARTITION_PREFIX}unpartitioned"},
+        "script": {"lang": "painless", "source": _REINDEX_SCRIPT, "params": {"prefix": PARTITION_PREFIX}}
+    }, request_timeout=3600, refresh=True)
+    if response.get("failures"):
+        raise RuntimeError(f"Could not move every document of '{index_name}': {response['failures'][:3]}")
+    moved = response["created"] + response["updated"]
+    expected = client.count(index=index_name)["count"]
+    partitions = partition_pattern(PARTITION_PREFIX)
+    if client.count(index=partitions)["count"] < expected:
+        raise RuntimeError(f"The partitions hold fewer documents than '{index_name}'; it was left in place.")
+    # The alias can only take the name of the index once the index is gone
+    client.indices.delete(index=index_name)
+    client.indices.update_aliases(body={"actions": [{"add": {"index": partitions, "alias": index_name}}]})
+    # Carry the ingest generation over, and move past it so dashboards drop their cached searches
+    client.indices.put_mapping(index=index_name, body={"_meta": {GENERATION_META_KEY: generation}})
+    bump_ingest_generation(client, index_name)
+    return moved
+
+def new_version():
+    """
+    Return the version of a new set of partitions: the current UTC time, e.g. 20250101120000.
+    """
+    return time.strftime("%Y%m%d%H%M%S", time.gmtime())
+
+def _version_key(version):
+    # Partitions written before versions were introduced ("") are the oldest
+    return int(version or 0)
+
+def list_versions(client):
+    """
+    Return the partitions of every version, behind the read alias or not, as {version: [partition, ...]}.
+    Partitions written before versions were introduced have the version "".
+    """
+    try:
+        indices = client.indices.get_alias(index=partition_pattern(PARTITION_PREFIX))
+    except NotFoundError:
+        return {}
+    versions = {}
+    for name in sorted(indices):
+        if parse_partition(PARTITION_PREFIX, name) is not None:
+            versions.setdefault(index_version(name), []).append(name)
+    return versions
+
+def live_version(client, alias=INDEX_NAME):
+    """
+    Return the version of the partitions behind the read alias, or None if there are none.
+    """
+    versions = {index_version(name) for name in list_partitions(client, alias)}
+    return max(versions, key=_version_key) if versions else None
+
+def rollup_of(client, version):
+    """
+    Return the rollup index built with a version, or None if it has none.
+    """
+    name = versioned_name(ROLLUP_INDEX_NAME, version)
+    # The rollup of the unversioned partitions is deleted by the first swap to a version
+    return name if version and client.indices.exists(index=name) else None
+
+def _alias_actions(client, alias, indices):
+    # Move the alias onto indices. An index with the name of the alias (created before the alias was
+    # used) can only make way for it by being deleted, within the same update.
+    if is_single_index(client, alias):
+        actions = [{"remove_index": {"index": alias}}]
+    else:
+        actions = [{"remove": {"index": name, "alias": alias}}
+                   for name in list_partitions(client, alias) if name not in indices]
+    return actions + [{"add": {"index": name, "alias": alias}} for name in indices]
+
+def swap_version(client, version, rollup_index=None):
+    """
+    Point the read alias at the partitions of version, and the rollup alias at rollup_index, in a
+    single alias update: dashboards read either the previous partitions or the new ones, never a
+    mix. The previous partitions are kept, detached. Without rollup_index, the rollup alias is
+    removed. Returns the new ingest generation.
+    """
+    partitions = list_versions(client).get(version)
+    if not partitions:
+        raise ValueError(f"There is no partition of version '{version}'.")
+    # Move past the generation of the live partitions so dashboards drop their cached searches, and
+    # mark the rollup as current before it is swapped in with them
+    generation = get_ingest_generation(client, INDEX_NAME) + 1
+    client.indices.put_mapping(index=",".join(partitions), body={"_meta": {GENERATION_META_KEY: generation}})
+    actions = _alias_actions(client, INDEX_NAME, partitions)
+    if rollup_index is not None:
+        set_source_generation(client, rollup_index, generation)
+        actions += _alias_actions(client, ROLLUP_INDEX_NAME, [rollup_index])
+    else:
+        # Without a rollup of its own, the version is read from the partitions until build_rollup.py runs
+        actions += [{"remove": {"index": name, "alias": ROLLUP_INDEX_NAME}}
+                    for name in list_partitions(client, ROLLUP_INDEX_NAME)]
+    client.indices.update_aliases(body={"actions": actions})
+    return generation
+
+def rollback(client):
+    """
+    Point the read aliases back at the newest version older than the live one. Returns that
+    version, or None if there is none left.
+    """
+    live = live_version(client)
+    if live is None:
+        return None
+    older = [version for version in list_versions(client) if _version_key(version) < _version_key(live)]
+    if not older:
+        return None
+    version = max(older, key=_version_key)
+    swap_version(client, version, rollup_of(client, version))
+    return version
+
+def drop_version(client, version):
+    """
+    Delete the partitions and the rollup of a version. Returns the deleted indices.
+    """
+    names = list(list_versions(client).get(version, []))
+    rollup_index = rollup_of(client, version)
+    if rollup_index is not None:
+        names.append(rollup_index)
+    if names:
+        client.indices.delete(index=",".join(names))
+    return names
+
+def garbage_collect(client, keep=1):
+    """
+    Delete the versions that are not behind the read alias, except the newest keep of them (kept
+    for rollback). Returns the deleted indices.
+    """
+    live = live_version(client)
+    if live is None:
+        return []
+    detached = sorted((version for version in list_versions(client) if version != live),
+                      key=_version_key, reverse=True)
+    deleted = []
+    for version in detached[keep:]:
+        deleted += drop_version(client, version)
+    return deleted
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Manage the season partitions of the plant index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list the partitions behind the read alias")
+    template = commands.add_parser("template", help="update the index template from index_mapping.json")
+    template.add_argument("--source-excludes", nargs="+", default=[],
+                          help="fields left out of the stored _source of new partitions")
+    for command, help_text in [("detach", "remove a season from the read alias"),
+                               ("attach", "add a season back to the read alias"),
+                               ("drop", "delete a season")]:
+        season_parser = commands.add_parser(command, help=help_text)
+        season_parser.add_argument("year")
+        season_parser.add_argument("season")
+    commands.add_parser("migrate", help="split a single plant index into partitions")
+    commands.add_parser("versions", help="list the versions of the partitions")
+    commands.add_parser("rollback", help="point the read aliases back at the previous version")
+    gc = commands.add_parser("gc", help="delete the versions no longer behind the read alias")
+    gc.add_argument("--keep", type=int, default=1, help="number of previous versions kept for rollback")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    client = get_opensearch_client(**OPENSEARCH_CLIENT_OPTIONS)
+    if args.command == "list":
+        for name in list_partitions(client):
+            print(f"{name}: {client.count(index=name)['count']} documents")
+    elif args.command == "template":
+        put_template(client, args.source_excludes)
+        print(f"Updated the index template '{PARTITION_TEMPLATE_NAME}'.")
+    elif args.command == "migrate":
+        if not is_single_index(client):
+            print(f"'{INDEX_NAME}' is not a single index; nothing to migrate.")
+        else:
+            print(f"Moved {migrate(client)} documents of '{INDEX_NAME}' to partitions.")
+    elif args.command == "versions":
+        live = live_version(client)
+        for version, partitions in sorted(list_versions(client).items(), key=lambda item: _version_key(item[0])):
+            state = "live" if version == live else "detached"
+            print(f"{version or '(unversioned)'}: {len(partitions)} partitions, {state}")
+    elif args.command == "rollback":
+        version = rollback(client)
+        if version is None:
+            print("There is no previous version to roll back to.")
+        else:
+            print(f"'{INDEX_NAME}' now reads version {version or '(unversioned)'}.")
+            if rollup_of(client, version) is None:
+                print("That version has no rollup; rebuild it with build_rollup.py.")
+    elif args.command == "gc":
+        deleted = garbage_collect(client, args.keep)
+        print(f"Deleted {len(deleted)} indices" + (f": {', '.join(deleted)}." if deleted else "."))
+    else:
+        name = partition_name(PARTITION_PREFIX, args.year, args.season)
+        action, done = {
+            "detach": (detach_partition, "Detached"),
+            "attach": (attach_partition, "Attached"),
+            "drop": (drop_partition, "Dropped")
+        }[args.command]
+        action(client, name)
+        # Dashboards drop their cached searches, which may include or miss the season
+        bump_ingest_generation(client, INDEX_NAME)
+        print(f"{done} '{name}'.")
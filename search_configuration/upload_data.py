@@ -1,131 +1,573 @@
 """
 A sample file to upload data to index
+
+Files are read one after another and streamed to OpenSearch: the documents of a file are parsed
+incrementally (one record batch at a time for the Parquet dataset written by the data preparation
+scripts, see data_preparation/helper/parquet_output.py, and one element at a time for JSON files
+written before it) and sent by UPLOAD_WORKERS threads in bulk requests of at most UPLOAD_CHUNK_BYTES,
+so memory use does not depend on the size of the files. Each document is written to the season
+partition of its year and season (see partitions.py). The AZMET weather is uploaded to its own
+index (see upload_weather.py); with DENORMALIZE_WEATHER it is also copied onto every document.
+
+With --bulk-load, the index is tuned for the load (no refresh, no replicas) and its settings are
+restored afterwards, followed by a force merge:
+
+    python3 search_configuration/upload_data.py --bulk-load [--max-segments N] [--source-excludes FIELD ...]
+
+With --blue-green, every file is loaded into a new version of the partitions and of the rollup,
+built in the background while dashboards keep reading the live version. Once the new version holds
+every document read, the read aliases are swapped to it in one atomic update (see partitions.py):
+
+    python3 search_configuration/upload_data.py --blue-green [--keep-versions N]
 """
 import os
+import re
 import sys
-from datetime import datetime
+import glob
+import time
+import hashlib
+import argparse
+from contextlib import contextmanager
 # Add the parent directory to the path to import the environment variables
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from dotenv import load_dotenv
-
-load_dotenv()
-
-from opensearchpy import OpenSearch, helpers
+import pandas as pd
+from opensearchpy import helpers
+from opensearchpy.exceptions import NotFoundError
 import json
 
-# paths: all files in output/ directory
-paths = []
-for root, dirs, files in os.walk("output/"):
-    for file in files:
-        if file.endswith(".json"):
-            paths.append(os.path.join(root, file))
-    for dir in dirs:
-        for root, dirs, files in os.walk(dir):
-            for file in files:
-                if file.endswith(".json"):
-                    paths.append(os.path.join(root, file))
-
-
-print(f"Adding {len(paths)} files to the index.")
-
-# Get connection details from environment variables
-host = os.getenv("ELASTIC_HOST")
-port = os.getenv("ELASTIC_PORT")
-auth = (os.getenv("ELASTIC_USER"), os.getenv("ELASTIC_PASSWORD"))
-
-print(host, port, auth)
-# Check if the index exists, if not create it
-client = OpenSearch(
-    hosts=[{'host': host, 'port': port, 'scheme': 'http'}],
-    http_compress=True,  # enables gzip compression for request bodies
-    http_auth=auth,
-    # use_ssl=True,
-    use_ssl=False,
-    verify_certs=False,
-    ssl_assert_hostname=False,
-    ssl_show_warn=False
+from app.cache import bump_ingest_generation, get_ingest_generation, get_source_generation, set_source_generation
+from app.client import get_opensearch_client
+from app.config import (
+    INDEX_NAME, OPENSEARCH_CLIENT_OPTIONS, ELASTIC_POOL_MAXSIZE, ROLLUP_INDEX_NAME, AZMET_INDEX_NAME,
+    UPLOAD_WORKERS, UPLOAD_CHUNK_BYTES, DENORMALIZE_WEATHER
 )
+from build_rollup import RollupBuilder, write_rollup, rebuild_from_index, builder_from_index, rollup_total
+from partitions import (
+    partition_of, put_template, list_partitions, ensure_partition, is_single_index, migrate, concrete_indices,
+    new_version, live_version, list_versions, swap_version, drop_version, garbage_collect
+)
+from app.partitions import versioned_name
+from upload_weather import upload_weather
+from data_preparation.helper.azmet import to_numeric, to_records
+from data_preparation.helper.manifest import Manifest, file_fingerprint
+from data_preparation.helper.parquet_output import iter_records
+
+# Output files uploaded by previous runs, skipped while they are unchanged
+UPLOAD_MANIFEST_FILE = os.getenv("UPLOAD_MANIFEST", "upload_manifest.json")
+
+# Documents per bulk request when they are small enough to fit in UPLOAD_CHUNK_BYTES
+CHUNK_DOCUMENTS = 5000
+# Documents handed to the rollup builder at once
+ROLLUP_BATCH_SIZE = 10000
+# Documents enriched with AZMET data at once
+ENRICH_BATCH_SIZE = 5000
+# Documents whose stored content hash is looked up at once
+EXISTING_BATCH_SIZE = 1000
+# Most hits a search can return (the default index.max_result_window)
+MAX_RESULT_WINDOW = 10000
+
+# Fields identifying a document of each instrument: the document _id is derived from them, so
+# uploading the same document again replaces it instead of duplicating it
+NATURAL_KEYS = {
+    # "id" is the plant name and scan date, see data_preparation/helper/scanner3D.py
+    "scanner3DTop": ["id"],
+    # One row per plot and flight
+    "drone": ["plot", "scan_date", "gantry_location", "drone_type", "altitude_m", "camera_type"],
+}
+# flirIrCamera and stereoTop: one row per plant and scan; plants without a name are told apart by location
+DEFAULT_NATURAL_KEY = ["plant_name", "scan_date", "lat", "lon"]
+
+_whitespace = re.compile(r"[\s,]*")
+_separator = re.compile(r"\s*[,\]]")
+
+def find_data_files(directory="output/"):
+    """
+    Return the paths of all Parquet and JSON files in the output/ directory and its subdirectories.
+    A JSON file written before the Parquet dataset is left out once a Parquet file of the same
+    name exists: both hold the same documents, serialized differently.
+    """
+    paths = []
+    # os.walk already descends into every subdirectory
+    for root, dirs, files in os.walk(directory):
+        for file in sorted(files):
+            if file.endswith((".parquet", ".json")):
+                paths.append(os.path.join(root, file))
+    converted = {os.path.splitext(os.path.basename(path))[0] for path in paths if path.endswith(".parquet")}
+    legacy = [path for path in paths if path.endswith(".json") and os.path.basename(path)[:-len(".json")] in converted]
+    for path in legacy:
+        print(f"Skipping {path}: its documents are read from the Parquet dataset (the file can be deleted)")
+    return [path for path in paths if path not in legacy]
+
+def iter_json_array(path, read_size=1024 * 1024):
+    """
+    Yield the elements of the JSON array in path one by one, reading the file in blocks of
+    read_size characters instead of loading it whole.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as file:
+        buffer = ""
+        started = False
+        eof = False
+        while not eof:
+            block = file.read(read_size)
+            eof = not block
+            buffer += block
+            position = _whitespace.match(buffer).end()
+            if not started:
+                if position == len(buffer):
+                    continue
+                if buffer[position] != "[":
+                    raise ValueError(f"{path} does not contain a JSON array")
+                started = True
+                position = _whitespace.match(buffer, position + 1).end()
+            while position < len(buffer):
+                if buffer[position] == "]":
+                    return
+                try:
+                    element, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    break
+                # An element cut at the end of the block may continue in the next one, and a cut
+                # number still decodes (e.g. "12." of "12.5"): wait until the separator after it is read
+                if not eof and _separator.match(buffer, end) is None:
+                    break
+                yield element
+                position = _whitespace.match(buffer, end).end()
+            buffer = buffer[position:]
+        if started:
+            raise ValueError(f"{path} ends before the end of its JSON array")
 
-index_name = "phytooracle-index"
-
-
-if not client.indices.exists(index=index_name):
-    print(f"The index '{index_name}' does not exist. Creating the index.")
-    # Load the index mapping from a file
-    with open("search_configuration/index_mapping.json", "r") as file:
-        client.indices.create(index=index_name, body=json.load(file))
-        
-        
-# Load AZMET data for 2020, 2021, 2022 in a single dictionary
-azmet_data = {}
-for year in range(2020, 2023):
-    with open(f"azmet_output/{year}.json", 'r') as azmet_file:
-        azmet_data[year] = {entry["day_of_year"]: entry for entry in json.load(azmet_file)}
-# print(azmet_data)
-
-print(paths)
-for data_path in paths:
-    print("Processing", data_path)
-    with open(data_path, 'r') as file:
-        data = json.load(file)
-        print("Found data:", len(data))
-        # Enrich data with AZMET weather data
-        # "data" contains a field called scan_date
-        # azmet data, found in azmet_output/ directory, is filtered by year, so all weather data from year 2020 is in azmet_output/2020.json
-        # "data" is in the format: {scan_date: scan_date, ...}, eg. 20220512T000000.000000-0700
-        # azmet data is in the format: {year: year, day_of_year: day_of_year....}
-        # We need to convert the scan_date to a datetime object, extract the year and day_of_year, and then find the corresponding weather data in the azmet data
-        # and then add the weather data to the "data" object
-
-        for entry in data:
-            try:
-                scan_date = datetime.strptime(entry["scan_date"], "%Y%m%dT%H%M%S.%f%z")
-                year = scan_date.year
-                day_of_year = scan_date.timetuple().tm_yday
-                
-                # print(f"Extracting data for {year} and day of year {day_of_year}")
-                # Find the corresponding weather data in the azmet data
-                weather_data = azmet_data[year][str(day_of_year)]
-                
-                for key, value in weather_data.items():
-                    entry[f"azmet_{key}"] = value
-
-    
-            except ValueError:
-                print(f"Could not convert {entry['scan_date']} to a datetime object.")
+class WeatherTable:
+    """
+    The AZMET data of every year, as a table indexed by (year, day_of_year) with one
+    azmet_<key> column per AZMET field.
+    """
+    def __init__(self, frame):
+        self.frame = frame
+        # The fields of each day, added as-is to every document scanned that day
+        self._rows = to_records(frame)
+
+    @classmethod
+    def load(cls, directory="azmet_output"):
+        """
+        Load every year file of directory (e.g. azmet_output/2020.json). Files written before
+        the AZMET values were typed are converted to numbers as well.
+        """
+        frames = []
+        for azmet_path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+            with open(azmet_path, 'r') as azmet_file:
+                frames.append(pd.DataFrame(json.load(azmet_file)))
+        weather = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["year", "day_of_year"])
+        weather = to_numeric(weather).dropna(subset=["year", "day_of_year"])
+        weather.columns = [f"azmet_{column}" for column in weather.columns]
+        index = pd.MultiIndex.from_arrays([
+            weather["azmet_year"].astype(int), weather["azmet_day_of_year"].astype(int)
+        ], names=["year", "day_of_year"])
+        weather = weather.set_index(index)
+        # A day present in several files keeps its last version
+        return cls(weather[~weather.index.duplicated(keep="last")])
+
+    def enrich(self, entries):
+        """
+        Add the AZMET weather data of each entry's scan date (e.g. 20220512T000000.000000-0700)
+        to the entries, as azmet_<key> fields, with one vectorized lookup for the whole batch.
+        """
+        scan_dates = pd.Series([entry.get("scan_date") for entry in entries], dtype=object).astype(str)
+        valid = scan_dates.str.fullmatch(r"\d{8}T\d{6}\.\d{6}[+-]\d{4}")
+        # The scan date is in local time, so its day is given by its first 8 characters
+        days = pd.to_datetime(scan_dates.str[:8].where(valid), format="%Y%m%d", errors="coerce")
+        invalid = int(days.isna().sum())
+        if invalid:
+            print(f"Could not convert {invalid} scan dates to a datetime object.")
+        positions = self.frame.index.get_indexer(pd.MultiIndex.from_arrays([
+            days.dt.year.fillna(-1).astype(int), days.dt.dayofyear.fillna(-1).astype(int)
+        ]))
+        for entry, position in zip(entries, positions.tolist()):
+            if position >= 0:
+                entry.update(self._rows[position])
+        return entries
+
+def _hash(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")).hexdigest()
+
+def document_id(entry):
+    """
+    Return the _id of a document, derived from the natural key of its instrument.
+    """
+    instrument = entry.get("instrument")
+    fields = NATURAL_KEYS.get(instrument, DEFAULT_NATURAL_KEY)
+    return _hash([instrument] + [entry.get(field) for field in fields])
+
+def generate_actions(paths, weather=None, version=""):
+    """
+    Yield the bulk action of every document of every file, one file after another, with the
+    fields of weather (a WeatherTable) added when given.
+    Each document is sent to the partition of its year and season in version, with a deterministic
+    _id and the hash of its content.
+    """
+    for data_path in paths:
+        print("Processing", data_path)
+        count = 0
+        if data_path.endswith(".parquet"):
+            documents = iter_records(data_path, ENRICH_BATCH_SIZE)
+        else:
+            documents = iter_json_array(data_path)
+        for batch in _batches(documents, ENRICH_BATCH_SIZE):
+            if weather is not None:
+                batch = weather.enrich(batch)
+            for entry in batch:
+                entry.pop("content_hash", None)
+                entry["content_hash"] = _hash(entry)
+                count += 1
+                yield {"_index": partition_of(entry, version), "_id": document_id(entry), "_source": entry}
+        print(f"Read {count} documents from {data_path}" + (" and linked them to AZMET data." if weather is not None else "."))
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def with_partitions(client, actions, settings=None, alias=INDEX_NAME):
+    """
+    Yield the actions, creating the partition of each document the first time one is seen,
+    with settings on top of the index template's, behind alias (none if alias is None).
+    """
+    seen = set()
+    for action in actions:
+        if action["_index"] not in seen:
+            if ensure_partition(client, action["_index"], settings, alias):
+                print(f"Created the partition '{action['_index']}'.")
+            seen.add(action["_index"])
+        yield action
+
+def changed_actions(client, actions, rollup, counts, check_existing=True, alias=INDEX_NAME):
+    """
+    Yield only the actions of new documents and of documents whose content changed, looking up
+    the partition and content hash of each _id through alias. A document whose year
+    or season changed is written to its new partition and deleted from the one it was in.
+    New documents are added to the rollup builder. A document read again in the same load (same
+    _id) replaces the first copy and counts as changed, as the lookups cannot see the documents
+    of the load yet and the rollup builder already holds the first copy.
+    counts receives the number of new, changed and unchanged documents.
+    """
+    partitions = list_partitions(client, alias) if check_existing else []
+    # _ids of the documents already sent in this load
+    seen = set()
+    for batch in _batches(actions, EXISTING_BATCH_SIZE):
+        stored, stale = {}, {}
+        if check_existing:
+            # mget cannot read an alias with several partitions; an ids query finds the copies of
+            # each _id in any of them (at most one per partition)
+            targets = {action["_id"]: action["_index"] for action in batch if action["_id"] not in seen}
+            size = min(len(targets) * max(len(partitions), 1), MAX_RESULT_WINDOW)
+            response = client.search(index=alias, body={
+                "query": {"ids": {"values": list(targets)}}, "_source": ["content_hash"], "size": size
+            }) if targets else {"hits": {"hits": []}}
+            for hit in response["hits"]["hits"]:
+                if hit["_index"] == targets[hit["_id"]]:
+                    stored[hit["_id"]] = hit["_source"].get("content_hash")
+                else:
+                    stale.setdefault(hit["_id"], []).append(hit["_index"])
+        new = []
+        for action in batch:
+            moved = stale.get(action["_id"], [])
+            if action["_id"] in seen:
+                counts["changed"] += 1
+            elif action["_id"] not in stored and not moved:
+                counts["new"] += 1
+                new.append(action["_source"])
+            elif moved or stored[action["_id"]] != action["_source"]["content_hash"]:
+                counts["changed"] += 1
+            else:
+                counts["unchanged"] += 1
                 continue
+            seen.add(action["_id"])
+            yield action
+            for index in moved:
+                yield {"_op_type": "delete", "_index": index, "_id": action["_id"]}
+        rollup.add_documents(new)
+
+def upload(client, actions, workers=UPLOAD_WORKERS, max_chunk_bytes=UPLOAD_CHUNK_BYTES):
+    """
+    Send the actions with parallel bulk requests. Returns the numbers of indexed and failed documents,
+    and of documents created (rather than replacing a document with the same _id). Deletions of the
+    previous copy of a moved document are not counted, and succeed if that copy is already gone.
+    """
+    success, failed, created = 0, 0, 0
+    for ok, item in helpers.parallel_bulk(
+        client, actions, thread_count=workers, queue_size=workers,
+        chunk_size=CHUNK_DOCUMENTS, max_chunk_bytes=max_chunk_bytes, raise_on_error=False
+    ):
+        operation, result = next(iter(item.items()))
+        if operation == "delete" and (ok or result.get("status") == 404):
+            continue
+        if ok:
+            success += 1
+            if result.get("result") == "created":
+                created += 1
+        else:
+            failed += 1
+            if failed <= 10:
+                print(f"Failed to index a document: {item}")
+    return success, failed, created
 
-        # # Convert all scan dates to datetime objects and then to isoformat
-        # for entry in data:
-        #     try:
-        #         entry["scan_date"] = datetime.strptime(entry["scan_date"], "%Y%m%dT%H%M%S.%f%z").isoformat()
-        #     except ValueError:
-        #         print(f"Could not convert {entry['scan_date']} to a datetime object.")
-        #         continue
-    # Convert data for bulk indexing
-
-    print(f"Linked data from file {data_path} to AZMET data.")
-    actions = [
-        {
-            "_index": index_name,
-            "_source": entry
-        }
-        for entry in data
-    ]
-    with open('actions.json', 'w') as file:
-        json.dump(actions, file, indent=4)
+# Index settings changed for a bulk load, restored once it is done
+BULK_LOAD_SETTINGS = {"index.refresh_interval": "-1", "index.number_of_replicas": "0"}
 
+@contextmanager
+def phase(name, timings):
+    """
+    Record the wall time of a phase of the upload in timings.
+    """
+    start = time.perf_counter()
     try:
-        response = client.index(index=index_name, body=data[0])
-        success, failed = helpers.bulk(client, actions)
-        print(f"Successfully indexed {success} documents in {data_path}")
-        if failed is None or len(failed) > 0:
-            print(f"Failed to index {failed} documents in {data_path}.")
-        else:
-            print(f"All documents in {data_path} indexed successfully.")
+        yield
+    finally:
+        timings[name] = timings.get(name, 0) + time.perf_counter() - start
+
+def prepare_bulk_load(client, index_name):
+    """
+    Disable refreshes and replicas on the partitions of the index. Returns the previous values of
+    those settings of each partition, keyed by partition name (None where it used the default).
+    Partitions created during the load get BULK_LOAD_SETTINGS when they are created.
+    """
+    try:
+        current = client.indices.get_settings(index=index_name, flat_settings=True)
+    except NotFoundError:
+        return {}
+    original = {
+        name: {key: index["settings"].get(key) for key in BULK_LOAD_SETTINGS}
+        for name, index in current.items()
+    }
+    client.indices.put_settings(index=index_name, body=BULK_LOAD_SETTINGS)
+    return original
+
+def restore_settings(client, index_name, original):
+    """
+    Restore the settings changed by prepare_bulk_load on each partition of the index (partitions
+    created during the load go back to the defaults) and make the loaded documents searchable.
+    """
+    for name in sorted(client.indices.get_settings(index=index_name, flat_settings=True)):
+        client.indices.put_settings(index=name, body=original.get(name, {key: None for key in BULK_LOAD_SETTINGS}))
+    client.indices.refresh(index=index_name)
+
+def force_merge(client, index_name, max_segments):
+    # Merging a freshly loaded index can take a long time
+    client.indices.forcemerge(index=index_name, max_num_segments=max_segments, request_timeout=3600)
+
+def rebuild(client, args, paths, weather, timings):
+    """
+    Load every file into a new version of the partitions and of the rollup, next to the live
+    version that dashboards keep reading, and swap the read aliases to it once it holds every
+    document read. The new version is deleted instead if the load fails. Returns True if it went live.
+    """
+    version = new_version()
+    rollup_index = versioned_name(ROLLUP_INDEX_NAME, version)
+    print(f"Building version {version} of '{INDEX_NAME}' from {len(paths)} files.")
+    # The new version is created with the current index_mapping.json
+    put_template(client, args.source_excludes)
 
+    rollup = RollupBuilder()
+    counts = {"new": 0, "changed": 0, "unchanged": 0}
+    try:
+        # The new partitions are kept out of the read alias, tuned for the load
+        with phase("load", timings):
+            actions = with_partitions(client, generate_actions(paths, weather, version), BULK_LOAD_SETTINGS, alias=None)
+            success, failed, created = upload(client, changed_actions(client, actions, rollup, counts, check_existing=False))
+        print(f"Indexed {success} documents from {len(paths)} files.")
+        if failed:
+            raise RuntimeError(f"{failed} documents could not be indexed")
+        if not created:
+            raise RuntimeError("no document was read")
+        partitions = ",".join(list_versions(client).get(version, []))
+        with phase("restore", timings):
+            restore_settings(client, partitions, {})
+        # Every document read must be searchable; documents read twice (same _id) are stored once
+        stored = client.count(index=partitions)["count"]
+        if stored != created:
+            raise RuntimeError(f"it holds {stored} documents instead of {created}")
+        with phase("forcemerge", timings):
+            force_merge(client, partitions, args.max_segments)
+        with phase("rollup", timings):
+            if counts["changed"]:
+                # Documents read more than once are stored once: roll up the copies that were kept
+                rollup = builder_from_index(client, partitions)
+            written = write_rollup(client, rollup, rollup_index, merge=False)
+            rolled_up = rollup_total(client, rollup_index)
+        print(f"Wrote {written} rollup documents to '{rollup_index}'.")
+        # The rollup must count every stored document that has a scan date, once
+        if rolled_up + rollup.skipped != stored:
+            raise RuntimeError(f"its rollup counts {rolled_up} documents instead of {stored - rollup.skipped}")
+    except Exception as e:
+        print(f"Could not build version {version}: {e}. Dashboards keep reading the live version.")
+        drop_version(client, version)
+        return False
+
+    with phase("swap", timings):
+        generation = swap_version(client, version, rollup_index)
+    print(f"'{INDEX_NAME}' now reads version {version} ({stored} documents); "
+          f"bumped the ingest generation to {generation}.")
+    with phase("gc", timings):
+        deleted = garbage_collect(client, args.keep_versions)
+    if deleted:
+        print(f"Deleted the versions no longer kept for rollback: {', '.join(deleted)}.")
+    return True
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Upload the JSON files of output/ to the OpenSearch index.")
+    parser.add_argument("--bulk-load", action="store_true",
+                        help="disable refreshes and replicas during the load, then restore them and force merge")
+    parser.add_argument("--max-segments", type=int, default=1,
+                        help="number of segments per shard to force merge to after a bulk load")
+    parser.add_argument("--source-excludes", nargs="+", default=[],
+                        help="fields left out of the stored _source when the index template is created "
+                             "(the dashboard reads plot, loc, the box corners and the traits from _source)")
+    parser.add_argument("--all", action="store_true",
+                        help="upload every file, including those unchanged since they were last uploaded")
+    parser.add_argument("--blue-green", action="store_true",
+                        help="load every file into a new version of the index and swap the read alias to it")
+    parser.add_argument("--keep-versions", type=int, default=1,
+                        help="number of previous versions kept for rollback after a --blue-green load")
+    return parser.parse_args()
+
+def main(args):
+    timings = {}
+    paths = find_data_files()
+
+    print(f"Connecting to {OPENSEARCH_CLIENT_OPTIONS['hosts']}")
+    # One pooled connection per bulk thread, plus one for the lookups of the main thread, so no
+    # connection is discarded by a full pool
+    client = get_opensearch_client(**{**OPENSEARCH_CLIENT_OPTIONS,
+                                      "pool_maxsize": max(ELASTIC_POOL_MAXSIZE, UPLOAD_WORKERS + 1)})
+
+    index_name = INDEX_NAME
+
+    # The weather is read from its own index; copies on the documents are only made on request
+    weather = WeatherTable.load() if DENORMALIZE_WEATHER else None
+
+    if args.blue_green:
+        # Fingerprint the files before reading them, so a change made meanwhile is uploaded next time
+        fingerprints = {data_path: file_fingerprint(data_path) for data_path in paths}
+        # The manifest is left untouched unless the new version went live with every file
+        if rebuild(client, args, paths, weather, timings):
+            uploaded = Manifest(UPLOAD_MANIFEST_FILE)
+            # The documents of files that are gone are not in the live version anymore
+            for data_path in set(uploaded.entries) - set(paths):
+                del uploaded.entries[data_path]
+            for data_path in paths:
+                uploaded.record(data_path, fingerprints[data_path], [data_path])
+        upload_weather_and_report(client, timings)
+        return
+
+    if is_single_index(client, index_name):
+        print(f"'{index_name}' is a single index. Moving its documents to season partitions.")
+        with phase("migrate", timings):
+            moved = migrate(client, index_name)
+        print(f"Moved {moved} documents to the partitions behind the '{index_name}' alias.")
+
+    if not list_partitions(client, index_name):
+        print(f"The index '{index_name}' does not exist. Creating the index template of its partitions.")
+        put_template(client, args.source_excludes)
+        # A rollup left from a previous index describes documents that are gone
+        for name in concrete_indices(client, ROLLUP_INDEX_NAME):
+            client.indices.delete(index=name)
+        created = rollup_current = True
+    else:
+        created = False
+        if args.source_excludes:
+            print(f"The index '{index_name}' already exists; --source-excludes only applies when it is created "
+                  "(see partitions.py template).")
+        # The uploaded documents can only be added to a rollup that is up to date with the index
+        rollup_current = get_source_generation(client, ROLLUP_INDEX_NAME) == get_ingest_generation(client, index_name)
+
+    # Only the files written or changed by the data preparation since the last upload are read,
+    # unless the index is new
+    uploaded = Manifest(UPLOAD_MANIFEST_FILE)
+    if created:
+        uploaded.entries = {}
+    fingerprints = {data_path: file_fingerprint(data_path) for data_path in paths}
+    if not args.all:
+        paths = [data_path for data_path in paths if not uploaded.is_unchanged(data_path, fingerprints[data_path])]
+    print(f"Adding {len(paths)} files to the index.")
+
+    # Pre-aggregate the new documents for the rollup index as they are sent
+    rollup = RollupBuilder()
+    counts = {"new": 0, "changed": 0, "unchanged": 0}
+
+    original_settings = None
+    if args.bulk_load:
+        with phase("prepare", timings):
+            original_settings = prepare_bulk_load(client, index_name)
+    # Partitions of new seasons are created in the version of the live ones
+    version = live_version(client, index_name) or ""
+    try:
+        with phase("load", timings):
+            actions = with_partitions(client, generate_actions(paths, weather, version),
+                                      BULK_LOAD_SETTINGS if args.bulk_load else None)
+            success, failed, _ = upload(client, changed_actions(client, actions, rollup, counts,
+                                                             check_existing=not created))
+        print(f"Successfully indexed {success} documents from {len(paths)} files "
+              f"({counts['new']} new, {counts['changed']} changed, {counts['unchanged']} unchanged and skipped).")
+        if failed:
+            print(f"Failed to index {failed} documents.")
+            # The rollup builder counts every new document, indexed or not
+            rollup_current = False
+        else:
+            print("All documents indexed successfully.")
+            for data_path in paths:
+                uploaded.record(data_path, fingerprints[data_path], [data_path])
     except Exception as e:
         print(f"An error occurred while indexing the data: {e}")
-        # Print the error in detail
-        print(e)
\ No newline at end of file
+        rollup_current = False
+    finally:
+        if original_settings is not None:
+            # Restore the settings even if the load failed
+            with phase("restore", timings):
+                restore_settings(client, index_name, original_settings)
+
+    if args.bulk_load:
+        with phase("forcemerge", timings):
+            force_merge(client, index_name, args.max_segments)
+
+    if rollup_current and not counts["new"] and not counts["changed"]:
+        # Nothing changed: running dashboards keep their cached searches
+        print(f"'{index_name}' is already up to date.")
+    else:
+        # Update the rollup before announcing the new data, so dashboards never read a rollup that is
+        # behind the index as if it were current. New documents are added to it; the previous version
+        # of a changed document cannot be taken out of it, so it is then rebuilt from the index.
+        with phase("rollup", timings):
+            if rollup_current and not counts["changed"]:
+                written = write_rollup(client, rollup, ROLLUP_INDEX_NAME)
+                print(f"Wrote {written} rollup documents to '{ROLLUP_INDEX_NAME}'.")
+            else:
+                client.indices.refresh(index=index_name)
+                written = rebuild_from_index(client, index_name, ROLLUP_INDEX_NAME)
+                print(f"Rebuilt '{ROLLUP_INDEX_NAME}' from '{index_name}' ({written} rollup documents).")
+
+        # Tell running dashboards that the index contents changed, so they drop their cached searches
+        generation = bump_ingest_generation(client, index_name)
+        print(f"Bumped the ingest generation of '{index_name}' to {generation}.")
+        set_source_generation(client, ROLLUP_INDEX_NAME, generation)
+
+    upload_weather_and_report(client, timings)
+
+def upload_weather_and_report(client, timings):
+    with phase("weather", timings):
+        changed = upload_weather(client)
+    print(f"Wrote {changed} new or changed station-days to '{AZMET_INDEX_NAME}'.")
+
+    print("Time per phase:")
+    for name, seconds in timings.items():
+        print(f"  {name:<12} {seconds:.1f} s")
+
+if __name__ == "__main__":
+    main(parse_args())
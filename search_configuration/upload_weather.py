@@ -0,0 +1,74 @@
+"""
+Upload the AZMET weather of azmet_output/ to the weather index (azmet), one document per
+station-day. The dashboard joins the weather onto its date buckets, so correcting an AZMET file
+only takes running this script again (upload_data.py runs it as well):
+
+    python3 search_configuration/upload_weather.py
+"""
+import os
+import sys
+import glob
+import json
+# Add the parent directory to the path to import the environment variables
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import pandas as pd
+from opensearchpy import helpers
+
+from app.cache import bump_ingest_generation
+from app.client import get_opensearch_client
+from app.config import AZMET_INDEX_NAME, OPENSEARCH_CLIENT_OPTIONS
+from data_preparation.helper.azmet import KEY_COLUMNS, to_numeric, to_records
+
+AZMET_MAPPING_FILE = os.path.join(os.path.dirname(__file__), "azmet_mapping.json")
+
+def load_station_days(directory="azmet_output"):
+    """
+    Return the station-days of every year file of directory (e.g. azmet_output/2020.json) as
+    records of typed azmet_<key> fields, with the day as date (yyyy-MM-dd).
+    """
+    frames = []
+    for azmet_path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        with open(azmet_path, "r") as azmet_file:
+            frames.append(pd.DataFrame(json.load(azmet_file)))
+    if not frames:
+        return []
+    df = to_numeric(pd.concat(frames, ignore_index=True)).dropna(subset=KEY_COLUMNS)
+    df = df.drop_duplicates(subset=KEY_COLUMNS, keep="last")
+    dates = (pd.to_datetime(df["year"].astype(str), format="%Y") +
+             pd.to_timedelta(df["day_of_year"].astype(int) - 1, unit="D"))
+    df.columns = [f"azmet_{column}" for column in df.columns]
+    df.insert(0, "date", dates.dt.strftime("%Y-%m-%d"))
+    return to_records(df)
+
+def document_id(station_day):
+    return f"{station_day['azmet_station_number']}-{station_day['azmet_year']}-{station_day['azmet_day_of_year']}"
+
+def upload_weather(client, directory="azmet_output", index_name=AZMET_INDEX_NAME):
+    """
+    Create the weather index if needed and write every station-day of directory to it.
+    Returns the number of new or changed documents; running dashboards are only told to drop
+    their cached weather when there are some.
+    """
+    if not client.indices.exists(index=index_name):
+        with open(AZMET_MAPPING_FILE, "r") as file:
+            client.indices.create(index=index_name, body=json.load(file))
+    # Upserts report "noop" for station-days whose values did not change
+    actions = (
+        {"_op_type": "update", "_index": index_name, "_id": document_id(station_day),
+         "doc": station_day, "doc_as_upsert": True}
+        for station_day in load_station_days(directory)
+    )
+    changed = 0
+    for _, item in helpers.streaming_bulk(client, actions):
+        if item["update"].get("result") != "noop":
+            changed += 1
+    if changed:
+        client.indices.refresh(index=index_name)
+        bump_ingest_generation(client, index_name)
+    return changed
+
+if __name__ == "__main__":
+    client = get_opensearch_client(**OPENSEARCH_CLIENT_OPTIONS)
+    changed = upload_weather(client)
+    print(f"Wrote {changed} new or changed station-days to '{AZMET_INDEX_NAME}'.")
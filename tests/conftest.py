@@ -0,0 +1,8 @@
+# conftest.py
+import os
+import sys
+
+REPOSITORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+# The dashboard modules import each other by name, as streamlit runs them from app/
+sys.path.append(REPOSITORY_DIR)
+sys.path.append(os.path.join(REPOSITORY_DIR, "app"))
@@ -0,0 +1,110 @@
+# test_cache.py
+from opensearchpy.exceptions import NotFoundError
+from cache import SearchCache, CachedSearchClient, cache_key, get_ingest_generation, bump_ingest_generation
+
+class StubIndices:
+    def __init__(self, generations):
+        self.generations = generations
+
+    def get_mapping(self, index=None):
+        if index not in self.generations:
+            raise NotFoundError(404, "index_not_found_exception", {})
+        return {index: {"mappings": {"_meta": {"ingest_generation": self.generations[index]}}}}
+
+    def put_mapping(self, index=None, body=None):
+        self.generations[index] = body["_meta"]["ingest_generation"]
+
+class StubClient:
+    """
+    Count the searches that reach the server; every response is a new object.
+    """
+    def __init__(self, generations=None):
+        self.indices = StubIndices(generations if generations is not None else {"plants": 1})
+        self.searches = []
+
+    def search(self, index=None, body=None, **params):
+        self.searches.append((index, body, params))
+        return {"hits": {"hits": []}, "search": len(self.searches)}
+
+    def msearch(self, body=None, index=None):
+        return {"responses": [self.search(header.get("index", index), search) for header, search in zip(body[::2], body[1::2])]}
+
+def new_cache(max_entries=10):
+    return SearchCache(max_entries=max_entries, ttl_seconds=60, generation_check_seconds=0)
+
+def test_cache_key_ignores_key_order():
+    assert cache_key("plants", {"size": 0, "query": {"a": 1, "b": 2}}) == cache_key("plants", {"query": {"b": 2, "a": 1}, "size": 0})
+    assert cache_key("plants", {"size": 0}) != cache_key("weather", {"size": 0})
+
+def test_repeated_search_is_a_hit():
+    client = StubClient()
+    cached = CachedSearchClient(client, new_cache(), "plants")
+    first = cached.search(index="plants", body={"query": {"match_all": {}}, "size": 1})
+    second = cached.search(index="plants", body={"size": 1, "query": {"match_all": {}}})
+
+    assert second is first
+    assert len(client.searches) == 1
+    assert (cached.cache.hits, cached.cache.misses) == (1, 1)
+
+def test_aggregation_only_searches_use_the_request_cache():
+    client = StubClient()
+    cached = CachedSearchClient(client, new_cache(), "plants")
+    cached.search(index="plants", body={"size": 0})
+    assert client.searches[0][2] == {"request_cache": "true"}
+
+def test_searches_with_parameters_are_not_cached():
+    client = StubClient()
+    cached = CachedSearchClient(client, new_cache(), "plants")
+    cached.search(index="plants", body={"size": 1}, scroll="1m")
+    cached.search(index="plants", body={"size": 1}, scroll="1m")
+    assert len(client.searches) == 2
+
+def test_generation_bump_clears_the_cache():
+    client = StubClient()
+    cache = new_cache()
+    body = {"size": 1}
+    CachedSearchClient(client, cache, "plants").search(index="plants", body=body)
+    # A new session of the same process, before and after an upload
+    CachedSearchClient(client, cache, "plants").search(index="plants", body=body)
+    assert len(client.searches) == 1
+
+    assert bump_ingest_generation(client, "plants") == 2
+    CachedSearchClient(client, cache, "plants").search(index="plants", body=body)
+    assert len(client.searches) == 2
+    CachedSearchClient(client, cache, "plants").search(index="plants", body=body)
+    assert len(client.searches) == 2
+
+def test_generation_is_checked_at_most_every_generation_check_seconds():
+    client = StubClient()
+    cache = SearchCache(max_entries=10, ttl_seconds=60, generation_check_seconds=3600)
+    CachedSearchClient(client, cache, "plants").search(index="plants", body={"size": 1})
+    bump_ingest_generation(client, "plants")
+    CachedSearchClient(client, cache, "plants").search(index="plants", body={"size": 1})
+    assert len(client.searches) == 1
+
+def test_generation_of_every_index_is_tracked():
+    client = StubClient({"plants": 1, "weather": 1})
+    cache = new_cache()
+    CachedSearchClient(client, cache, ["plants", "weather"]).search(index="plants", body={"size": 1})
+    bump_ingest_generation(client, "weather")
+    CachedSearchClient(client, cache, ["plants", "weather"]).search(index="plants", body={"size": 1})
+    assert len(client.searches) == 2
+
+def test_missing_index_has_generation_zero():
+    assert get_ingest_generation(StubClient({}), "plants") == 0
+
+def test_msearch_only_sends_the_searches_that_are_not_cached():
+    client = StubClient()
+    cached = CachedSearchClient(client, new_cache(), "plants")
+    cached.search(index="plants", body={"size": 1})
+    response = cached.msearch(body=[{"index": "plants"}, {"size": 1}, {"index": "plants"}, {"size": 2}])
+
+    assert [body for _, body, _ in client.searches] == [{"size": 1}, {"size": 2}]
+    assert [r["search"] for r in response["responses"]] == [1, 2]
+
+def test_disabled_cache_always_misses():
+    client = StubClient()
+    cached = CachedSearchClient(client, new_cache(max_entries=0), "plants")
+    cached.search(index="plants", body={"size": 1})
+    cached.search(index="plants", body={"size": 1})
+    assert len(client.searches) == 2
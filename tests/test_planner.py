@@ -0,0 +1,123 @@
+# test_planner.py
+import copy
+from planner import SearchPlan
+
+class StubClient:
+    """
+    Answer searches with hits and aggregation values derived from the body, and record the calls.
+    """
+    def __init__(self, error=False):
+        self.error = error
+        self.searches = []
+        self.msearches = []
+
+    def respond(self, index, body):
+        hits = [{"_index": index, "_id": str(i), "_source": {"i": i}} for i in range(body.get("size", 10))]
+        response = {"took": 1, "hits": {"total": {"value": 100, "relation": "eq"}, "hits": hits}}
+        if "aggs" in body:
+            response["aggregations"] = {name: {"definition": definition} for name, definition in body["aggs"].items()}
+        return response
+
+    def search(self, index=None, body=None, **params):
+        self.searches.append((index, copy.deepcopy(body), params))
+        return self.respond(index, body)
+
+    def msearch(self, body=None, index=None):
+        self.msearches.append(copy.deepcopy(body))
+        if self.error:
+            return {"responses": [{"error": {"type": "search_phase_execution_exception"}} for _ in body[1::2]]}
+        return {"responses": [self.respond(header["index"], search) for header, search in zip(body[::2], body[1::2])]}
+
+QUERY = {"query": {"bool": {"filter": [{"terms": {"year": [2022]}}]}}}
+
+def test_bodies_differing_in_aggs_and_size_are_merged():
+    client = StubClient()
+    plan = SearchPlan(client)
+    first = dict(QUERY, size=0, aggs={"days": {"terms": {"field": "scan_date"}}})
+    second = dict(QUERY, size=5, aggs={"crops": {"terms": {"field": "crop_type"}}})
+    plan.add("plants", first)
+    plan.add("plants", second)
+    plan.execute()
+
+    assert len(client.msearches) == 1
+    header, body = client.msearches[0]
+    assert header == {"index": "plants"}
+    assert body["size"] == 5
+    assert body["aggs"] == {"days": first["aggs"]["days"], "crops": second["aggs"]["crops"]}
+
+def test_merged_response_round_trips_to_each_search():
+    client = StubClient()
+    plan = SearchPlan(client)
+    searches = [
+        dict(QUERY, size=0, aggs={"days": {"terms": {"field": "scan_date"}}}),
+        dict(QUERY, size=3, aggs={"crops": {"terms": {"field": "crop_type"}}}),
+        dict(QUERY)
+    ]
+    for body in searches:
+        plan.add("plants", body)
+    plan.execute()
+
+    for body in searches:
+        expected = client.respond("plants", body)
+        assert plan.search(index="plants", body=body) == expected
+    assert client.searches == []
+
+def test_aggregations_with_the_same_name_and_definition_are_sent_once():
+    client = StubClient()
+    plan = SearchPlan(client)
+    aggs = {"days": {"terms": {"field": "scan_date"}}}
+    plan.add("plants", dict(QUERY, size=0, aggs=aggs))
+    plan.add("plants", dict(QUERY, size=1, aggs=aggs))
+    plan.execute()
+
+    assert client.msearches[0][1]["aggs"] == aggs
+
+def test_aggregations_with_the_same_name_but_another_definition_are_renamed():
+    client = StubClient()
+    plan = SearchPlan(client)
+    first = dict(QUERY, size=0, aggs={"stats": {"stats": {"field": "roi_temp"}}})
+    second = dict(QUERY, size=0, aggs={"stats": {"stats": {"field": "mean_tgi"}}})
+    plan.add("plants", first)
+    plan.add("plants", second)
+    plan.execute()
+
+    merged = client.msearches[0][1]["aggs"]
+    assert merged == {"stats": first["aggs"]["stats"], "stats_1": second["aggs"]["stats"]}
+    assert plan.search(index="plants", body=first)["aggregations"] == {"stats": {"definition": first["aggs"]["stats"]}}
+    assert plan.search(index="plants", body=second)["aggregations"] == {"stats": {"definition": second["aggs"]["stats"]}}
+
+def test_searches_with_different_queries_or_indices_are_not_merged():
+    client = StubClient()
+    plan = SearchPlan(client)
+    plan.add("plants", dict(QUERY, size=0))
+    plan.add("plants", {"query": {"match_all": {}}, "size": 0})
+    plan.add("weather", dict(QUERY, size=0))
+    plan.execute()
+
+    lines = client.msearches[0]
+    assert len(lines) == 6
+    # Aggregation-only searches can use the shard request cache
+    assert all(header.get("request_cache") for header in lines[::2])
+
+def test_unplanned_searches_and_failed_searches_go_to_the_client():
+    client = StubClient(error=True)
+    plan = SearchPlan(client)
+    body = dict(QUERY, size=0)
+    plan.add("plants", body)
+    plan.execute()
+
+    plan.search(index="plants", body=body)
+    plan.search(index="plants", body=dict(QUERY, size=1))
+    plan.search(index="plants", body=body, scroll="1m")
+    assert [params for _, _, params in client.searches] == [{}, {}, {"scroll": "1m"}]
+
+def test_execute_only_sends_pending_searches():
+    client = StubClient()
+    plan = SearchPlan(client)
+    plan.add("plants", dict(QUERY, size=0))
+    plan.execute()
+    plan.execute()
+    plan.add("weather", dict(QUERY, size=0))
+    plan.execute()
+
+    assert [[header["index"] for header in lines[::2]] for lines in client.msearches] == [["plants"], ["weather"]]
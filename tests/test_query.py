@@ -0,0 +1,87 @@
+# test_query.py
+import datetime
+import pytest
+from dataclasses import FrozenInstanceError
+from query import QuerySpec
+from data import build_query
+
+def legacy_build_query(crop_type, from_date, to_date, sensor_type, year):
+    # build_query as it was before QuerySpec: the same clauses, in a bool.must
+    query = {"query": {"bool": {"must": []}}}
+    if crop_type:
+        query["query"]["bool"]["must"].append({"terms": {"crop_type": crop_type}})
+    date_range_query = {}
+    if from_date:
+        date_range_query["gte"] = from_date.strftime("%Y%m%dT%H%M%S.%f%z") + "-0700"
+    if to_date:
+        date_range_query["lte"] = to_date.strftime("%Y%m%dT%H%M%S.%f%z") + "-0700"
+    if from_date or to_date:
+        query["query"]["bool"]["must"].append({"range": {"scan_date": date_range_query}})
+    if sensor_type:
+        query["query"]["bool"]["must"].append({"terms": {"instrument": sensor_type}})
+    if year:
+        query["query"]["bool"]["must"].append({"terms": {"year": year}})
+    return query
+
+def sort_clauses(clauses):
+    return sorted(clauses, key=repr)
+
+FROM_DATE = datetime.datetime(2022, 4, 1)
+TO_DATE = datetime.datetime(2022, 6, 30, 23, 59, 59)
+
+@pytest.mark.parametrize("filters", [
+    ([], None, None, [], []),
+    (["sorghum"], None, None, [], []),
+    (["sorghum", "lettuce"], FROM_DATE, TO_DATE, ["flirIrCamera"], [2022]),
+    ([], FROM_DATE, None, [], [2020, 2022]),
+    ([], None, TO_DATE, ["scanner3DTop", "drone"], []),
+])
+def test_body_matches_legacy_build_query(filters):
+    legacy = legacy_build_query(*filters)
+    body = build_query(*filters).body(size=5)
+
+    # Filter clauses match the same documents as must clauses, without scoring
+    assert body["size"] == 5
+    assert sort_clauses(body["query"]["bool"]["filter"]) == sort_clauses(legacy["query"]["bool"]["must"])
+    assert set(body["query"]["bool"]) == {"filter"}
+
+def test_same_filters_give_identical_bodies_in_any_order():
+    first = QuerySpec().terms("year", [2022]).term("crop_type", "sorghum").range("plot", gte=1)
+    second = QuerySpec().range("plot", gte=1).term("crop_type", "sorghum").terms("year", [2022])
+    assert first == second
+    assert first.body() == second.body()
+    assert hash(first) == hash(second)
+
+def test_adding_a_clause_twice_keeps_one():
+    spec = QuerySpec().term("crop_type", "sorghum").term("crop_type", "sorghum")
+    assert spec.clauses() == [{"term": {"crop_type": "sorghum"}}]
+
+def test_methods_return_new_specs():
+    shared = QuerySpec().terms("year", [2022])
+    derived = shared.term("instrument", "drone").exists("roi_temp")
+
+    assert shared.clauses() == [{"terms": {"year": [2022]}}]
+    assert len(derived.clauses()) == 3
+    with pytest.raises(FrozenInstanceError):
+        shared.filters = ()
+
+def test_empty_values_and_bounds_add_nothing():
+    spec = QuerySpec()
+    assert spec.terms("year", []) is spec
+    assert spec.range("scan_date", gte=None, lte=None) is spec
+    assert spec.range("scan_date", gte=1, lte=None).clauses() == [{"range": {"scan_date": {"gte": 1}}}]
+
+def test_terms_are_replaced_and_read_back():
+    spec = QuerySpec().terms("year", [2020]).terms("crop_type", ["sorghum"])
+    replaced = spec.replace_terms("year", [2021, 2022])
+
+    assert replaced.values("year") == [2021, 2022]
+    assert replaced.values("crop_type") == ["sorghum"]
+    assert spec.without_terms("year").values("year") is None
+    assert replaced.replace_terms("year", []).values("year") is None
+
+def test_body_adds_aggs_and_extra_parameters():
+    aggs = {"days": {"terms": {"field": "scan_date"}}}
+    body = QuerySpec().body(aggs=aggs, track_total_hits=True)
+    assert body == {"query": {"bool": {"filter": []}}, "size": 0, "aggs": aggs, "track_total_hits": True}
+    assert "aggs" not in QuerySpec().body()
@@ -0,0 +1,71 @@
+# test_sketch.py
+import json
+import math
+import numpy as np
+import pytest
+from sketch import QuantileSketch
+from config import ROLLUP_SKETCH_ACCURACY
+
+QUANTILES = [0, 0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99, 1]
+
+def exact_quantile(values, q):
+    # The value of rank q * (n - 1), rounded down, which the sketch estimates
+    return sorted(values)[int(math.floor(q * (len(values) - 1)))]
+
+def assert_within_accuracy(sketch, values, accuracy):
+    for q in QUANTILES:
+        expected = exact_quantile(values, q)
+        assert abs(sketch.quantile(q) - expected) <= accuracy * abs(expected) + 1e-12, q
+
+@pytest.mark.parametrize("values", [
+    np.random.default_rng(1).lognormal(mean=0, sigma=2, size=5000),
+    np.random.default_rng(2).normal(loc=30, scale=4, size=5000),
+    np.random.default_rng(3).normal(loc=0, scale=1, size=5000),
+    np.random.default_rng(4).uniform(-50, 50, size=5000),
+])
+def test_quantiles_are_within_the_relative_accuracy(values):
+    sketch = QuantileSketch(ROLLUP_SKETCH_ACCURACY).add(values)
+    assert sketch.count == len(values)
+    assert_within_accuracy(sketch, values.tolist(), ROLLUP_SKETCH_ACCURACY)
+
+def test_zero_and_missing_values():
+    sketch = QuantileSketch(ROLLUP_SKETCH_ACCURACY).add([0.0, float("nan"), 0.0, 2.0, None])
+    assert sketch.count == 3
+    assert sketch.quantile(0) == 0.0
+    assert abs(sketch.quantile(1) - 2.0) <= 2.0 * ROLLUP_SKETCH_ACCURACY
+
+def test_single_value_and_empty_sketch():
+    assert QuantileSketch().quantile(0.5) is None
+    assert abs(QuantileSketch().add(7.5).quantile(0.5) - 7.5) <= 7.5 * 0.01
+
+def test_merged_sketches_equal_one_sketch_of_all_values():
+    rng = np.random.default_rng(5)
+    parts = [rng.normal(loc=day, scale=3, size=1000) for day in range(10)]
+    merged = QuantileSketch(ROLLUP_SKETCH_ACCURACY)
+    for part in parts:
+        merged.merge(QuantileSketch(ROLLUP_SKETCH_ACCURACY).add(part))
+    whole = QuantileSketch(ROLLUP_SKETCH_ACCURACY).add(np.concatenate(parts))
+
+    assert merged.to_dict() == whole.to_dict()
+    assert_within_accuracy(merged, np.concatenate(parts).tolist(), ROLLUP_SKETCH_ACCURACY)
+
+def test_sketches_with_another_accuracy_do_not_merge():
+    with pytest.raises(ValueError):
+        QuantileSketch(0.01).merge(QuantileSketch(0.02))
+
+def test_dict_round_trip_through_json():
+    sketch = QuantileSketch(ROLLUP_SKETCH_ACCURACY).add(np.random.default_rng(6).normal(size=1000))
+    restored = QuantileSketch.from_dict(json.loads(json.dumps(sketch.to_dict())))
+
+    assert restored.to_dict() == sketch.to_dict()
+    assert [restored.quantile(q) for q in QUANTILES] == [sketch.quantile(q) for q in QUANTILES]
+
+def test_bins_are_bounded():
+    values = np.random.default_rng(7).lognormal(mean=0, sigma=10, size=5000)
+    sketch = QuantileSketch(ROLLUP_SKETCH_ACCURACY, max_bins=64).add(values)
+
+    assert len(sketch.positive) <= 64
+    assert sketch.count == len(values)
+    # Only the smallest values lose accuracy when bins are folded
+    expected = exact_quantile(values.tolist(), 0.99)
+    assert abs(sketch.quantile(0.99) - expected) <= ROLLUP_SKETCH_ACCURACY * expected
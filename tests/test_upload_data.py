@@ -0,0 +1,167 @@
+# test_upload_data.py
+import os
+import sys
+import json
+import pytest
+
+SEARCH_CONFIGURATION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "search_configuration")
+# The upload scripts import search_configuration/partitions.py by the same name as the dashboard's
+# app/partitions.py: import them with their own and leave the dashboard's in place for the other tests
+dashboard_partitions = sys.modules.pop("partitions", None)
+sys.path.insert(0, SEARCH_CONFIGURATION_DIR)
+try:
+    import upload_data
+finally:
+    sys.path.remove(SEARCH_CONFIGURATION_DIR)
+    sys.modules.pop("partitions", None)
+    if dashboard_partitions is not None:
+        sys.modules["partitions"] = dashboard_partitions
+from upload_data import iter_json_array, changed_actions, upload
+
+DOCUMENTS = [
+    {"plant_name": "a", "traits": {"roi_temp": [30.5, 31.0], "nested": [[1, 2], {"k": []}]}},
+    {"plant_name": "quote \" and backslash \\ and ] } [ {", "file_path": "C:\\scans\\[1].tar"},
+    {"plant_name": "unicode \u00e9\u4e2d\U0001f331", "empty": {}, "list": []},
+    [1, [2, [3]]],
+    "a string with , and ]",
+    12.5e-3,
+    None,
+    True,
+]
+
+@pytest.mark.parametrize("read_size", [1, 2, 7, 64, 1024 * 1024])
+@pytest.mark.parametrize("indent", [None, 4])
+def test_iter_json_array_yields_every_element(tmp_path, read_size, indent):
+    path = tmp_path / "documents.json"
+    path.write_text("\n  " + json.dumps(DOCUMENTS, indent=indent) + "\n")
+    assert list(iter_json_array(str(path), read_size=read_size)) == DOCUMENTS
+
+@pytest.mark.parametrize("read_size", [1, 5, 1024])
+def test_iter_json_array_with_escaped_unicode(tmp_path, read_size):
+    path = tmp_path / "documents.json"
+    path.write_text(json.dumps(DOCUMENTS, ensure_ascii=True))
+    assert list(iter_json_array(str(path), read_size=read_size)) == DOCUMENTS
+
+def test_iter_json_array_of_an_empty_array(tmp_path):
+    path = tmp_path / "documents.json"
+    path.write_text(" [ \n ] ")
+    assert list(iter_json_array(str(path), read_size=1)) == []
+
+@pytest.mark.parametrize("content", ['{"a": 1}', '[{"a": 1}, {"b":', '[{"a": 1}', '[{"a": 1}, nope]'])
+def test_iter_json_array_rejects_invalid_files(tmp_path, content):
+    path = tmp_path / "documents.json"
+    path.write_text(content)
+    with pytest.raises(ValueError):
+        list(iter_json_array(str(path), read_size=3))
+
+class StubIndices:
+    def __init__(self, partitions):
+        self.partitions = partitions
+
+    def get_alias(self, name=None):
+        return {index: {"aliases": {name: {}}} for index in self.partitions}
+
+class StubClient:
+    """
+    Hold the stored copies as {(index, _id): content_hash} and answer ids searches from them.
+    """
+    def __init__(self, stored):
+        self.stored = stored
+        self.indices = StubIndices(sorted({index for index, _ in stored}))
+        self.searches = []
+
+    def search(self, index=None, body=None):
+        self.searches.append(body)
+        ids = set(body["query"]["ids"]["values"])
+        hits = [
+            {"_index": stored_index, "_id": _id, "_source": {"content_hash": content_hash}}
+            for (stored_index, _id), content_hash in sorted(self.stored.items()) if _id in ids
+        ]
+        return {"hits": {"hits": hits[:body["size"]]}}
+
+class StubRollup:
+    def __init__(self):
+        self.documents = []
+
+    def add_documents(self, documents):
+        self.documents.extend(documents)
+
+def action(_id, index="p-y2022-s14", content_hash="h1"):
+    return {"_index": index, "_id": _id, "_source": {"plant_name": _id, "content_hash": content_hash}}
+
+def classify(client, actions, **options):
+    rollup, counts = StubRollup(), {"new": 0, "changed": 0, "unchanged": 0}
+    sent = list(changed_actions(client, actions, rollup, counts, **options))
+    return sent, rollup, counts
+
+def test_changed_actions_classifies_documents():
+    client = StubClient({
+        ("p-y2022-s14", "changed"): "h0",
+        ("p-y2022-s14", "unchanged"): "h1",
+        ("p-y2021-s12", "moved"): "h1",
+    })
+    actions = [action("new"), action("changed"), action("unchanged"), action("moved")]
+    sent, rollup, counts = classify(client, actions)
+
+    assert counts == {"new": 1, "changed": 2, "unchanged": 1}
+    assert sent == [
+        action("new"), action("changed"), action("moved"),
+        {"_op_type": "delete", "_index": "p-y2021-s12", "_id": "moved"}
+    ]
+    # Changed documents are already counted in the rollup
+    assert rollup.documents == [action("new")["_source"]]
+
+def test_changed_actions_looks_up_each_batch_with_one_ids_search(monkeypatch):
+    monkeypatch.setattr(upload_data, "EXISTING_BATCH_SIZE", 2)
+    client = StubClient({("p-y2022-s14", "a"): "h1", ("p-y2021-s12", "a"): "h1"})
+    classify(client, [action("a"), action("b"), action("c")])
+
+    assert [search["query"]["ids"]["values"] for search in client.searches] == [["a", "b"], ["c"]]
+    assert [search["size"] for search in client.searches] == [4, 2]
+    assert all(search["_source"] == ["content_hash"] for search in client.searches)
+
+def test_changed_actions_counts_a_repeated_id_once(monkeypatch):
+    monkeypatch.setattr(upload_data, "EXISTING_BATCH_SIZE", 2)
+    client = StubClient({("p-y2022-s14", "other"): "h1"})
+    actions = [action("a"), action("a", content_hash="h2"), action("b"), action("a", content_hash="h3")]
+    sent, rollup, counts = classify(client, actions)
+
+    assert counts == {"new": 2, "changed": 2, "unchanged": 0}
+    assert [a["_source"]["content_hash"] for a in sent if a["_id"] == "a"] == ["h1", "h2", "h3"]
+    assert [document["plant_name"] for document in rollup.documents] == ["a", "b"]
+    # _ids already sent in this load are not looked up again
+    assert [search["query"]["ids"]["values"] for search in client.searches] == [["a"], ["b"]]
+
+def test_changed_actions_without_lookups_sends_everything():
+    client = StubClient({("p-y2022-s14", "a"): "h1"})
+    sent, rollup, counts = classify(client, [action("a"), action("b")], check_existing=False)
+
+    assert counts == {"new": 2, "changed": 0, "unchanged": 0}
+    assert len(sent) == 2 and len(rollup.documents) == 2
+    assert client.searches == []
+
+def fake_parallel_bulk(results):
+    def parallel_bulk(client, actions, **options):
+        assert options["raise_on_error"] is False
+        for item, (ok, result) in zip(actions, results):
+            operation = item.get("_op_type", "index")
+            yield ok, {operation: dict(result, _id=item["_id"])}
+    return parallel_bulk
+
+def test_upload_counts_indexed_created_and_failed_documents(monkeypatch):
+    monkeypatch.setattr(upload_data.helpers, "parallel_bulk", fake_parallel_bulk([
+        (True, {"status": 201, "result": "created"}),
+        (True, {"status": 200, "result": "updated"}),
+        (False, {"status": 400, "error": {"type": "mapper_parsing_exception"}}),
+        (True, {"status": 200, "result": "deleted"}),
+        (False, {"status": 404, "result": "not_found"}),
+        (False, {"status": 500, "error": {"type": "internal"}}),
+    ]))
+    actions = [
+        action("a"), action("b"), action("c"),
+        {"_op_type": "delete", "_index": "p-y2021-s12", "_id": "b"},
+        {"_op_type": "delete", "_index": "p-y2021-s12", "_id": "d"},
+        {"_op_type": "delete", "_index": "p-y2021-s12", "_id": "e"},
+    ]
+    # Deletes of moved copies are not counted unless they fail for another reason than a missing copy
+    assert upload(None, iter(actions), workers=1) == (2, 2, 1)